@@ -0,0 +1,251 @@
+"""a local JSON API so drinks can be ordered by other programs, such as a till
+
+requests and replies are one JSON object per line:
+    {"type": "order", "drink": "Coffee"}
+        -> {"ok": true, "machine": 0, "order_id": 3, "eta": 21.5}
+    {"type": "order", "drink": "Coffee", "machine": 1}
+        orders on a chosen machine rather than the one with the shortest queue
+    {"type": "status"}
+        -> {"ok": true, "machines": [{"machine": 0, "queue": 1, ...}]}
+    {"type": "subscribe"}
+        -> {"ok": true}, then a line for every order, step and finished drink
+failed requests get {"ok": false, "error": "..."}. an "id" in a request is
+copied into its reply, replies on one connection come back in request order
+"""
+
+import asyncio
+import json
+import threading
+from collections import deque
+from typing import Callable
+
+import pygame
+
+# posted to wake the main loop when requests come in while it is idle
+API_EVENT = pygame.event.custom_type()
+
+
+class OrderServer:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 8765,
+        unix_path: str | None = None,
+        max_requests_per_frame: int = 250,
+        max_pending: int = 1000,
+        max_subscriber_buffer: int = 1 << 20,
+    ) -> None:
+        """serves the API with asyncio on a background thread
+
+        orders and status requests need the machines, which belong to the
+        main loop, so they are put on a deque and answered there in a batch
+        each frame. the replies are handed back to the server in one go,
+        so the main loop never waits on a socket
+
+        Args:
+            host: the address to listen on, keep it local
+            port: the port to listen on, 0 for any free port
+            unix_path: listen on this unix socket instead of tcp
+            max_requests_per_frame: the most requests answered in one frame,
+              any more wait for the next so a flood can't hold up drawing
+            max_pending: the most requests one connection can have waiting
+              for a reply before it stops being read
+            max_subscriber_buffer: the most bytes of events waiting to be sent
+              to a subscriber before it is disconnected for being too slow
+        """
+        self.host = host
+        self.port = port
+        self.unix_path = unix_path
+        self.max_requests_per_frame = max_requests_per_frame
+        self.max_pending = max_pending
+        self.max_subscriber_buffer = max_subscriber_buffer
+
+        # appended to by the server thread and taken from by the main loop,
+        # deque appends and pops are atomic so no lock is needed
+        self.requests = deque()
+        self.subscribers = set()
+        self.handled = 0
+        self._events = []
+        self._wake_pending = False
+
+        self.loop = None
+        self._server = None
+        self._thread = None
+        self._started = threading.Event()
+        self._start_error = None
+
+    @property
+    def address(self) -> str:
+        if self.unix_path is not None:
+            return self.unix_path
+        return f"{self.host}:{self.port}"
+
+    def start(self) -> None:
+        """starts listening, returning once connections can be made
+
+        Raises:
+            OSError: if the address can't be listened on
+        """
+        self._thread = threading.Thread(target=self._run, name="order api", daemon=True)
+        self._thread.start()
+        self._started.wait()
+        if self._start_error is not None:
+            raise self._start_error
+
+    def close(self) -> None:
+        """disconnects everyone and stops the server thread"""
+        if self.loop is not None and self._thread.is_alive():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join()
+
+    def handle_requests(self, handler: Callable[[dict], dict]) -> int:
+        """answers the requests that have come in, called from the main loop
+
+        also sends out the events published since the last call
+
+        Args:
+            handler: gets the reply for an order or status request
+
+        Returns:
+            how many requests were answered
+        """
+        self._wake_pending = False
+        replies = []
+        for _ in range(min(len(self.requests), self.max_requests_per_frame)):
+            request, future = self.requests.popleft()
+            replies.append((future, handler(request)))
+        # the rest are answered next frame
+        if self.requests:
+            self._wake()
+
+        if replies or self._events:
+            events = self._events
+            self._events = []
+            self.loop.call_soon_threadsafe(self._send, replies, events)
+        self.handled += len(replies)
+        return len(replies)
+
+    def publish(self, event: dict) -> None:
+        """queues an event to send to every subscriber, called from the main loop"""
+        if self.subscribers:
+            self._events.append(event)
+
+    def _wake(self) -> None:
+        # only one wake event is waiting at a time, the main loop clears
+        # the flag before taking requests so none are missed
+        if not self._wake_pending:
+            self._wake_pending = True
+            if not pygame.event.post(pygame.event.Event(API_EVENT)):
+                self._wake_pending = False
+
+    def _run(self) -> None:
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            if self.unix_path is not None:
+                self._server = self.loop.run_until_complete(
+                    asyncio.start_unix_server(self._handle_connection, self.unix_path)
+                )
+            else:
+                self._server = self.loop.run_until_complete(
+                    asyncio.start_server(self._handle_connection, self.host, self.port)
+                )
+                self.port = self._server.sockets[0].getsockname()[1]
+        except OSError as error:
+            self._start_error = error
+            self._started.set()
+            self.loop.close()
+            return
+
+        self._started.set()
+        self.loop.run_forever()
+
+        self._server.close()
+        for writer in self.subscribers:
+            writer.close()
+        tasks = asyncio.all_tasks(self.loop)
+        for task in tasks:
+            task.cancel()
+        self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self.loop.close()
+
+    async def _handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        # requests are read while earlier ones wait for the main loop,
+        # so one connection can have many requests answered each frame
+        replies = asyncio.Queue(self.max_pending)
+        writing = asyncio.create_task(self._write_replies(replies, writer))
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                await replies.put(self._answer(line, writer))
+        except (ConnectionError, ValueError):
+            # ValueError is a line longer than the reader's limit
+            pass
+        finally:
+            await replies.put(None)
+            try:
+                await writing
+            except ConnectionError:
+                pass
+            self.subscribers.discard(writer)
+            writer.close()
+
+    def _answer(
+        self, line: bytes, writer: asyncio.StreamWriter
+    ) -> tuple[object, asyncio.Future]:
+        future = self.loop.create_future()
+        try:
+            request = json.loads(line)
+        except ValueError:
+            request = None
+        if not isinstance(request, dict):
+            future.set_result({"ok": False, "error": "requests must be a JSON object"})
+            return None, future
+
+        request_type = request.get("type")
+        if request_type in ("order", "status"):
+            self.requests.append((request, future))
+            self._wake()
+        elif request_type == "subscribe":
+            self.subscribers.add(writer)
+            future.set_result({"ok": True})
+        else:
+            future.set_result({"ok": False, "error": f"no request type {request_type}"})
+        return request.get("id"), future
+
+    async def _write_replies(
+        self, replies: asyncio.Queue, writer: asyncio.StreamWriter
+    ) -> None:
+        while True:
+            item = await replies.get()
+            if item is None:
+                break
+            request_id, future = item
+            reply = await future
+            if request_id is not None:
+                reply["id"] = request_id
+            writer.write(json.dumps(reply).encode("utf-8") + b"\n")
+            # written in batches, only waiting for the socket once caught up
+            if replies.empty():
+                await writer.drain()
+
+    def _send(self, replies: list[tuple[asyncio.Future, dict]], events: list[dict]):
+        for future, reply in replies:
+            if not future.done():
+                future.set_result(reply)
+
+        if not events:
+            return
+        lines = b"".join(json.dumps(event).encode("utf-8") + b"\n" for event in events)
+        for writer in list(self.subscribers):
+            # a subscriber that isn't reading is let go of rather
+            # than its events being kept forever
+            if writer.transport.get_write_buffer_size() > self.max_subscriber_buffer:
+                self.subscribers.discard(writer)
+                writer.close()
+            else:
+                writer.write(lines)
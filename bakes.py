@@ -0,0 +1,504 @@
+"""sprite sheets of every frame of a brew, baked once per window size
+
+a sheet holds the frames of the window liquid and step label of one
+recipe, drawn frame_rate times a second. frames that come out the same are
+only kept once. sheets are raw pixels that are memory mapped from disk,
+so playing a frame is one blit from the mapped file for each part
+"""
+
+import hashlib
+import importlib.util
+import json
+import mmap
+import multiprocessing
+import os
+import re
+import struct
+import sys
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from math import ceil, inf
+from time import perf_counter
+
+import pygame
+
+from caches import LRUCache
+
+MAGIC = b"DRINKSPR"
+HEADER_LENGTH = struct.Struct("<I")
+# the pixel data starts on a multiple of this after the header
+ALIGNMENT = 64
+# bump whenever what Utilities.draw_brew_frame draws changes,
+# so sheets baked by older versions are baked again
+RENDER_VERSION = 2
+# the byte order of a 32 bit window surface on little endian machines,
+# so the frames are copied rather than converted when drawn
+PIXEL_FORMAT = "BGRA"
+
+SPRITE_CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+    "hot-drinks-machine",
+    "sprites",
+)
+
+
+def get_render_hash(utilities, recipe_name: str) -> str:
+    """hashes everything a recipe's sheet is drawn from besides the window size
+
+    that is the recipe's steps, which hold its colours, and every constant
+    on utilities, which hold the font sizes and the colours of the machine,
+    so editing recipes.json or a constant bakes the sheets again. the machine
+    count is left out as it is part of the sheet's name already
+
+    Args:
+        utilities: the Utilities the sheet is drawn with
+        recipe_name: the recipe being drawn
+
+    Returns:
+        the hash as hex
+    """
+    constants = sorted(
+        (name, value)
+        for name, value in vars(utilities).items()
+        if name.isupper() and name != "MACHINE_COUNT"
+    )
+    drawn_from = repr((utilities.recipe_book.get(recipe_name).steps, constants))
+    return hashlib.sha1(drawn_from.encode("utf-8")).hexdigest()[:16]
+
+
+def get_sheet_path(
+    cache_dir: str,
+    recipe_name: str,
+    render_hash: str,
+    window_size: tuple[int, int],
+    machine_count: int,
+) -> str:
+    name = re.sub(r"[^a-z0-9]+", "-", recipe_name.lower()).strip("-")
+    width, height = window_size
+    return os.path.join(
+        cache_dir,
+        f"{name}-{width}x{height}-{machine_count}"
+        f"-v{RENDER_VERSION}-{render_hash}.sheet",
+    )
+
+
+def load_app(app_path: str):
+    """imports the app in a worker process, which has a space in its file name"""
+    module = sys.modules.get("tech_test")
+    if module is None:
+        sys.path.insert(0, os.path.dirname(app_path))
+        spec = importlib.util.spec_from_file_location("tech_test", app_path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules["tech_test"] = module
+        spec.loader.exec_module(module)
+    return module
+
+
+def bake_sheet(
+    app_path: str,
+    path: str,
+    recipe_name: str,
+    render_hash: str,
+    window_size: tuple[int, int],
+    machine_count: int,
+    background_colour: tuple[int, int, int],
+    font_path: str | None,
+    frame_rate: int,
+) -> tuple[int, int]:
+    """draws every frame of a recipe and saves them as a sheet
+
+    run in a worker process. the sheet is written to a temporary file and
+    moved into place, so a sheet is never read half written
+
+    Args:
+        app_path: the app, which is drawn with
+        path: where to save the sheet
+        recipe_name: the recipe to bake
+        render_hash: what the sheet was asked for with, from get_render_hash
+        window_size: the size of the window the sheet is for
+        machine_count: how many machines the window is split between
+        background_colour: colour behind the machine
+        font_path: the font file the text is drawn with
+        frame_rate: frames baked for each second of the brew
+
+    Returns:
+        a tuple of how many frames there are and how many are different
+
+    Raises:
+        ValueError: if the app draws differently to when the bake was asked for
+    """
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    app = load_app(app_path)
+    pygame.font.init()
+
+    recipe_book = app.RecipeBook.load(app.RECIPES_PATH)
+    recipe = recipe_book.get(recipe_name)
+    utilities = app.Utilities(recipe_book, font_path)
+    utilities.MACHINE_COUNT = machine_count
+    if get_render_hash(utilities, recipe_name) != render_hash:
+        raise ValueError("the app has changed since the bake was asked for")
+    static_layer = utilities.build_static_layer(window_size, background_colour, [])
+    renderer = app.SoftwareRenderer(static_layer.copy())
+    renderer.set_static_layer(static_layer)
+    part_rects = utilities.get_layout(window_size).machines[0].baked_rects
+
+    frame_count = max(ceil(recipe.duration * frame_rate), 1)
+    # each part's frames are a list of the different ones
+    # and the index of which one every frame uses
+    part_frames = [{} for _ in part_rects]
+    part_indexes = [[] for _ in part_rects]
+    for frame in range(frame_count):
+        for rect in part_rects:
+            renderer.restore(rect)
+        step_index, step_amount = recipe.get_step(frame / frame_rate)
+        if step_index < len(recipe.steps):
+            utilities.draw_brew_frame(renderer, recipe, step_index, step_amount)
+
+        for rect, frames, indexes in zip(part_rects, part_frames, part_indexes):
+            pixels = pygame.image.tobytes(
+                renderer.surface.subsurface(rect), PIXEL_FORMAT
+            )
+            indexes.append(frames.setdefault(pixels, len(frames)))
+
+    parts = []
+    offset = 0
+    for rect, frames in zip(part_rects, part_frames):
+        parts.append(
+            {
+                "size": list(rect.size),
+                "unique_frames": len(frames),
+                "index_offset": offset,
+                "pixel_offset": offset + frame_count * 4,
+            }
+        )
+        offset += ceil((frame_count * 4 + len(frames) * rect.w * rect.h * 4) / 16) * 16
+
+    header = json.dumps(
+        {
+            "recipe": recipe_name,
+            "window_size": list(window_size),
+            "machine_count": machine_count,
+            "render_version": RENDER_VERSION,
+            "render_hash": render_hash,
+            "font_path": font_path,
+            "frame_rate": frame_rate,
+            "frame_count": frame_count,
+            "parts": parts,
+        }
+    ).encode("utf-8")
+    header = MAGIC + HEADER_LENGTH.pack(len(header)) + header
+    header += bytes(-len(header) % ALIGNMENT)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "wb") as sheet_file:
+        sheet_file.write(header)
+        for part, frames, indexes in zip(parts, part_frames, part_indexes):
+            sheet_file.seek(len(header) + part["index_offset"])
+            sheet_file.write(struct.pack(f"<{frame_count}I", *indexes))
+            sheet_file.write(b"".join(frames))
+        sheet_file.truncate(len(header) + offset)
+    os.replace(temporary_path, path)
+
+    return frame_count, sum(len(frames) for frames in part_frames)
+
+
+class SpriteSheet:
+    def __init__(self, path: str) -> None:
+        """a baked sheet, read through a memory map
+
+        Args:
+            path: the sheet file
+
+        Raises:
+            ValueError: if the file is not a sheet or is from another render version
+        """
+        with open(path, "rb") as sheet_file:
+            if sheet_file.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a sprite sheet")
+            (header_length,) = HEADER_LENGTH.unpack(sheet_file.read(HEADER_LENGTH.size))
+            header = json.loads(sheet_file.read(header_length).decode("utf-8"))
+            self._map = mmap.mmap(sheet_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if header["render_version"] != RENDER_VERSION:
+            raise ValueError(f"{path} was baked by another version")
+
+        self.path = path
+        self.render_hash = header.get("render_hash")
+        self.font_path = header["font_path"]
+        self.frame_rate = header["frame_rate"]
+        self.frame_count = header["frame_count"]
+        data_start = len(MAGIC) + HEADER_LENGTH.size + header_length
+        data_start += -data_start % ALIGNMENT
+
+        view = memoryview(self._map)
+        self.parts = []
+        for part in header["parts"]:
+            index_start = data_start + part["index_offset"]
+            self.parts.append(
+                {
+                    "size": tuple(part["size"]),
+                    "indexes": view[
+                        index_start : index_start + self.frame_count * 4
+                    ].cast("I"),
+                    "pixel_start": data_start + part["pixel_offset"],
+                }
+            )
+        self._view = view
+        # surfaces over the mapped pixels, made the first time each is drawn
+        self._surfaces = {}
+
+    def get_frame(self, part_index: int, frame: int) -> pygame.Surface:
+        """gets one part of a frame as a surface over the mapped file"""
+        part = self.parts[part_index]
+        unique_index = part["indexes"][frame]
+        key = (part_index, unique_index)
+        surface = self._surfaces.get(key)
+        if surface is None:
+            width, height = part["size"]
+            start = part["pixel_start"] + unique_index * width * height * 4
+            surface = pygame.image.frombuffer(
+                self._view[start : start + width * height * 4],
+                (width, height),
+                PIXEL_FORMAT,
+            )
+            # every pixel is opaque, so it is copied rather than blended
+            surface.set_alpha(None)
+            self._surfaces[key] = surface
+        return surface
+
+    def draw(self, renderer, part_rects: list[pygame.Rect], elapsed: float) -> None:
+        """draws the frame for a time into the brew
+
+        Args:
+            renderer: one of the backends from renderers.py to draw with
+            part_rects: where to draw the window and label,
+              the baked_rects of the machine's layout
+            elapsed: seconds into the brew
+        """
+        frame = min(max(round(elapsed * self.frame_rate), 0), self.frame_count - 1)
+        for part_index, rect in enumerate(part_rects):
+            renderer.blit(self.get_frame(part_index, frame), rect.topleft)
+
+
+class SpriteBaker:
+    def __init__(
+        self,
+        app_path: str,
+        background_colour: tuple[int, int, int],
+        font_path: str | None,
+        cache_dir: str = SPRITE_CACHE_DIR,
+        frame_rate: int = 60,
+        workers: int = 2,
+        max_sheets: int = 16,
+        settle_seconds: float = 0.5,
+        max_cache_bytes: int = 1 << 30,
+    ) -> None:
+        """bakes sheets in worker processes and hands them out once they are ready
+
+        a sheet is tens of megabytes, so while the window is being resized
+        nothing is baked until the size has stayed the same for settle_seconds,
+        bakes not started for sizes the window has left are cancelled,
+        and the least recently used sheets are deleted to keep the cache
+        directory under max_cache_bytes
+
+        Args:
+            app_path: the app, which the workers draw with
+            background_colour: colour behind the machines
+            font_path: the font file the text is drawn with
+            cache_dir: where sheets are kept between runs
+            frame_rate: frames baked for each second of a brew
+            workers: how many processes bake at once
+            max_sheets: the most sheets kept open, for when the window is resized a lot
+            settle_seconds: how long the window size has to stay the same
+              before its sheets are baked
+            max_cache_bytes: the most bytes of sheets kept in cache_dir
+        """
+        self.app_path = app_path
+        self.background_colour = background_colour
+        self.font_path = font_path
+        self.cache_dir = cache_dir
+        self.frame_rate = frame_rate
+        self.workers = workers
+        self.settle_seconds = settle_seconds
+        self.max_cache_bytes = max_cache_bytes
+
+        self.sheets = LRUCache(max_sheets)
+        self.pending = {}
+        self.failed = set()
+        self._pool = None
+        # the window size and machine count sheets were last asked for,
+        # when that changed and the bake waiting for it to settle
+        self._size = None
+        self._size_changed_at = -inf
+        self._waiting_bake = None
+        # the latest render hash of each recipe asked for
+        self._render_hashes = {}
+
+    @property
+    def settled(self) -> bool:
+        """if the window has stayed the same size long enough to bake for it"""
+        return perf_counter() - self._size_changed_at >= self.settle_seconds
+
+    def get_sheet(
+        self,
+        recipe_name: str,
+        render_hash: str,
+        window_size: tuple[int, int],
+        machine_count: int,
+    ) -> SpriteSheet | None:
+        """gets the sheet for a recipe, starting to bake it if there isn't one
+
+        Args:
+            recipe_name: the recipe being drawn
+            render_hash: what it is drawn from, from get_render_hash
+            window_size: the size of the window it is drawn in
+            machine_count: how many machines the window is split between
+
+        Returns:
+            the sheet, None until it has been baked
+        """
+        key = (recipe_name, render_hash, tuple(window_size), machine_count)
+        sheet = self.sheets.get(key)
+        if sheet is not None or key in self.failed:
+            return sheet
+
+        self._render_hashes[recipe_name] = render_hash
+        self._set_size(window_size, machine_count)
+        if self._waiting_bake is not None and self.settled:
+            render_hashes = self._waiting_bake
+            self._waiting_bake = None
+            self.bake(render_hashes, window_size, machine_count)
+
+        path = get_sheet_path(self.cache_dir, *key)
+        future = self.pending.get(key)
+        baked = False
+        if future is None:
+            sheet = self._open(path, render_hash)
+            if sheet is None and self.settled:
+                self.pending[key] = self._submit(path, key)
+        elif future.done():
+            del self.pending[key]
+            if future.exception() is not None:
+                print(f"couldn't bake {recipe_name}: {future.exception()}")
+                self.failed.add(key)
+                return None
+            sheet = self._open(path, render_hash)
+            # rather than baking it again every frame
+            if sheet is None:
+                print(f"couldn't open the sheet baked for {recipe_name}")
+                self.failed.add(key)
+            baked = True
+
+        if sheet is not None:
+            self.sheets.put(key, sheet)
+        if baked:
+            self._evict()
+        return sheet
+
+    def bake(
+        self,
+        render_hashes: dict[str, str],
+        window_size: tuple[int, int],
+        machine_count: int,
+    ) -> None:
+        """starts baking recipes for a window size before they are needed
+
+        they start once the size has settled, if it hasn't yet they are
+        started by the first get_sheet after it has
+
+        Args:
+            render_hashes: the hash from get_render_hash of each recipe, by name
+            window_size: the size of the window they are drawn in
+            machine_count: how many machines the window is split between
+        """
+        self._set_size(window_size, machine_count)
+        if not self.settled:
+            self._waiting_bake = render_hashes
+            return
+        for recipe_name, render_hash in render_hashes.items():
+            self.get_sheet(recipe_name, render_hash, window_size, machine_count)
+
+    def wait(self) -> None:
+        """waits for every bake that has been started to finish"""
+        wait(list(self.pending.values()))
+
+    def close(self) -> None:
+        """stops the workers, dropping any bakes not started"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _set_size(self, window_size: tuple[int, int], machine_count: int) -> None:
+        size = (tuple(window_size), machine_count)
+        if size == self._size:
+            return
+        # the first size is baked for straight away
+        if self._size is not None:
+            self._size_changed_at = perf_counter()
+        self._size = size
+        self._waiting_bake = None
+        # bakes already running are left to finish, as they can't be stopped
+        for key, future in list(self.pending.items()):
+            if key[2:] != size and future.cancel():
+                del self.pending[key]
+
+    def _open(self, path: str, render_hash: str) -> SpriteSheet | None:
+        try:
+            sheet = SpriteSheet(path)
+        except (OSError, ValueError):
+            return None
+        # a sheet drawn from anything else is baked again
+        if sheet.font_path != self.font_path or sheet.render_hash != render_hash:
+            return None
+        # its modified time is when it was last used, for _evict
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return sheet
+
+    def _evict(self) -> None:
+        """deletes the least recently used sheets until the cache directory
+        is under max_cache_bytes, sheets still mapped stay readable until closed"""
+        try:
+            entries = [
+                (entry.stat().st_mtime, entry.stat().st_size, entry.path)
+                for entry in os.scandir(self.cache_dir)
+                if entry.name.endswith(".sheet")
+            ]
+        except OSError:
+            return
+        total = sum(size for _, size, _ in entries)
+        # the window's own sheets are kept, even those not opened yet
+        in_use = {
+            get_sheet_path(self.cache_dir, recipe_name, render_hash, *self._size)
+            for recipe_name, render_hash in self._render_hashes.items()
+        }
+        for _, size, path in sorted(entries):
+            if total <= self.max_cache_bytes:
+                break
+            if path in in_use:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def _submit(self, path: str, key: tuple) -> Future:
+        if self._pool is None:
+            # spawned rather than forked so the workers don't share the window
+            self._pool = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        recipe_name, render_hash, window_size, machine_count = key
+        return self._pool.submit(
+            bake_sheet,
+            self.app_path,
+            path,
+            recipe_name,
+            render_hash,
+            window_size,
+            machine_count,
+            self.background_colour,
+            self.font_path,
+            self.frame_rate,
+        )
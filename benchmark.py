@@ -0,0 +1,514 @@
+"""benchmarks for the hot drinks machine
+
+run with: python benchmark.py <benchmark> [options]
+all of them use the dummy video driver so no window is opened,
+set SDL_VIDEODRIVER to time drawing to a real window
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+from time import perf_counter, time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import pygame
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tech test.py")
+
+
+def load_app():
+    """imports the app, which has a space in its file name so can't be imported
+
+    Returns:
+        the app as a module
+    """
+    sys.path.insert(0, os.path.dirname(APP_PATH))
+    spec = importlib.util.spec_from_file_location("tech_test", APP_PATH)
+    app = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(app)
+    return app
+
+
+def time_calls(function, arguments: list) -> float:
+    """times calling a function once for each argument
+
+    Returns:
+        the average seconds per call
+    """
+    start = perf_counter()
+    for argument in arguments:
+        function(argument)
+    return (perf_counter() - start) / len(arguments)
+
+
+def legacy_get_drink_button_pressed(utilities, relative_mouse_position) -> int:
+    """the original hit test, which walks the grid one button pitch at a time"""
+    click_location = [
+        relative_mouse_position[0] - utilities.HORIZONTAL_OFFSET,
+        relative_mouse_position[1] - utilities.VERTICAL_OFFSET,
+    ]
+
+    button_total_width = utilities.HORIZONTAL_BUTTON_SPACING + utilities.BUTTON_WIDTH
+    horizontal_index = -1
+    while click_location[0] > 0:
+        if (
+            click_location[0] > utilities.BUTTON_WIDTH
+            and click_location[0] < button_total_width
+        ):
+            horizontal_index = -1
+        else:
+            horizontal_index += 1
+        click_location[0] -= button_total_width
+
+    button_total_height = utilities.VERTICAL_BUTTON_SPACING + utilities.BUTTON_HEIGHT
+    vertical_index = -1
+    while click_location[1] > 0:
+        if (
+            click_location[1] > utilities.BUTTON_HEIGHT
+            and click_location[1] < button_total_height
+        ):
+            vertical_index = -1
+        else:
+            vertical_index += 1
+        click_location[1] -= button_total_height
+
+    if vertical_index == -1 or horizontal_index == -1:
+        return -1
+
+    button_index = utilities.BUTTONS_PER_ROW * vertical_index + horizontal_index
+    if (
+        button_index >= utilities.BUTTONS_PER_ROW * utilities.BUTTON_ROWS
+        or horizontal_index >= utilities.BUTTONS_PER_ROW
+    ):
+        return -1
+
+    return button_index
+
+
+def benchmark_hit_test(arguments: argparse.Namespace) -> None:
+    """compares the button hit tests against the drawn rects and each other"""
+    app = load_app()
+    pygame.font.init()
+    utilities = app.Utilities(app.RecipeBook([]))
+
+    # squeeze the grid into the same area as the default 2x4 layout
+    utilities.BUTTONS_PER_ROW = arguments.columns
+    utilities.BUTTON_ROWS = arguments.rows
+    utilities.BUTTON_WIDTH = 0.5 / arguments.columns * 0.75
+    utilities.HORIZONTAL_BUTTON_SPACING = 0.5 / arguments.columns * 0.25
+    utilities.BUTTON_HEIGHT = 0.7 / arguments.rows * 0.75
+    utilities.VERTICAL_BUTTON_SPACING = 0.7 / arguments.rows * 0.25
+
+    size = (arguments.width, arguments.height)
+    button_rects = [
+        utilities.get_button_rect(index, size)
+        for index in range(arguments.columns * arguments.rows)
+    ]
+
+    def get_drawn_button(position: tuple[int, int]) -> int:
+        for index, rect in enumerate(button_rects):
+            if rect.collidepoint(position):
+                return index
+        return -1
+
+    random.seed(arguments.seed)
+    positions = [
+        (random.randrange(size[0]), random.randrange(size[1]))
+        for _ in range(arguments.clicks)
+    ]
+    relative_positions = [(x / size[0], y / size[1]) for x, y in positions]
+    expected = [get_drawn_button(position) for position in positions]
+
+    build_start = perf_counter()
+    hit_index = app.ButtonHitIndex(utilities, size)
+    build_time = perf_counter() - build_start
+
+    hit_tests = {
+        "legacy loop": (
+            lambda position: legacy_get_drink_button_pressed(utilities, position),
+            relative_positions,
+        ),
+        "divmod": (utilities.get_drink_button_pressed, relative_positions),
+        "pixel index": (hit_index.get_button, positions),
+    }
+
+    print(
+        f"{arguments.columns}x{arguments.rows} grid at {size[0]}x{size[1]},"
+        f" {arguments.clicks} clicks, pixel index built in {build_time * 1e3:.2f}ms"
+    )
+    for name, (hit_test, inputs) in hit_tests.items():
+        mismatches = sum(
+            hit_test(position) != button for position, button in zip(inputs, expected)
+        )
+        seconds_per_call = time_calls(hit_test, inputs)
+        print(
+            f"{name:>12}: {seconds_per_call * 1e6:7.3f}us per click,"
+            f" {mismatches} clicks disagree with the drawn buttons"
+        )
+
+
+def make_busy_machines(app, recipe_book, machine_count: int) -> list:
+    """makes machines that are each part way through making a drink"""
+    machines = []
+    for machine_index in range(machine_count):
+        machine = app.Machine(recipe_book)
+        machine.order_drink(recipe_book.names[machine_index % len(recipe_book.names)])
+        # staggered so the machines are on different steps
+        machine.update_drink(machine_index * 0.7)
+        machines.append(machine)
+    return machines
+
+
+def update_busy_machines(machines: list, recipe_book, seconds: float) -> None:
+    """moves the machines on, ordering another drink on any that finish"""
+    for machine_index, machine in enumerate(machines):
+        machine.update_drink(seconds)
+        if not machine.brewing:
+            machine.order_drink(
+                recipe_book.names[machine_index % len(recipe_book.names)]
+            )
+
+
+def benchmark_machines(arguments: argparse.Namespace) -> None:
+    """times drawing a frame against the number of machines all making drinks"""
+    app = load_app()
+    pygame.init()
+    size = (arguments.width, arguments.height)
+    screen = pygame.display.set_mode(size)
+    renderer = app.SoftwareRenderer(screen)
+    recipe_book = app.RecipeBook.load(app.RECIPES_PATH)
+    step = 1 / 60
+
+    print(f"{arguments.frames} frames at {size[0]}x{size[1]}")
+    print("machines  static layer ms/frame  per machine  full redraw ms/frame")
+    for machine_count in arguments.counts:
+        utilities = app.Utilities(recipe_book)
+        utilities.MACHINE_COUNT = machine_count
+        renderer.set_static_layer(
+            utilities.build_static_layer(size, (255, 255, 255), recipe_book.names)
+        )
+        machines = make_busy_machines(app, recipe_book, machine_count)
+
+        start = perf_counter()
+        for _ in range(arguments.frames):
+            update_busy_machines(machines, recipe_book, step)
+            dirty_rects = utilities.draw_machines(renderer, machines)
+            renderer.present(dirty_rects)
+        layered_time = (perf_counter() - start) / arguments.frames
+
+        # everything drawn from scratch every frame, as it used to be
+        start = perf_counter()
+        for _ in range(arguments.frames):
+            update_busy_machines(machines, recipe_book, step)
+            screen.fill((255, 255, 255))
+            for index, drink_name in enumerate(recipe_book.names):
+                utilities.draw_button(index, renderer, drink_name)
+            for machine_index, machine in enumerate(machines):
+                utilities.draw_machine(renderer, machine, machine_index)
+            renderer.present()
+        full_time = (perf_counter() - start) / arguments.frames
+
+        print(
+            f"{machine_count:>8}  {layered_time * 1e3:22.3f}"
+            f"  {layered_time / machine_count * 1e3:11.3f}"
+            f"  {full_time * 1e3:20.3f}"
+        )
+
+
+def benchmark_renderers(arguments: argparse.Namespace) -> None:
+    """times drawing a frame with each renderer backend at each window size"""
+    app = load_app()
+    pygame.init()
+    recipe_book = app.RecipeBook.load(app.RECIPES_PATH)
+    step = 1 / 60
+
+    print(f"{arguments.frames} frames of {arguments.machines} machines")
+    print(f"{'size':>9}  " + "".join(f"{name:>10}" for name in app.RENDERERS))
+    for size_text in arguments.sizes:
+        size = tuple(int(value) for value in size_text.split("x"))
+        frame_times = []
+        for renderer_class in app.RENDERERS.values():
+            renderer = renderer_class.open_window(size, "benchmark")
+            utilities = app.Utilities(recipe_book)
+            utilities.MACHINE_COUNT = arguments.machines
+            renderer.set_static_layer(
+                utilities.build_static_layer(size, (255, 255, 255), recipe_book.names)
+            )
+            machines = make_busy_machines(app, recipe_book, arguments.machines)
+
+            start = perf_counter()
+            for _ in range(arguments.frames):
+                update_busy_machines(machines, recipe_book, step)
+                dirty_rects = utilities.draw_machines(renderer, machines)
+                renderer.present(dirty_rects)
+            frame_times.append((perf_counter() - start) / arguments.frames)
+
+            # each backend gets a window of its own
+            if isinstance(renderer, app.TextureRenderer):
+                renderer.window.destroy()
+            pygame.display.quit()
+            pygame.display.init()
+
+        print(
+            f"{size_text:>9}  "
+            + "".join(f"{frame_time * 1e3:8.3f}ms" for frame_time in frame_times)
+        )
+
+
+def benchmark_particles(arguments: argparse.Namespace) -> None:
+    """times moving and drawing the pour against how many particles are falling"""
+    app = load_app()
+    pygame.init()
+    size = (arguments.width, arguments.height)
+    screen = pygame.display.set_mode(size)
+    renderer = app.SoftwareRenderer(screen)
+    recipe_book = app.RecipeBook.load(app.RECIPES_PATH)
+    utilities = app.Utilities(recipe_book)
+    renderer.set_static_layer(
+        utilities.build_static_layer(size, (255, 255, 255), recipe_book.names)
+    )
+    pour_rect = utilities.get_layout(size).machines[0].pour_rect
+    colour = (160, 140, 110)
+    step = 1 / 60
+    # a long pour so the mug doesn't fill up part way through
+    pour_seconds = 3600
+
+    print(f"{arguments.frames} frames at {size[0]}x{size[1]}, 16.7ms a frame for 60fps")
+    print("particles  falling  update ms  draw ms  frame ms  p99 frame ms")
+    for count in arguments.counts:
+        # poured faster than it lands so the pour is always as full as it can be
+        pour = app.ParticlePour(count, rate=count * 4)
+        for _ in range(60):
+            pour.update(step, pour_seconds)
+
+        update_times = []
+        draw_times = []
+        falling = 0
+        for _ in range(arguments.frames):
+            start = perf_counter()
+            pour.update(step, pour_seconds)
+            updated = perf_counter()
+            renderer.restore(pour_rect)
+            utilities.draw_pour(renderer, pour, colour)
+            renderer.present([pour_rect])
+            update_times.append(updated - start)
+            draw_times.append(perf_counter() - updated)
+            falling += pour.count
+
+        frame_times = sorted(
+            update_time + draw_time
+            for update_time, draw_time in zip(update_times, draw_times)
+        )
+        print(
+            f"{count:>9}  {falling // arguments.frames:>7}"
+            f"  {statistics.mean(update_times) * 1e3:9.3f}"
+            f"  {statistics.mean(draw_times) * 1e3:7.3f}"
+            f"  {statistics.mean(frame_times) * 1e3:8.3f}"
+            f"  {frame_times[int(len(frame_times) * 0.99)] * 1e3:12.3f}"
+        )
+
+
+def load_gradient_recipes(app, stop_count: int, duration: float):
+    """loads a recipe book with one step that goes through stop_count colours,
+    through a config file as recipes.json would be
+
+    Returns:
+        a tuple of the recipe book and the colour of each stop
+    """
+    random_colours = random.Random(stop_count)
+    stops = [
+        [random_colours.randrange(256) for _ in range(3)] for _ in range(stop_count)
+    ]
+    colour_names = [f"stop {index}" for index in range(stop_count)]
+    config = {
+        "colours": dict(zip(colour_names, stops)),
+        "recipes": [
+            {
+                "name": "Gradient",
+                "steps": [
+                    {
+                        "label": "Mixing",
+                        "start": colour_names[0],
+                        "via": colour_names[1:-1],
+                        "end": colour_names[-1],
+                        "duration": duration,
+                        "window": "full",
+                    }
+                ],
+            }
+        ],
+    }
+    with tempfile.TemporaryDirectory() as config_dir:
+        path = os.path.join(config_dir, "recipes.json")
+        with open(path, "w", encoding="utf-8") as config_file:
+            json.dump(config, config_file)
+        return app.RecipeBook.load(path), stops
+
+
+def benchmark_gradients(arguments: argparse.Namespace) -> None:
+    """times making and looking up gradients against how many colours they go through
+
+    the step is long enough that every stop lands on a frame of its table,
+    so each stop's colour is checked to come back exactly
+    """
+    app = load_app()
+    steps_per_second = 60
+    # 144 frames, which each stop count's gaps divide evenly
+    duration = 2.4
+    frames = round(duration * steps_per_second)
+
+    print(f"a {duration}s step at {steps_per_second} colours a second")
+    print("stops  build ms  lookup us  stops exact")
+    for stop_count in arguments.stops:
+        recipe_book, stops = load_gradient_recipes(app, stop_count, duration)
+
+        start = perf_counter()
+        for _ in range(arguments.builds):
+            colour_tables = app.ColourTables(recipe_book, steps_per_second)
+        build_time = (perf_counter() - start) / arguments.builds
+
+        amounts = [frame / frames for frame in range(frames + 1)]
+        lookup_time = time_calls(
+            lambda amount: colour_tables.get_colour("Gradient", 0, amount),
+            amounts * 100,
+        )
+
+        exact = all(
+            list(colour_tables.get_colour("Gradient", 0, index / (stop_count - 1)))
+            == stop
+            for index, stop in enumerate(stops)
+        )
+        print(
+            f"{stop_count:>5}  {build_time * 1e3:8.3f}  {lookup_time * 1e6:9.3f}"
+            f"  {'yes' if exact else 'NO':>11}"
+        )
+
+
+def time_first_frame(app_arguments: list[str]) -> float:
+    """starts the app and times how long until its first frame is shown
+
+    Returns:
+        the seconds from starting the process to the first frame
+    """
+    start = time()
+    result = subprocess.run(
+        [sys.executable, APP_PATH, "--first-frame-only", *app_arguments],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return float(result.stdout.splitlines()[-1]) - start
+
+
+def benchmark_startup(arguments: argparse.Namespace) -> None:
+    """times from starting the app to its first frame being shown"""
+    with tempfile.TemporaryDirectory() as cache_directory:
+        warm_cache_path = os.path.join(cache_directory, "warm.json")
+        # fills the cache for the warm runs
+        time_first_frame(["--font-cache", warm_cache_path])
+
+        cases = {
+            "no font cache": lambda run: [
+                "--font-cache",
+                os.path.join(cache_directory, f"cold {run}.json"),
+            ],
+            "font cache": lambda run: ["--font-cache", warm_cache_path],
+        }
+        if arguments.font:
+            cases["bundled font"] = lambda run: ["--font", arguments.font]
+
+        print(f"time to first frame over {arguments.runs} runs")
+        for name, get_app_arguments in cases.items():
+            times = [
+                time_first_frame(get_app_arguments(run))
+                for run in range(arguments.runs)
+            ]
+            print(
+                f"{name:>14}: {statistics.median(times) * 1e3:7.1f}ms median"
+                f" {min(times) * 1e3:7.1f}ms best"
+            )
+
+
+BENCHMARKS = {
+    "hit-test": benchmark_hit_test,
+    "machines": benchmark_machines,
+    "renderers": benchmark_renderers,
+    "particles": benchmark_particles,
+    "gradients": benchmark_gradients,
+    "startup": benchmark_startup,
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    hit_test_parser = subparsers.add_parser(
+        "hit-test", help="button hit testing against random clicks"
+    )
+    hit_test_parser.add_argument("--columns", type=int, default=6)
+    hit_test_parser.add_argument("--rows", type=int, default=8)
+    hit_test_parser.add_argument("--width", type=int, default=1920)
+    hit_test_parser.add_argument("--height", type=int, default=1080)
+    hit_test_parser.add_argument("--clicks", type=int, default=100_000)
+    hit_test_parser.add_argument("--seed", type=int, default=0)
+
+    machines_parser = subparsers.add_parser(
+        "machines", help="frame time against the number of machines"
+    )
+    machines_parser.add_argument(
+        "--counts", type=int, nargs="+", default=[1, 2, 4, 8, 16]
+    )
+    machines_parser.add_argument("--frames", type=int, default=300)
+    machines_parser.add_argument("--width", type=int, default=1920)
+    machines_parser.add_argument("--height", type=int, default=1080)
+
+    renderers_parser = subparsers.add_parser(
+        "renderers", help="frame time with each renderer backend"
+    )
+    renderers_parser.add_argument(
+        "--sizes", nargs="+", default=["1920x1080", "3840x2160"]
+    )
+    renderers_parser.add_argument("--machines", type=int, default=4)
+    renderers_parser.add_argument("--frames", type=int, default=300)
+
+    particles_parser = subparsers.add_parser(
+        "particles", help="frame time of the pour against the number of particles"
+    )
+    particles_parser.add_argument(
+        "--counts", type=int, nargs="+", default=[1000, 2000, 5000, 10000, 20000]
+    )
+    particles_parser.add_argument("--frames", type=int, default=600)
+    particles_parser.add_argument("--width", type=int, default=1920)
+    particles_parser.add_argument("--height", type=int, default=1080)
+
+    gradients_parser = subparsers.add_parser(
+        "gradients", help="making gradients against how many colours they go through"
+    )
+    gradients_parser.add_argument(
+        "--stops",
+        type=int,
+        nargs="+",
+        default=[2, 3, 5, 9, 17],
+        help="colours in each gradient, each less one must divide 144",
+    )
+    gradients_parser.add_argument("--builds", type=int, default=200)
+
+    startup_parser = subparsers.add_parser(
+        "startup", help="time from starting the app to its first frame"
+    )
+    startup_parser.add_argument("--runs", type=int, default=10)
+    startup_parser.add_argument("--font", help="a font file to also time starting with")
+
+    arguments = parser.parse_args()
+    BENCHMARKS[arguments.benchmark](arguments)
+
+
+if __name__ == "__main__":
+    main()
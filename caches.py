@@ -0,0 +1,50 @@
+from collections import OrderedDict
+
+
+class LRUCache:
+    """a small least recently used cache with hit/miss counters
+
+    used to stop re-rendering the same text every frame
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key):
+        """gets a cached value and marks it as recently used
+
+        Args:
+            key: the key the value was stored under
+
+        Returns:
+            the cached value, None if the key is not cached
+        """
+        try:
+            value = self._items[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self._items.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value) -> None:
+        """stores a value, evicting the least recently used if full
+
+        Args:
+            key: the key to store the value under
+            value: the value to be stored
+        """
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        self._items.clear()
@@ -0,0 +1,134 @@
+import json
+import os
+
+import pygame
+
+from caches import LRUCache
+
+# where the paths found for system fonts are kept between runs
+FONT_CACHE_PATH = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+    "hot-drinks-machine",
+    "fonts.json",
+)
+
+
+def find_font_path(font_name: str, cache_path: str = FONT_CACHE_PATH) -> str | None:
+    """finds the file for a system font, remembering it for next time
+
+    looking a font up scans every system font, which is slow when there are
+    lots of them, so the path found is saved and only looked up again if the
+    file it points to has gone. delete the cache to look every font up again
+
+    Args:
+        font_name: the name of the font, as given to pygame.font.SysFont
+        cache_path: the json file the paths are kept in
+
+    Returns:
+        the path of the font file, None if the font is not installed
+    """
+    try:
+        with open(cache_path, encoding="utf-8") as cache_file:
+            font_paths = json.load(cache_file)
+    except (OSError, ValueError):
+        font_paths = {}
+
+    if font_name in font_paths:
+        font_path = font_paths[font_name]
+        # None is cached too so a missing font is not looked for every time
+        if font_path is None or os.path.exists(font_path):
+            return font_path
+
+    font_path = pygame.font.match_font(font_name)
+    font_paths[font_name] = font_path
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(cache_path, "w", encoding="utf-8") as cache_file:
+            json.dump(font_paths, cache_file, indent=4)
+    except OSError:
+        # a cache that can't be written only makes the next start slower
+        pass
+    return font_path
+
+
+class FontAtlas:
+    def __init__(
+        self,
+        font_name: str,
+        sizes: tuple[int, ...],
+        font_path: str | None = None,
+        cache_path: str = FONT_CACHE_PATH,
+        glyph_cache_size: int = 1024,
+        word_cache_size: int = 256,
+    ) -> None:
+        """one font at a few sizes, so text can be drawn at whichever fits best
+
+        each size is only loaded the first time it is used. characters are
+        rendered once per size and colour and words are put together from
+        them, so a word never seen before, like a new number of seconds,
+        doesn't need the font to render it. the characters and words of
+        every size share two caches, so changing size pushes out the old
+        ones rather than adding to them
+
+        Args:
+            font_name: the system font to use if no font file is given
+            sizes: the sizes that can be drawn at
+            font_path: a font file to use instead, such as one shipped with the app
+            cache_path: the json file the paths of system fonts are kept in
+            glyph_cache_size: the most characters kept rendered
+            word_cache_size: the most words kept rendered
+        """
+        self.sizes = tuple(sorted(sizes))
+        self.font_path = (
+            font_path
+            if font_path is not None
+            else find_font_path(font_name, cache_path)
+        )
+        self.fonts = {}
+        # keyed on (size, text, colour)
+        self.glyph_cache = LRUCache(glyph_cache_size)
+        self.word_cache = LRUCache(word_cache_size)
+
+    def get_font(self, size: int) -> pygame.font.Font:
+        font = self.fonts.get(size)
+        if font is None:
+            font = pygame.font.Font(self.font_path, size)
+            self.fonts[size] = font
+        return font
+
+    def render_glyph(
+        self, character: str, size: int, colour: tuple[int, int, int]
+    ) -> pygame.Surface:
+        key = (size, character, colour)
+        glyph_surface = self.glyph_cache.get(key)
+        if glyph_surface is None:
+            glyph_surface = self.get_font(size).render(character, 0, colour)
+            self.glyph_cache.put(key, glyph_surface)
+        return glyph_surface
+
+    def render_word(
+        self, word: str, size: int, colour: tuple[int, int, int]
+    ) -> pygame.Surface:
+        """Gets the rendered surface for a word, rendering it only if not cached.
+
+        Args:
+            word: the word to render
+            size: one of the atlas's sizes
+            colour: colour of the text
+
+        Returns:
+            the surface with the word rendered on it
+        """
+        key = (size, word, colour)
+        word_surface = self.word_cache.get(key)
+        if word_surface is None:
+            font = self.get_font(size)
+            word_surface = pygame.Surface(font.size(word), pygame.SRCALPHA)
+            for index, character in enumerate(word):
+                # placed where the font puts it in the whole word, so kerning is kept
+                word_surface.blit(
+                    self.render_glyph(character, size, colour),
+                    (font.size(word[:index])[0], 0),
+                )
+            self.word_cache.put(key, word_surface)
+        return word_surface
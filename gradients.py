@@ -0,0 +1,141 @@
+from math import ceil
+
+import numpy as np
+import pygame
+
+from recipes import RecipeBook
+
+
+class GradientTable:
+    def __init__(
+        self, colour_stops: tuple[tuple[int, int, int], ...], length: int
+    ) -> None:
+        """every colour a gradient passes through, worked out once
+
+        the stops are spaced evenly and the colours between
+        them are linearly interpolated
+
+        Args:
+            colour_stops: the colours the gradient goes through in order
+            length: how many colours to work out, at least 2
+        """
+        self.length = length
+        stops = np.array(colour_stops, dtype=np.float64)
+        positions = np.linspace(0, 1, len(stops))
+        amounts = np.linspace(0, 1, length)
+        self.colours = np.rint(
+            np.column_stack(
+                [
+                    np.interp(amounts, positions, stops[:, channel])
+                    for channel in range(3)
+                ]
+            )
+        ).astype(np.uint8)
+
+    def get_colour(self, amount: float) -> np.ndarray:
+        """gets the colour part way along the gradient
+
+        Args:
+            amount: how far along the gradient, 0-1
+
+        Returns:
+            an array of the r, g and b of the colour
+        """
+        # the nearest colour, so a time a hair before a frame still gets its colour
+        index = round(amount * (self.length - 1))
+        return self.colours[min(max(index, 0), self.length - 1)]
+
+
+class ColourTables:
+    def __init__(self, recipe_book: RecipeBook, steps_per_second: int) -> None:
+        """the gradient of every step that shows liquid, for every recipe
+
+        each gradient has a colour for every frame of its step,
+        so drawing a frame only needs to look one up
+
+        Args:
+            recipe_book: the recipes to make the gradients for
+            steps_per_second: how many colours each second of a step has
+        """
+        self.tables = {}
+        for recipe in recipe_book.recipes.values():
+            self.tables[recipe.name] = [
+                (
+                    GradientTable(
+                        step.colour_stops, ceil(step.duration * steps_per_second) + 1
+                    )
+                    if step.colour_stops is not None
+                    else None
+                )
+                for step in recipe.steps
+            ]
+
+    def get_colour(
+        self, recipe_name: str, step_index: int, amount: float
+    ) -> np.ndarray:
+        """gets the colour of the liquid part way through a step
+
+        Args:
+            recipe_name: the drink being made
+            step_index: the step it is on
+            amount: how far through the step, 0-1
+
+        Returns:
+            an array of the r, g and b of the liquid
+        """
+        return self.tables[recipe_name][step_index].get_colour(amount)
+
+
+def get_depth_shading(height: int, bottom_brightness: float) -> np.ndarray:
+    """gets how bright each row of a liquid is, dimming towards the bottom
+
+    Args:
+        height: the height of the liquid when full
+        bottom_brightness: how bright the bottom row is, 0-1
+
+    Returns:
+        an array of the brightness of each row from the top
+    """
+    return np.linspace(1, bottom_brightness, max(height, 1))
+
+
+def fill_vertical_gradient(
+    surface: pygame.Surface,
+    rect: pygame.Rect,
+    colour: np.ndarray,
+    shading: np.ndarray,
+) -> None:
+    """fills a rect with a colour shaded row by row
+
+    the shading is lined up with the bottom of the rect,
+    so a liquid that is half full uses the bottom half of it
+
+    Args:
+        surface: surface to draw on
+        rect: the area to fill
+        colour: the r, g and b of the brightest row
+        shading: the brightness of each row, at least as long as the rect is high
+    """
+    rect = rect.clip(surface.get_rect())
+    height = min(rect.height, len(shading))
+    if rect.width <= 0 or height <= 0:
+        return
+
+    column = np.multiply.outer(shading[len(shading) - height :], colour)
+    rows = slice(rect.bottom - height, rect.bottom)
+    columns = slice(rect.left, rect.right)
+
+    if surface.get_bytesize() == 4:
+        # writing whole packed pixels is much quicker than each channel
+        red_shift, green_shift, blue_shift, _ = surface.get_shifts()
+        shifts = np.array([red_shift, green_shift, blue_shift], dtype=np.uint32)
+        packed_column = np.bitwise_or.reduce(
+            column.astype(np.uint32) << shifts, axis=1
+        ) | np.uint32(surface.get_masks()[3])
+        pixels = pygame.surfarray.pixels2d(surface)
+        pixels[columns, rows] = packed_column
+    else:
+        pixels = pygame.surfarray.pixels3d(surface)
+        pixels[columns, rows] = column.astype(np.uint8)
+    # the surface stays locked until the pixel array is let go of
+    del pixels
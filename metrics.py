@@ -0,0 +1,423 @@
+"""counters for fleets of machines, scraped by prometheus over local http
+
+every counter is a float in a block of shared memory. the main loop adds to
+them with plain stores into a memoryview over the block, and a separate
+exporter process reads the block whenever it is scraped and serves it as
+prometheus text, so publishing never takes a lock, makes a syscall or
+waits on a socket in the render loop.
+
+a scrape can land part way through a frame, so counters updated together
+may be one frame apart. each float is 8 byte aligned so is never read half
+written. start the app with --metrics-port then scrape
+    http://127.0.0.1:PORT/metrics
+"""
+
+import multiprocessing
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from multiprocessing import shared_memory
+
+METRIC_TYPES = ("counter", "gauge", "summary")
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return (
+        "{"
+        + ",".join(f'{name}="{escape_label(value)}"' for name, value in labels.items())
+        + "}"
+    )
+
+
+def format_metrics(metrics: list[tuple], values: list[float]) -> str:
+    """writes the counters out in the prometheus text format
+
+    Args:
+        metrics: each metric as (name, type, help, [(labels, index)])
+        values: every counter, by index
+
+    Returns:
+        the text for a scrape
+    """
+    lines = []
+    for name, metric_type, help_text, series in metrics:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for labels, index in series:
+            label_text = format_labels(labels)
+            if metric_type == "summary":
+                lines.append(f"{name}_sum{label_text} {values[index]!r}")
+                lines.append(f"{name}_count{label_text} {values[index + 1]!r}")
+            else:
+                lines.append(f"{name}{label_text} {values[index]!r}")
+    return "\n".join(lines) + "\n"
+
+
+def serve_metrics(
+    memory_name: str,
+    metrics: list[tuple],
+    slot_count: int,
+    host: str,
+    port: int,
+    ready,
+) -> None:
+    """serves the counters until the process is stopped
+
+    run in the exporter process. each scrape copies the block once
+    and formats the copy, so a scrape sees one moment of every counter
+
+    Args:
+        memory_name: the shared memory the counters are in
+        metrics: each metric as (name, type, help, [(labels, index)])
+        slot_count: how many counters there are
+        host: the address to listen on, keep it local
+        port: the port to listen on, 0 for any free port
+        ready: a pipe to send the port listened on, or the error
+          if it couldn't be, back through
+    """
+    memory = shared_memory.SharedMemory(memory_name)
+    block = memory.buf[: slot_count * 8]
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            values = memoryview(bytes(block)).cast("d").tolist()
+            body = format_metrics(metrics, values).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args) -> None:
+            # scraped every few seconds, which would fill the console
+            pass
+
+    try:
+        try:
+            server = HTTPServer((host, port), MetricsHandler)
+        except OSError as error:
+            ready.send(error)
+            return
+        ready.send(server.server_address[1])
+        ready.close()
+        server.serve_forever()
+    finally:
+        # the view must go before the memory closes
+        block.release()
+        memory.close()
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        """counters in shared memory, served by an exporter process
+
+        every metric is added before start, which makes the block and gives
+        each its place in it. after that only values changes, with
+        values[index] += amount for counters and summaries, whose sum is at
+        index and count at index + 1, and values[index] = amount for gauges
+        """
+        self.metrics = []
+        self.slot_count = 0
+        self.values = None
+        self.host = None
+        self.port = None
+        self._memory = None
+        self._exporter = None
+
+    def add(
+        self,
+        name: str,
+        metric_type: str,
+        help_text: str,
+        label_sets: list[dict[str, str]] | None = None,
+    ) -> list[int]:
+        """adds a metric with a counter for each set of labels
+
+        Args:
+            name: the metric's name, by prometheus convention
+              counters end in _total and times are in seconds
+            metric_type: "counter", "gauge" or "summary"
+            help_text: what it counts, shown by prometheus
+            label_sets: the labels of each series, one unlabelled series if not given
+
+        Returns:
+            a list of the index in values of each series, in the order of label_sets
+
+        Raises:
+            ValueError: if the type is unknown or the block is already made
+        """
+        if metric_type not in METRIC_TYPES:
+            raise ValueError(f"no metric type {metric_type}")
+        if self._memory is not None:
+            raise ValueError("metrics can only be added before start")
+
+        # a summary keeps its sum and count next to each other
+        width = 2 if metric_type == "summary" else 1
+        series = []
+        for labels in label_sets or [{}]:
+            series.append((dict(labels), self.slot_count))
+            self.slot_count += width
+        self.metrics.append((name, metric_type, help_text, series))
+        return [index for _, index in series]
+
+    @property
+    def address(self) -> str:
+        return f"http://{self.host}:{self.port}/metrics"
+
+    def start(self, port: int = 9464, host: str = "127.0.0.1") -> None:
+        """makes the block and waits for the exporter to be listening
+
+        Args:
+            port: the port to serve on, 0 for any free port
+            host: the address to listen on, keep it local
+
+        Raises:
+            OSError: if the exporter couldn't listen on the port
+              or stopped before it was listening
+        """
+        self._memory = shared_memory.SharedMemory(
+            create=True, size=max(self.slot_count, 1) * 8
+        )
+        # new shared memory is zeroed, so every counter starts at 0
+        self.values = self._memory.buf.cast("d")[: self.slot_count]
+
+        context = multiprocessing.get_context("spawn")
+        receiver, sender = context.Pipe(duplex=False)
+        # spawned rather than forked so it doesn't share the window
+        self._exporter = context.Process(
+            target=serve_metrics,
+            args=(
+                self._memory.name,
+                self.metrics,
+                self.slot_count,
+                host,
+                port,
+                sender,
+            ),
+            name="metrics exporter",
+            daemon=True,
+        )
+        try:
+            self._exporter.start()
+            # so the pipe reads as closed if the exporter stops
+            sender.close()
+            if not receiver.poll(10):
+                raise OSError("the metrics exporter didn't start listening in time")
+            try:
+                result = receiver.recv()
+            except EOFError:
+                self._exporter.join(1)
+                raise OSError(
+                    "the metrics exporter stopped before it was listening,"
+                    f" exit code {self._exporter.exitcode}"
+                ) from None
+            if isinstance(result, Exception):
+                raise result
+        except BaseException:
+            # the shared memory would otherwise outlive the app
+            self.close()
+            raise
+        finally:
+            sender.close()
+            receiver.close()
+        self.host = host
+        self.port = result
+
+    def close(self) -> None:
+        """stops the exporter and frees the block"""
+        if self._exporter is not None:
+            self._exporter.terminate()
+            self._exporter.join()
+            self._exporter = None
+        if self._memory is not None:
+            # the view must go before the memory closes
+            self.values.release()
+            self.values = None
+            self._memory.close()
+            self._memory.unlink()
+            self._memory = None
+
+
+class DrinkMetrics:
+    # a frame taking longer than this many of its frame times is slow
+    SLOW_FRAME = 1.0
+    FRAME_PHASES = ("update", "draw_machine", "display")
+
+    def __init__(
+        self,
+        registry: MetricsRegistry,
+        recipe_book,
+        machine_count: int,
+        max_fps: float,
+    ) -> None:
+        """the app's counters, added to a registry that hasn't started
+
+        every index is looked up here, so recording is
+        dict lookups and adds into the registry's values
+
+        Args:
+            registry: where the counters are kept
+            recipe_book: the drinks that can be made
+            machine_count: how many machines there are
+            max_fps: the frame rate drawn at, for telling which frames are slow
+        """
+        self.registry = registry
+        self.slow_seconds = self.SLOW_FRAME / max_fps
+        names = recipe_book.names
+        drinks = [{"drink": name} for name in names]
+
+        self._ordered = dict(
+            zip(
+                names,
+                registry.add(
+                    "hot_drinks_ordered_total", "counter", "Drinks ordered.", drinks
+                ),
+            )
+        )
+        self._served = dict(
+            zip(
+                names,
+                registry.add(
+                    "hot_drinks_served_total", "counter", "Drinks finished.", drinks
+                ),
+            )
+        )
+        self._brew_seconds = dict(
+            zip(
+                names,
+                registry.add(
+                    "hot_drinks_brew_seconds",
+                    "summary",
+                    "Seconds from a drink starting to brew to finishing.",
+                    drinks,
+                ),
+            )
+        )
+        self._order_seconds = dict(
+            zip(
+                names,
+                registry.add(
+                    "hot_drinks_order_seconds",
+                    "summary",
+                    "Seconds from a drink being ordered to finishing.",
+                    drinks,
+                ),
+            )
+        )
+        steps = [
+            (name, step_index, step.label)
+            for name in names
+            for step_index, step in enumerate(recipe_book.get(name).steps)
+        ]
+        self._step_seconds = dict(
+            zip(
+                ((name, step_index) for name, step_index, _ in steps),
+                registry.add(
+                    "hot_drinks_step_seconds_total",
+                    "counter",
+                    "Seconds drinks spent on each brew step.",
+                    [
+                        {"drink": name, "step": str(step_index), "label": label}
+                        for name, step_index, label in steps
+                    ],
+                ),
+            )
+        )
+        self._queue_depths = registry.add(
+            "hot_drinks_queue_depth",
+            "gauge",
+            "Orders waiting or brewing on each machine.",
+            [{"machine": str(machine_index)} for machine_index in range(machine_count)],
+        )
+        (self._frames,) = registry.add(
+            "hot_drinks_frames_total", "counter", "Frames drawn."
+        )
+        (self._slow_frames,) = registry.add(
+            "hot_drinks_slow_frames_total",
+            "counter",
+            "Frames that took longer than a frame time to draw.",
+        )
+        self._phase_seconds = registry.add(
+            "hot_drinks_frame_phase_seconds_total",
+            "counter",
+            "Seconds spent in each phase of drawing a frame.",
+            [{"phase": phase} for phase in self.FRAME_PHASES],
+        )
+
+        # (the clock when the order's step started, the step),
+        # by machine and order id
+        self._step_starts = {}
+        self._brew_starts = {}
+
+    def record_order(self, machine, order, kind: int) -> None:
+        """counts an order being made, moving onto a step or finishing
+
+        called with the same arguments as Machine's on_order_change
+
+        Args:
+            machine: the machine the order is on
+            order: the order that changed
+            kind: ORDERED, STEP or FINISHED from order_log.py
+        """
+        values = self.registry.values
+        drink = order.recipe.name
+        if order.brew is None:
+            values[self._ordered[drink]] += 1
+            return
+
+        clock = machine.pipeline.clock
+        key = (machine.machine_index, order.id)
+        started = self._step_starts.get(key)
+        if started is None:
+            self._brew_starts[key] = clock
+        else:
+            start_clock, step_index = started
+            values[self._step_seconds[drink, step_index]] += clock - start_clock
+
+        if order.brew.finished:
+            del self._step_starts[key]
+            index = self._brew_seconds[drink]
+            values[index] += clock - self._brew_starts.pop(key)
+            values[index + 1] += 1
+            index = self._order_seconds[drink]
+            values[index] += clock - order.submitted_at
+            values[index + 1] += 1
+            values[self._served[drink]] += 1
+        else:
+            self._step_starts[key] = (clock, order.brew.step_index)
+
+    def record_frame(
+        self,
+        machines: list,
+        frame_start: float,
+        draw_start: float,
+        display_start: float,
+        frame_end: float,
+    ) -> None:
+        """counts a drawn frame and the time spent on each part of it
+
+        Args:
+            machines: every machine, for their queue depths
+            frame_start: when the frame's events were taken, from perf_counter
+            draw_start: when the drinks had been updated
+            display_start: when the machines had been drawn
+            frame_end: when the frame had been shown
+        """
+        values = self.registry.values
+        values[self._frames] += 1
+        if frame_end - frame_start > self.slow_seconds:
+            values[self._slow_frames] += 1
+        update, draw, display = self._phase_seconds
+        values[update] += draw_start - frame_start
+        values[draw] += display_start - draw_start
+        values[display] += frame_end - display_start
+        for index, machine in zip(self._queue_depths, machines):
+            values[index] = len(machine.pipeline)
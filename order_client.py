@@ -0,0 +1,181 @@
+"""orders drinks, checks on machines and load tests through the order API
+
+start the app with --api-port or --api-socket, then run with:
+    python order_client.py order Coffee
+    python order_client.py status
+    python order_client.py watch
+    python order_client.py load-test --connections 8 --requests 20000
+"""
+
+import argparse
+import asyncio
+import json
+import random
+from collections import Counter
+from time import perf_counter
+
+from profiling import get_percentile
+
+
+async def connect(
+    arguments: argparse.Namespace,
+) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    if arguments.socket:
+        return await asyncio.open_unix_connection(arguments.socket)
+    return await asyncio.open_connection(arguments.host, arguments.port)
+
+
+async def send_request(arguments: argparse.Namespace, request: dict) -> dict:
+    """sends one request and waits for its reply"""
+    reader, writer = await connect(arguments)
+    writer.write(json.dumps(request).encode("utf-8") + b"\n")
+    reply = json.loads(await reader.readline())
+    writer.close()
+    return reply
+
+
+async def watch(arguments: argparse.Namespace) -> None:
+    """prints every order event until stopped"""
+    reader, writer = await connect(arguments)
+    writer.write(b'{"type": "subscribe"}\n')
+    while line := await reader.readline():
+        print(line.decode("utf-8").rstrip())
+
+
+async def run_connection(
+    arguments: argparse.Namespace,
+    request_count: int,
+    latencies: list[float],
+    results: Counter,
+) -> None:
+    """sends requests on one connection, keeping up to --pipeline of them waiting
+
+    Args:
+        arguments: the load test's options
+        request_count: how many requests to send
+        latencies: the seconds from sending to the reply of each are added here
+        results: counts of "ok" and each error message
+    """
+    reader, writer = await connect(arguments)
+    sent_at = {}
+    in_flight = asyncio.Semaphore(arguments.pipeline)
+
+    async def read_replies() -> None:
+        for _ in range(request_count):
+            reply = json.loads(await reader.readline())
+            latencies.append(perf_counter() - sent_at.pop(reply["id"]))
+            results["ok" if reply["ok"] else reply["error"]] += 1
+            in_flight.release()
+
+    reading = asyncio.create_task(read_replies())
+    start = perf_counter()
+    for request_id in range(request_count):
+        if arguments.rate:
+            # the connections share the rate between them
+            send_at = start + request_id * arguments.connections / arguments.rate
+            if send_at > perf_counter():
+                await asyncio.sleep(send_at - perf_counter())
+        await in_flight.acquire()
+        if random.random() < arguments.order_fraction:
+            request = {"type": "order", "drink": random.choice(arguments.drinks)}
+        else:
+            request = {"type": "status"}
+        request["id"] = request_id
+        sent_at[request_id] = perf_counter()
+        writer.write(json.dumps(request).encode("utf-8") + b"\n")
+        await writer.drain()
+    await reading
+    writer.close()
+
+
+async def load_test(arguments: argparse.Namespace) -> None:
+    latencies = []
+    results = Counter()
+    per_connection = arguments.requests // arguments.connections
+    start = perf_counter()
+    await asyncio.gather(
+        *(
+            run_connection(arguments, per_connection, latencies, results)
+            for _ in range(arguments.connections)
+        )
+    )
+    total_time = perf_counter() - start
+
+    latencies.sort()
+    print(
+        f"{len(latencies)} requests on {arguments.connections} connections"
+        f" in {total_time:.2f}s ({len(latencies) / total_time:.0f} requests/s)"
+    )
+    print(
+        "latency ms "
+        + " ".join(
+            f"p{percentile} {get_percentile(latencies, percentile) * 1e3:.2f}"
+            for percentile in (50, 95, 99)
+        )
+    )
+    for result, count in results.most_common():
+        print(f"    {result}: {count}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--socket", metavar="PATH", help="a unix socket instead of tcp")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    order_parser = commands.add_parser("order", help="order a drink")
+    order_parser.add_argument("drink")
+    order_parser.add_argument(
+        "--machine", type=int, help="defaults to the shortest queue"
+    )
+    commands.add_parser("status", help="show what each machine is doing")
+    commands.add_parser("watch", help="print every order, step and finished drink")
+
+    load_parser = commands.add_parser(
+        "load-test", help="send requests as fast as the app answers them"
+    )
+    load_parser.add_argument("--connections", type=int, default=8)
+    load_parser.add_argument("--requests", type=int, default=20000)
+    load_parser.add_argument(
+        "--pipeline",
+        type=int,
+        default=64,
+        help="the most requests waiting for a reply on each connection",
+    )
+    load_parser.add_argument(
+        "--rate",
+        type=float,
+        help="requests per second to send across all connections,"
+        " as fast as they are answered if not given",
+    )
+    load_parser.add_argument(
+        "--order-fraction",
+        type=float,
+        default=0.5,
+        help="how many of the requests are orders, the rest are status",
+    )
+    load_parser.add_argument(
+        "--drinks", nargs="+", default=["Lemon Tea", "Coffee", "Chocolate"]
+    )
+    arguments = parser.parse_args()
+
+    if arguments.command == "order":
+        request = {"type": "order", "drink": arguments.drink}
+        if arguments.machine is not None:
+            request["machine"] = arguments.machine
+        print(json.dumps(asyncio.run(send_request(arguments, request))))
+    elif arguments.command == "status":
+        reply = asyncio.run(send_request(arguments, {"type": "status"}))
+        print(json.dumps(reply, indent=4))
+    elif arguments.command == "watch":
+        try:
+            asyncio.run(watch(arguments))
+        except KeyboardInterrupt:
+            pass
+    else:
+        asyncio.run(load_test(arguments))
+
+
+if __name__ == "__main__":
+    main()
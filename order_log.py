@@ -0,0 +1,311 @@
+"""an append only log of every order, its steps and when it finished
+
+run with: python order_log.py <log path> to print a summary of a log
+"""
+
+import argparse
+import json
+import mmap
+import os
+import queue
+import struct
+import threading
+from time import perf_counter, time
+
+import numpy as np
+
+MAGIC = b"DRINKLOG"
+# the header is the magic, then the length and json of the recipe names
+# so records only need to hold the index of their recipe
+HEADER_LENGTH = struct.Struct("<I")
+
+# wall time, machine clock, order id, machine index, recipe index, step index, kind
+RECORD = struct.Struct("<ddIHHHBx")
+RECORD_DTYPE = np.dtype(
+    [
+        ("wall_time", "<f8"),
+        ("clock", "<f8"),
+        ("order_id", "<u4"),
+        ("machine", "<u2"),
+        ("recipe", "<u2"),
+        ("step", "<u2"),
+        ("kind", "u1"),
+        ("padding", "u1"),
+    ]
+)
+
+ORDERED = 0
+STEP = 1
+FINISHED = 2
+KIND_NAMES = ("ordered", "step", "finished")
+
+
+def read_header(log_file) -> tuple[list[str], int]:
+    """reads the recipe names from the start of a log
+
+    Args:
+        log_file: the log, opened in binary mode at the start
+
+    Returns:
+        a tuple of the recipe names and where the records start
+
+    Raises:
+        ValueError: if the file is not an order log
+    """
+    if log_file.read(len(MAGIC)) != MAGIC:
+        raise ValueError(f"{log_file.name} is not an order log")
+    (names_length,) = HEADER_LENGTH.unpack(log_file.read(HEADER_LENGTH.size))
+    recipe_names = json.loads(log_file.read(names_length).decode("utf-8"))
+    return recipe_names, len(MAGIC) + HEADER_LENGTH.size + names_length
+
+
+class OrderLog:
+    def __init__(
+        self,
+        path: str,
+        recipe_names: list[str],
+        queue_size: int = 10000,
+        sync_interval: float = 1.0,
+    ) -> None:
+        """writes order records to the end of a file on a background thread
+
+        logging only puts the record on a queue so never waits on the disk,
+        if the queue is full the record is dropped and counted rather than
+        holding up the frame. records are written in batches and synced
+        to disk at most once per sync interval
+
+        Args:
+            path: the log file, added to if it already exists
+            recipe_names: the names of the recipes that can be ordered
+            queue_size: the most records waiting to be written
+            sync_interval: the most seconds between syncs to disk
+
+        Raises:
+            ValueError: if the existing log was written for different recipes
+        """
+        self.path = path
+        self.recipe_indexes = {name: index for index, name in enumerate(recipe_names)}
+        self.sync_interval = sync_interval
+        self.dropped = 0
+        self.written = 0
+
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, "rb") as log_file:
+                logged_names, records_start = read_header(log_file)
+            if logged_names != list(recipe_names):
+                raise ValueError(f"{path} was written for different recipes")
+            self._file = open(path, "ab")
+            # a record only partly written when the app stopped is cut off
+            # so the new records line up
+            partial_size = (os.path.getsize(path) - records_start) % RECORD.size
+            if partial_size:
+                self._file.truncate(os.path.getsize(path) - partial_size)
+        else:
+            self._file = open(path, "ab")
+            names = json.dumps(list(recipe_names)).encode("utf-8")
+            self._file.write(MAGIC + HEADER_LENGTH.pack(len(names)) + names)
+
+        self._queue = queue.Queue(queue_size)
+        self._thread = threading.Thread(
+            target=self._write_records, name="order log", daemon=True
+        )
+        self._thread.start()
+
+    def log(
+        self,
+        kind: int,
+        clock: float,
+        order_id: int,
+        recipe_name: str,
+        step_index: int = 0,
+        machine_index: int = 0,
+    ) -> None:
+        """queues a record to be written
+
+        Args:
+            kind: ORDERED, STEP or FINISHED
+            clock: the machine's clock when it happened
+            order_id: the id of the order on its machine
+            recipe_name: the drink ordered
+            step_index: the step the order moved onto
+            machine_index: which machine the order is on
+        """
+        try:
+            self._queue.put_nowait(
+                (
+                    time(),
+                    clock,
+                    order_id,
+                    machine_index,
+                    self.recipe_indexes[recipe_name],
+                    step_index,
+                    kind,
+                )
+            )
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self) -> None:
+        """writes everything still queued, syncs it to disk and closes the file"""
+        self._queue.put(None)
+        self._thread.join()
+        self._file.close()
+
+    def _write_records(self) -> None:
+        last_sync = perf_counter()
+        # the header has been written but not synced yet
+        unsynced = True
+        closing = False
+        while not closing:
+            try:
+                batch = [self._queue.get(timeout=self.sync_interval)]
+            except queue.Empty:
+                batch = []
+
+            # takes everything else waiting so it is written together
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            if None in batch:
+                closing = True
+                batch = [record for record in batch if record is not None]
+
+            if batch:
+                self._file.write(b"".join(RECORD.pack(*record) for record in batch))
+                self.written += len(batch)
+                unsynced = True
+
+            # an idle log isn't synced again every interval
+            if unsynced and (
+                closing or perf_counter() - last_sync >= self.sync_interval
+            ):
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                last_sync = perf_counter()
+                unsynced = False
+
+
+class OrderLogReader:
+    def __init__(self, path: str) -> None:
+        """reads an order log through a memory map
+
+        the records are viewed in place as a NumPy array,
+        so even a log of millions of records is not copied into memory
+
+        Args:
+            path: the log file
+
+        Raises:
+            ValueError: if the file is not an order log
+        """
+        self.path = path
+        with open(path, "rb") as log_file:
+            self.recipe_names, records_start = read_header(log_file)
+            self._map = mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # a record only partly written when the app stopped is left off
+        record_count = (len(self._map) - records_start) // RECORD.size
+        self.records = np.frombuffer(
+            self._map, dtype=RECORD_DTYPE, count=record_count, offset=records_start
+        )
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def close(self) -> None:
+        del self.records
+        self._map.close()
+
+    def replay(self):
+        """goes through the records in the order they were written
+
+        Yields:
+            a dict for each record with the kind and recipe as names
+        """
+        for record in self.records:
+            yield {
+                "wall_time": float(record["wall_time"]),
+                "clock": float(record["clock"]),
+                "order_id": int(record["order_id"]),
+                "machine": int(record["machine"]),
+                "recipe": self.recipe_names[record["recipe"]],
+                "step": int(record["step"]),
+                "kind": KIND_NAMES[record["kind"]],
+            }
+
+    def get_summary(self) -> dict[str, dict[str, float]]:
+        """counts the orders and times the drinks for each recipe
+
+        Returns:
+            a dict of each recipe name to its number of orders, number
+            finished and the mean and highest seconds from order to finish
+        """
+        records = self.records
+        positions = np.arange(len(records), dtype=np.uint64)
+        kinds = records["kind"]
+
+        # ids start from 0 each run, so an order is matched to the latest
+        # order from the same machine with the same id written before it
+        keys = (records["machine"].astype(np.uint64) << np.uint64(32)) | records[
+            "order_id"
+        ].astype(np.uint64)
+        _, key_ranks = np.unique(keys, return_inverse=True)
+        # the rank and position packed together sort by rank then position
+        sort_keys = (key_ranks.astype(np.uint64) << np.uint64(32)) | positions
+
+        is_ordered = kinds == ORDERED
+        is_finished = kinds == FINISHED
+        ordered_sort_keys = np.sort(sort_keys[is_ordered])
+
+        matches = np.searchsorted(ordered_sort_keys, sort_keys[is_finished]) - 1
+        matched = matches >= 0
+        matched[matched] = (
+            ordered_sort_keys[matches[matched]] >> np.uint64(32)
+        ) == key_ranks[is_finished][matched].astype(np.uint64)
+
+        order_positions = ordered_sort_keys[matches[matched]] & np.uint64(0xFFFFFFFF)
+        latencies = (
+            records["clock"][is_finished][matched]
+            - records["clock"][order_positions.astype(np.intp)]
+        )
+        finished_recipes = records["recipe"][is_finished][matched]
+        ordered_recipes = records["recipe"][is_ordered]
+
+        summary = {}
+        for recipe_index, name in enumerate(self.recipe_names):
+            recipe_latencies = latencies[finished_recipes == recipe_index]
+            summary[name] = {
+                "ordered": int(np.count_nonzero(ordered_recipes == recipe_index)),
+                "finished": len(recipe_latencies),
+                "mean_latency": (
+                    float(recipe_latencies.mean()) if len(recipe_latencies) else 0.0
+                ),
+                "max_latency": (
+                    float(recipe_latencies.max()) if len(recipe_latencies) else 0.0
+                ),
+            }
+        return summary
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", help="the order log to summarise")
+    arguments = parser.parse_args()
+
+    reader = OrderLogReader(arguments.path)
+    print(f"{len(reader)} records in {arguments.path}")
+    for name, recipe_summary in reader.get_summary().items():
+        print(
+            f"{name}: {recipe_summary['ordered']} ordered,"
+            f" {recipe_summary['finished']} finished,"
+            f" {recipe_summary['mean_latency']:.2f}s mean"
+            f" {recipe_summary['max_latency']:.2f}s max from order to finish"
+        )
+    reader.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+from copy import copy
+from typing import Callable
+
+from recipes import Brew, Recipe
+
+
+class Order:
+    def __init__(self, order_id: int, recipe: Recipe, submitted_at: float) -> None:
+        """a drink that has been ordered on a machine
+
+        Args:
+            order_id: number of the order on its machine
+            recipe: the recipe for the drink
+            submitted_at: the machine's clock when it was ordered
+        """
+        self.id = order_id
+        self.recipe = recipe
+        self.submitted_at = submitted_at
+        # the brew is only made once the first stage is free
+        self.brew = None
+        self.finished_at = None
+        self.estimated_finish = None
+        # the stage being held, None if not started or finished,
+        # and the stage needed next, None if on the last step
+        self.stage = None
+        self.next_stage = recipe.steps[0].stage if recipe.steps else None
+
+    def start(self) -> None:
+        self.brew = Brew(self.recipe)
+        self.update_stages()
+
+    def update_stages(self) -> None:
+        """works out the held and next stage, for when the step has changed"""
+        brew = self.brew
+        steps = self.recipe.steps
+        self.stage = None if brew.finished else steps[brew.step_index].stage
+        next_index = brew.step_index + 1
+        self.next_stage = steps[next_index].stage if next_index < len(steps) else None
+
+    @property
+    def latency(self) -> float | None:
+        """seconds from being ordered to finishing, None until finished"""
+        if self.finished_at is None:
+            return None
+        return self.finished_at - self.submitted_at
+
+
+class OrderPipeline:
+    def __init__(
+        self,
+        estimate_finish_times: bool = True,
+        on_step_change: Callable[[Order], None] | None = None,
+    ) -> None:
+        """the orders on a machine, oldest first
+
+        each stage (heating water, mixing, the cup...) can hold one order,
+        so an order can start heating its water while an older one is still
+        mixing, the same way a real machine pipelines its work
+
+        Args:
+            estimate_finish_times: keep each order's estimated finish up to date
+            on_step_change: called with an order when it starts,
+              moves onto another step and finishes
+        """
+        self.estimating = estimate_finish_times
+        self.on_step_change = on_step_change
+        self.orders = []
+        self.clock = 0.0
+        self.last_latency = None
+        self._next_id = 0
+
+    def __len__(self) -> int:
+        return len(self.orders)
+
+    @property
+    def head(self) -> Order | None:
+        """the oldest order that has been started"""
+        for order in self.orders:
+            if order.brew is not None:
+                return order
+        return None
+
+    def submit(self, recipe: Recipe) -> Order:
+        """adds an order to the back of the queue
+
+        Args:
+            recipe: the recipe for the drink
+
+        Returns:
+            the new order
+        """
+        order = Order(self._next_id, recipe, self.clock)
+        self._next_id += 1
+        self.orders.append(order)
+        if self.estimating:
+            self.estimate_finish_times()
+        return order
+
+    def advance(self, seconds: float) -> list[Order]:
+        """moves every order on that is not waiting for a stage
+
+        Args:
+            seconds: how much time has passed
+
+        Returns:
+            a list of the orders that finished
+        """
+        self.clock += seconds
+        finished = []
+
+        # nothing can block an order on its own
+        orders = self.orders
+        if len(orders) == 1 and orders[0].brew is not None:
+            order = orders[0]
+            if order.brew.advance(seconds):
+                order.update_stages()
+                if self.on_step_change is not None:
+                    self.on_step_change(order)
+                if order.brew.finished:
+                    self._finish(order)
+                    finished.append(order)
+            return finished
+
+        # a stage freed part way through a tick only becomes free on the next
+        # so the order taking it over is not given time it spent waiting
+        unavailable = {order.stage for order in orders}
+
+        # oldest first so orders move along the pipeline in the order they came
+        for order in list(orders):
+            next_stage = order.next_stage
+            blocked = (
+                next_stage not in (None, order.stage) and next_stage in unavailable
+            )
+
+            if order.brew is None:
+                if blocked:
+                    continue
+                order.start()
+                unavailable.add(order.stage)
+                if self.on_step_change is not None:
+                    self.on_step_change(order)
+                next_stage = order.next_stage
+                blocked = (
+                    next_stage not in (None, order.stage) and next_stage in unavailable
+                )
+
+            if order.brew.advance(seconds, hold_at_step_end=blocked):
+                order.update_stages()
+                unavailable.add(order.stage)
+                if self.on_step_change is not None:
+                    self.on_step_change(order)
+
+                if order.brew.finished:
+                    self._finish(order)
+                    finished.append(order)
+
+        if finished and self.orders and self.estimating:
+            self.estimate_finish_times()
+
+        return finished
+
+    def _finish(self, order: Order) -> None:
+        order.finished_at = self.clock
+        self.last_latency = order.latency
+        self.orders.remove(order)
+
+    def get_time_to_next_step(self) -> float:
+        """gets the time until the next order can change step
+
+        Returns:
+            the seconds until then, 0 if an order is ready to start now
+        """
+        occupied = {order.stage for order in self.orders}
+
+        times = []
+        for order in self.orders:
+            next_stage = order.next_stage
+            if next_stage not in (None, order.stage) and next_stage in occupied:
+                continue
+            if order.brew is None:
+                return 0.0
+            brew = order.brew
+            times.append(brew.recipe.step_ends[brew.step_index] - brew.elapsed)
+
+        # always moves on a little so float rounding can't stall it on a boundary
+        return max(min(times, default=0.0), 1e-9)
+
+    def estimate_finish_times(self) -> None:
+        """sets when each order should finish if no more are added
+
+        runs a copy of the pipeline a step at a time, skipping to each
+        point where an order changes step rather than using fixed ticks
+        """
+        simulation = OrderPipeline(estimate_finish_times=False)
+        simulation.clock = self.clock
+        for order in self.orders:
+            order_copy = copy(order)
+            order_copy.brew = copy(order.brew)
+            simulation.orders.append(order_copy)
+
+        estimates = {}
+        while simulation.orders:
+            for order in simulation.advance(simulation.get_time_to_next_step()):
+                estimates[order.id] = order.finished_at
+
+        for order in self.orders:
+            order.estimated_finish = estimates[order.id]
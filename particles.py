@@ -0,0 +1,183 @@
+"""the drink pouring from the spout into the mug, as a few thousand particles
+
+positions are in machine sizes from the machine's top left, the same
+fractions get_machine_sprite draws with, so the pour doesn't change when
+the window is resized
+"""
+
+import numpy as np
+
+# where the liquid leaves the spout
+SPOUT_LEFT = 0.225
+SPOUT_RIGHT = 0.275
+SPOUT_BOTTOM = 1 / 3 + 1 / 10
+# the inside of the mug, the mug body less its walls
+MUG_TOP = 0.6
+MUG_LEFT = 0.12
+MUG_RIGHT = 0.38
+MUG_BOTTOM = 0.88
+# how far up the inside of the mug a whole drink comes
+MUG_FILL = 0.85
+# particles leaving this area are dropped, it is the rect the pour is drawn in
+POUR_LEFT = 0.1
+POUR_RIGHT = 0.4
+POUR_BOTTOM = 0.9
+
+# in machine sizes per second squared
+GRAVITY = 3.0
+# how many of the particles hitting the liquid bounce off it rather than
+# being taken in, and how much of their speed they keep
+SPLASH_CHANCE = 0.15
+SPLASH_BOUNCE = 0.3
+WALL_BOUNCE = 0.4
+
+
+class ParticlePour:
+    def __init__(self, capacity: int = 5000, rate: float = 8000, seed: int = 0) -> None:
+        """the particles of one machine's pour and how full its mug is
+
+        every particle's position, velocity and share of the drink are kept
+        in arrays made once at the capacity, with the live particles at the
+        front, so each update moves them all at once with numpy
+
+        Args:
+            capacity: the most particles falling at once,
+              none are added while this many are
+            rate: particles added each second while pouring
+            seed: seed for where each particle starts, so pours are the same each run
+        """
+        self.capacity = capacity
+        self.rate = rate
+        self.random = np.random.default_rng(seed)
+
+        self.x = np.zeros(capacity, np.float32)
+        self.y = np.zeros(capacity, np.float32)
+        self.velocity_x = np.zeros(capacity, np.float32)
+        self.velocity_y = np.zeros(capacity, np.float32)
+        # how much of the whole drink each particle is
+        self.volume = np.zeros(capacity, np.float32)
+        self.splashed = np.zeros(capacity, np.bool_)
+        self.count = 0
+
+        # how full the mug is, 0-1
+        self.level = 0.0
+        self.step_seconds = 0.0
+        # particles and volume not added yet, carried to the next update
+        self._unemitted = 0.0
+        self._unpoured = 0.0
+
+    def reset(self) -> None:
+        """empties the mug, for the next drink"""
+        self.count = 0
+        self.level = 0.0
+        self._unemitted = 0.0
+        self._unpoured = 0.0
+
+    @property
+    def surface_y(self) -> float:
+        """the height of the top of the liquid in the mug"""
+        return MUG_BOTTOM - self.level * MUG_FILL * (MUG_BOTTOM - MUG_TOP)
+
+    def update(self, seconds: float, pour_seconds: float = 0) -> None:
+        """moves every particle on, adding more while pouring
+
+        Args:
+            seconds: how much time has passed
+            pour_seconds: how long the whole drink takes to pour,
+              0 if it isn't being poured
+        """
+        self.step_seconds = seconds
+        if pour_seconds > 0:
+            self._unpoured += seconds / pour_seconds
+            self._emit(seconds)
+        if self.count == 0:
+            return
+
+        count = self.count
+        x = self.x[:count]
+        y = self.y[:count]
+        velocity_x = self.velocity_x[:count]
+        velocity_y = self.velocity_y[:count]
+
+        velocity_y += GRAVITY * seconds
+        x += velocity_x * seconds
+        y += velocity_y * seconds
+
+        # the walls only stop particles that are inside the mug
+        below_rim = y > MUG_TOP
+        hit_left = below_rim & (x < MUG_LEFT) & (x - velocity_x * seconds >= MUG_LEFT)
+        hit_right = (
+            below_rim & (x > MUG_RIGHT) & (x - velocity_x * seconds <= MUG_RIGHT)
+        )
+        x[hit_left] = MUG_LEFT
+        x[hit_right] = MUG_RIGHT
+        hit_wall = hit_left | hit_right
+        velocity_x[hit_wall] *= -WALL_BOUNCE
+
+        surface_y = self.surface_y
+        in_mug = (x >= MUG_LEFT) & (x <= MUG_RIGHT)
+        hit_surface = in_mug & (y >= surface_y) & (velocity_y > 0)
+        # a few bounce off the first time they land, the rest are taken in
+        splashing = (
+            hit_surface
+            & ~self.splashed[:count]
+            & (self.random.random(count, np.float32) < SPLASH_CHANCE)
+        )
+        velocity_y[splashing] *= -SPLASH_BOUNCE
+        y[splashing] = surface_y
+        self.splashed[:count] |= splashing
+        absorbed = hit_surface & ~splashing
+        self.level = min(self.level + float(self.volume[:count][absorbed].sum()), 1.0)
+
+        lost = (y > POUR_BOTTOM) | (x < POUR_LEFT) | (x > POUR_RIGHT)
+        keep = ~(absorbed | lost)
+        # the particles left are moved to the front of the arrays
+        kept = int(np.count_nonzero(keep))
+        if kept < count:
+            for values in (
+                self.x,
+                self.y,
+                self.velocity_x,
+                self.velocity_y,
+                self.volume,
+                self.splashed,
+            ):
+                values[:kept] = values[:count][keep]
+            self.count = kept
+
+    def _emit(self, seconds: float) -> None:
+        self._unemitted += self.rate * seconds
+        new_count = min(int(self._unemitted), self.capacity - self.count)
+        self._unemitted -= int(self._unemitted)
+        if new_count <= 0:
+            return
+
+        start = self.count
+        end = start + new_count
+        random = self.random
+        self.x[start:end] = random.uniform(SPOUT_LEFT, SPOUT_RIGHT, new_count)
+        # spread through the step so they don't leave in layers
+        self.y[start:end] = SPOUT_BOTTOM + random.uniform(0, 0.02, new_count)
+        self.velocity_x[start:end] = random.normal(0, 0.03, new_count)
+        self.velocity_y[start:end] = random.uniform(0.05, 0.25, new_count)
+        # the drink poured since the last particles is shared between these
+        self.volume[start:end] = self._unpoured / new_count
+        self._unpoured = 0.0
+        self.splashed[start:end] = False
+        self.count = end
+
+    def get_positions(self, interpolation: float = 1) -> tuple[np.ndarray, np.ndarray]:
+        """gets where the particles are, for drawing
+
+        Args:
+            interpolation: how far between the last two updates, 0-1
+
+        Returns:
+            a tuple of the x and y of every particle
+        """
+        count = self.count
+        back = self.step_seconds * (1 - interpolation)
+        return (
+            self.x[:count] - self.velocity_x[:count] * back,
+            self.y[:count] - self.velocity_y[:count] * back,
+        )
@@ -0,0 +1,249 @@
+import csv
+import json
+from collections import deque
+from time import perf_counter
+
+import pygame
+
+
+def get_percentile(sorted_values: list[float], percentile: float) -> float:
+    """gets a percentile by the nearest rank
+
+    Args:
+        sorted_values: the values, sorted lowest first
+        percentile: which percentile to get, 0-100
+
+    Returns:
+        the value at that percentile, 0 if there are no values
+    """
+    if not sorted_values:
+        return 0.0
+    rank = round(percentile / 100 * (len(sorted_values) - 1))
+    return sorted_values[rank]
+
+
+class FrameProfiler:
+    """times the phases of each frame
+
+    the phases are timed by wrapping the functions that do them,
+    so nothing is wrapped and nothing is timed unless profiling is asked for.
+    a phase called inside another is counted in both, render_text is mostly
+    called from within draw_button and draw_machine
+    """
+
+    PHASES = ("render_text", "draw_button", "draw_machine", "display")
+    PERCENTILES = (50, 95, 99)
+
+    def __init__(self, history: int = 300, keep_trace: bool = False) -> None:
+        """sets up the profiler, nothing is timed until something is wrapped
+
+        Args:
+            history: how many of the latest frames the percentiles are taken over
+            keep_trace: keep every frame's times so they can be saved
+        """
+        self.columns = self.PHASES + ("frame",)
+        self.history = {column: deque(maxlen=history) for column in self.columns}
+        self.keep_trace = keep_trace
+        self.trace = []
+        self.frame_count = 0
+
+        # seconds spent in each phase so far this frame
+        self._frame_times = dict.fromkeys(self.PHASES, 0.0)
+        self._frame_start = None
+        self._start_time = perf_counter()
+
+        self.hud_font = None
+        self.HUD_COLOUR = (0, 0, 0)
+        self.HUD_BACKGROUND_COLOUR = (255, 255, 200)
+        self._hud_rect = None
+        # the HUD is drawn on the same surface every frame
+        self._hud_surface = None
+
+    def wrap(self, phase: str, function):
+        """wraps a function so the time spent in it is added to a phase
+
+        Args:
+            phase: the phase the time is added to
+            function: the function to time
+
+        Returns:
+            the wrapped function
+        """
+        frame_times = self._frame_times
+
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                frame_times[phase] += perf_counter() - start
+
+        return timed
+
+    def instrument(self, target, phases: dict[str, str]) -> None:
+        """replaces methods on an object with timed versions
+
+        set on the instance so calls from the object's own methods are timed too
+
+        Args:
+            target: the object with the methods
+            phases: the phase for each method name
+        """
+        for method_name, phase in phases.items():
+            setattr(target, method_name, self.wrap(phase, getattr(target, method_name)))
+
+    def begin_frame(self) -> None:
+        self._frame_start = perf_counter()
+
+    def end_frame(self) -> None:
+        """stores the times of the frame and starts counting the next from 0"""
+        now = perf_counter()
+        frame_times = self._frame_times
+        times = [frame_times[phase] for phase in self.PHASES]
+        times.append(now - self._frame_start if self._frame_start is not None else 0.0)
+
+        for column, seconds in zip(self.columns, times):
+            self.history[column].append(seconds)
+        if self.keep_trace:
+            self.trace.append(
+                (self.frame_count, self._frame_start - self._start_time, times)
+            )
+
+        for phase in self.PHASES:
+            frame_times[phase] = 0.0
+        self.frame_count += 1
+
+    def get_percentiles(self) -> dict[str, tuple[float, ...]]:
+        """gets the percentiles of each phase over the recent frames
+
+        Returns:
+            a dict of each phase and "frame" to its p50, p95 and p99 in seconds
+        """
+        percentiles = {}
+        for column in self.columns:
+            sorted_values = sorted(self.history[column])
+            percentiles[column] = tuple(
+                get_percentile(sorted_values, percentile)
+                for percentile in self.PERCENTILES
+            )
+        return percentiles
+
+    def get_summary_lines(self) -> list[str]:
+        lines = [f"{'ms':<12}" + "".join(f"{f'p{p}':>7}" for p in self.PERCENTILES)]
+        for column, values in self.get_percentiles().items():
+            lines.append(
+                f"{column:<12}" + "".join(f"{value * 1e3:7.2f}" for value in values)
+            )
+        return lines
+
+    def draw_hud(self, renderer) -> list[pygame.Rect]:
+        """draws the percentiles in the top left corner
+
+        Args:
+            renderer: one of the backends from renderers.py to draw with
+
+        Returns:
+            a list of the rects that were drawn over
+        """
+        if self.hud_font is None:
+            self.hud_font = pygame.font.SysFont("Courier New", 18)
+
+        dirty_rects = []
+        if self._hud_rect is not None:
+            renderer.restore(self._hud_rect)
+            dirty_rects.append(self._hud_rect)
+
+        line_surfaces = [
+            self.hud_font.render(
+                line, True, self.HUD_COLOUR, self.HUD_BACKGROUND_COLOUR
+            )
+            for line in self.get_summary_lines()
+        ]
+        line_height = self.hud_font.get_linesize()
+        hud_rect = pygame.Rect(
+            5,
+            5,
+            max(line_surface.get_width() for line_surface in line_surfaces) + 10,
+            line_height * len(line_surfaces) + 10,
+        )
+        if self._hud_surface is None or self._hud_surface.get_size() != hud_rect.size:
+            self._hud_surface = pygame.Surface(hud_rect.size)
+        self._hud_surface.fill(self.HUD_BACKGROUND_COLOUR)
+        for line_index, line_surface in enumerate(line_surfaces):
+            self._hud_surface.blit(line_surface, (5, 5 + line_height * line_index))
+        renderer.blit_changing(self._hud_surface, hud_rect.topleft)
+
+        self._hud_rect = hud_rect
+        dirty_rects.append(hud_rect)
+        return dirty_rects
+
+    def save_trace(self, path: str) -> None:
+        """saves every frame's times in milliseconds
+
+        Args:
+            path: the file to save to, json if it ends in .json otherwise csv
+        """
+        header = ["frame", "start_ms"] + [f"{column}_ms" for column in self.columns]
+        rows = [
+            [frame, round(start * 1e3, 3)] + [round(time * 1e3, 4) for time in times]
+            for frame, start, times in self.trace
+        ]
+
+        with open(path, "w", encoding="utf-8", newline="") as trace_file:
+            if path.lower().endswith(".json"):
+                json.dump([dict(zip(header, row)) for row in rows], trace_file)
+            else:
+                writer = csv.writer(trace_file)
+                writer.writerow(header)
+                writer.writerows(rows)
+
+
+class InputLatency:
+    """times from each press to the end of the present that first shows it
+
+    a press is timed from when it is taken off the event queue, and the
+    present returning is taken as the photon, so the time in SDL's queue
+    and the display's own delay aren't counted. presses that change
+    nothing on screen, like ones between buttons, aren't timed
+    """
+
+    PERCENTILES = (50, 95, 99, 100)
+
+    def __init__(self, history: int = 1000) -> None:
+        """sets up the timing, nothing is timed until a press is recorded
+
+        Args:
+            history: how many of the latest presses the percentiles are taken over
+        """
+        self.latencies = deque(maxlen=history)
+        self.press_count = 0
+        self._pressed_at = []
+
+    def press(self, pressed_at: float) -> None:
+        """records a press that will be shown on the next present
+
+        Args:
+            pressed_at: the perf_counter time the press was taken off the queue
+        """
+        self._pressed_at.append(pressed_at)
+
+    def presented(self) -> None:
+        """ends the timing of every press since the last present"""
+        if not self._pressed_at:
+            return
+        now = perf_counter()
+        self.latencies.extend(now - pressed_at for pressed_at in self._pressed_at)
+        self.press_count += len(self._pressed_at)
+        self._pressed_at.clear()
+
+    def get_summary_lines(self) -> list[str]:
+        sorted_values = sorted(self.latencies)
+        return [
+            f"input to photon over the last {len(sorted_values)}"
+            f" of {self.press_count} presses",
+            "ms "
+            + " ".join(
+                f"p{percentile} {get_percentile(sorted_values, percentile) * 1e3:.2f}"
+                for percentile in self.PERCENTILES
+            ),
+        ]
@@ -0,0 +1,241 @@
+import json
+from bisect import bisect_right
+from dataclasses import dataclass
+from itertools import accumulate
+from math import nextafter
+
+# how the liquid window is drawn during a step
+# fill: rises from empty, full: stays full, drain: empties into the spout
+WINDOW_BEHAVIOURS = ("none", "fill", "full", "drain")
+
+
+@dataclass(frozen=True)
+class Step:
+    """a single step of making a drink
+
+    the liquid moves from the start colour to the end colour over the step,
+    through any via colours in between,
+    the stage is the part of the machine the step uses, only one drink can
+    be in each stage at a time. dispensing and serving share the "cup" stage
+    as there is one spout and mug, so a drink isn't poured while the last
+    one is still being served
+    """
+
+    label: str
+    duration: float
+    start_colour: tuple[int, int, int] | None = None
+    end_colour: tuple[int, int, int] | None = None
+    via_colours: tuple[tuple[int, int, int], ...] = ()
+    window: str = "none"
+    spout: bool = False
+    stage: str = "cup"
+
+    @property
+    def colour_stops(self) -> tuple[tuple[int, int, int], ...] | None:
+        """every colour the liquid goes through, None if it has no liquid"""
+        if self.start_colour is None:
+            return None
+        return (self.start_colour, *self.via_colours, self.end_colour)
+
+
+class Recipe:
+    def __init__(self, name: str, steps: list[Step]) -> None:
+        """a drink and the steps to make it
+
+        the steps are compiled into a timeline of end times
+        so the step at any time can be found with a bisect
+
+        Args:
+            name: name of the drink, shown on its button
+            steps: the steps in the order they happen
+        """
+        self.name = name
+        self.steps = steps
+        self.step_ends = list(accumulate(step.duration for step in steps))
+        self.duration = self.step_ends[-1] if self.step_ends else 0.0
+        # the step that pours the drink into the mug, None if it never does
+        self.spout_index = next(
+            (index for index, step in enumerate(steps) if step.spout), None
+        )
+
+    def get_step(self, elapsed: float) -> tuple[int, float]:
+        """finds which step the drink is on
+
+        Args:
+            elapsed: seconds since the drink was started
+
+        Returns:
+            a tuple of the step index and how far through that step it is, 0-1
+            the index is len(steps) once the drink has finished
+        """
+        index = bisect_right(self.step_ends, elapsed)
+        if index >= len(self.steps):
+            return index, 1.0
+
+        step_start = self.step_ends[index - 1] if index > 0 else 0.0
+        return index, (elapsed - step_start) / self.steps[index].duration
+
+
+class RecipeBook:
+    def __init__(self, recipes: list[Recipe]) -> None:
+        """the registry of every drink the machine can make
+
+        Args:
+            recipes: the recipes in the order their buttons are shown
+        """
+        self.recipes = {recipe.name: recipe for recipe in recipes}
+        self.names = [recipe.name for recipe in recipes]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.recipes
+
+    def get(self, name: str) -> Recipe | None:
+        return self.recipes.get(name)
+
+    @classmethod
+    def load(cls, path: str) -> "RecipeBook":
+        """loads the recipes from a json config file
+
+        colours are named once in a "colours" table and referred to by name,
+        a step without an end colour keeps its start colour and a step
+        can go through a list of "via" colours on the way to its end colour
+
+        Args:
+            path: path to the config file
+
+        Raises:
+            ValueError: if a recipe has no steps or a step uses an unknown
+              colour or window behaviour, shows liquid without a colour
+              or has a duration that is not positive
+        """
+        with open(path, encoding="utf-8") as config_file:
+            config = json.load(config_file)
+
+        colours = {name: tuple(rgb) for name, rgb in config["colours"].items()}
+
+        def get_colour(name: str | None) -> tuple[int, int, int] | None:
+            if name is None:
+                return None
+            if name not in colours:
+                raise ValueError(f"unknown colour {name!r} in {path}")
+            return colours[name]
+
+        recipes = []
+        for recipe_config in config["recipes"]:
+            steps = []
+            for step_config in recipe_config["steps"]:
+                window = step_config.get("window", "none")
+                if window not in WINDOW_BEHAVIOURS:
+                    raise ValueError(f"unknown window behaviour {window!r} in {path}")
+                if (window != "none" or step_config.get("spout")) and (
+                    "start" not in step_config
+                ):
+                    raise ValueError(
+                        f"step {step_config['label']!r} in {path} shows liquid"
+                        " so needs a start colour"
+                    )
+                if step_config["duration"] <= 0:
+                    raise ValueError(
+                        f"step {step_config['label']!r} in {path} must have a"
+                        " positive duration"
+                    )
+
+                steps.append(
+                    Step(
+                        label=step_config["label"],
+                        duration=float(step_config["duration"]),
+                        start_colour=get_colour(step_config.get("start")),
+                        end_colour=get_colour(
+                            step_config.get("end", step_config.get("start"))
+                        ),
+                        via_colours=tuple(
+                            get_colour(name) for name in step_config.get("via", [])
+                        ),
+                        window=window,
+                        spout=step_config.get("spout", False),
+                        stage=step_config.get("stage", "cup"),
+                    )
+                )
+            if not steps:
+                raise ValueError(
+                    f"recipe {recipe_config['name']!r} in {path} has no steps"
+                )
+            recipes.append(Recipe(recipe_config["name"], steps))
+
+        return cls(recipes)
+
+
+class Brew:
+    def __init__(self, recipe: Recipe) -> None:
+        """a drink that is being made
+
+        kept separate from drawing so it can be moved on without a screen
+
+        Args:
+            recipe: the recipe for the drink
+        """
+        self.recipe = recipe
+        self.elapsed = 0.0
+        self.previous_elapsed = 0.0
+        self.step_index = 0
+        self.step_amount = 0.0
+        self._set_step_bounds()
+
+    def _set_step_bounds(self) -> None:
+        # kept so most advances only need to compare against the step end
+        if self.finished:
+            self._step_start = self._step_end = self.recipe.duration
+            return
+        self._step_end = self.recipe.step_ends[self.step_index]
+        self._step_start = self._step_end - self.recipe.steps[self.step_index].duration
+
+    @property
+    def finished(self) -> bool:
+        return self.step_index >= len(self.recipe.steps)
+
+    @property
+    def step(self) -> Step | None:
+        """the step currently being done, None once finished"""
+        if self.finished:
+            return None
+        return self.recipe.steps[self.step_index]
+
+    def advance(self, seconds: float, hold_at_step_end: bool = False) -> bool:
+        """moves the drink on
+
+        Args:
+            seconds: how much time has passed
+            hold_at_step_end: stop at the end of the current step
+              rather than moving onto the next, for when the next is not free
+
+        Returns:
+            a bool of if the drink moved onto a different step
+        """
+        self.previous_elapsed = self.elapsed
+        self.elapsed += seconds
+        if hold_at_step_end and self.elapsed >= self._step_end:
+            # the closest time to the end that is still in the step
+            self.elapsed = nextafter(self._step_end, 0)
+        if self._step_start <= self.elapsed < self._step_end:
+            self.step_amount = (self.elapsed - self._step_start) / (
+                self._step_end - self._step_start
+            )
+            return False
+
+        previous_step_index = self.step_index
+        self.step_index, self.step_amount = self.recipe.get_step(self.elapsed)
+        self._set_step_bounds()
+        return self.step_index != previous_step_index
+
+    def interpolate(self, amount: float) -> tuple[int, float]:
+        """finds the step between the last two advances, for drawing
+
+        Args:
+            amount: how far from the previous advance to the latest, 0-1
+
+        Returns:
+            a tuple of the step index and how far through that step it is, 0-1
+        """
+        return self.recipe.get_step(
+            self.previous_elapsed + (self.elapsed - self.previous_elapsed) * amount
+        )
@@ -0,0 +1,384 @@
+"""records what the window showed, for support tickets
+
+frames are copied after they are shown into a ring of frame buffers in
+shared memory, and a separate process compresses them, so the render loop
+never waits on compression. a frame that comes in while the ring is full
+of frames the encoder hasn't got to yet is dropped and counted.
+
+a path ending in .png is saved as one animated png that plays at the speed
+it was recorded, any other path is made a directory of frame_000000.png
+files with times.csv holding when each was captured. both are written with
+zlib so nothing beyond numpy is needed
+"""
+
+import multiprocessing
+import os
+import struct
+import zlib
+from multiprocessing import shared_memory
+from time import perf_counter
+
+import numpy as np
+import pygame
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# frames are kept in the byte order of a 32 bit window surface
+# on little endian machines, so copying one in is a straight copy
+PIXEL_FORMAT = "BGRA"
+# the frames start this far into the shared memory, after the slot states
+FRAMES_OFFSET = 64
+
+
+def write_chunk(file, chunk_type: bytes, data: bytes) -> None:
+    file.write(struct.pack(">I", len(data)))
+    file.write(chunk_type)
+    file.write(data)
+    file.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(chunk_type))))
+
+
+def compress_frame(rgb: np.ndarray, level: int) -> bytes:
+    """compresses a frame into png image data
+
+    every row is stored as its difference from the row above (png's "up"
+    filter), which turns the flat colours of the app into runs of zeros
+
+    Args:
+        rgb: the frame as a height x width x 3 array
+        level: the zlib compression level, 0-9
+
+    Returns:
+        the zlib stream for the png's image data chunks
+    """
+    height, width, _ = rgb.shape
+    rows = rgb.reshape(height, width * 3)
+    filtered = np.empty((height, width * 3 + 1), np.uint8)
+    filtered[:, 0] = 2
+    filtered[0, 1:] = rows[0]
+    np.subtract(rows[1:], rows[:-1], out=filtered[1:, 1:])
+    return zlib.compress(filtered.tobytes(), level)
+
+
+def get_header(size: tuple[int, int]) -> bytes:
+    width, height = size
+    # 8 bit rgb, no interlacing
+    return struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+
+
+class PngSequenceWriter:
+    def __init__(self, path: str, size: tuple[int, int], level: int) -> None:
+        """saves each frame as its own png in a directory
+
+        Args:
+            path: the directory, made if it doesn't exist
+            size: the size of the frames
+            level: the zlib compression level, 0-9
+        """
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.header = get_header(size)
+        self.level = level
+        self.frame_count = 0
+        self.times_file = open(os.path.join(path, "times.csv"), "w", encoding="utf-8")
+        self.times_file.write("frame,seconds\n")
+
+    def add_frame(self, rgb: np.ndarray, seconds: float) -> None:
+        frame_path = os.path.join(self.path, f"frame_{self.frame_count:06d}.png")
+        with open(frame_path, "wb") as frame_file:
+            frame_file.write(PNG_SIGNATURE)
+            write_chunk(frame_file, b"IHDR", self.header)
+            write_chunk(frame_file, b"IDAT", compress_frame(rgb, self.level))
+            write_chunk(frame_file, b"IEND", b"")
+        self.times_file.write(f"{self.frame_count},{seconds:.4f}\n")
+        self.frame_count += 1
+
+    def close(self) -> None:
+        self.times_file.close()
+
+
+class AnimatedPngWriter:
+    def __init__(self, path: str, size: tuple[int, int], level: int) -> None:
+        """saves the frames as one animated png, which browsers play
+
+        each frame is held until the next was captured, so it plays
+        at the speed it was recorded, pauses included
+
+        Args:
+            path: the file to save to
+            size: the size of the frames
+            level: the zlib compression level, 0-9
+        """
+        self.size = size
+        self.level = level
+        self.frame_count = 0
+        # png chunks are numbered across the frame controls and frame data
+        self.sequence = 0
+        # a frame is written once the next arrives, as that gives its delay
+        self._pending = None
+
+        self.file = open(path, "wb")
+        self.file.write(PNG_SIGNATURE)
+        write_chunk(self.file, b"IHDR", get_header(size))
+        # the frame count is filled in on close
+        self._animation_control_at = self.file.tell()
+        write_chunk(self.file, b"acTL", struct.pack(">II", 0, 0))
+
+    def add_frame(self, rgb: np.ndarray, seconds: float) -> None:
+        if self._pending is not None:
+            data, previous_seconds = self._pending
+            self._write_frame(data, seconds - previous_seconds)
+        self._pending = (compress_frame(rgb, self.level), seconds)
+
+    def _write_frame(self, data: bytes, delay: float) -> None:
+        width, height = self.size
+        write_chunk(
+            self.file,
+            b"fcTL",
+            struct.pack(
+                ">IIIIIHHBB",
+                self.sequence,
+                width,
+                height,
+                0,
+                0,
+                # in milliseconds
+                min(max(round(delay * 1000), 1), 65535),
+                1000,
+                0,
+                0,
+            ),
+        )
+        self.sequence += 1
+        if self.frame_count == 0:
+            write_chunk(self.file, b"IDAT", data)
+        else:
+            write_chunk(self.file, b"fdAT", struct.pack(">I", self.sequence) + data)
+            self.sequence += 1
+        self.frame_count += 1
+
+    def close(self) -> None:
+        if self._pending is not None:
+            self._write_frame(self._pending[0], 1.0)
+        write_chunk(self.file, b"IEND", b"")
+        self.file.seek(self._animation_control_at)
+        write_chunk(self.file, b"acTL", struct.pack(">II", self.frame_count, 0))
+        self.file.close()
+
+
+def encode_frames(
+    memory_name: str,
+    slot_count: int,
+    size: tuple[int, int],
+    ready: multiprocessing.Queue,
+    path: str,
+    level: int,
+) -> int:
+    """takes frames off the ring and saves them until told to stop
+
+    run in the encoder process. each slot is handed back as soon as its
+    frame has been copied out, before it is compressed
+
+    Args:
+        memory_name: the shared memory the ring is in
+        slot_count: how many frames the ring holds
+        size: the size of the frames
+        ready: gets (slot, seconds since recording started) for each frame,
+          then None to stop
+        path: where to save, see the module docstring
+        level: the zlib compression level, 0-9
+
+    Returns:
+        how many frames were saved
+    """
+    memory = shared_memory.SharedMemory(memory_name)
+    width, height = size
+    states = np.ndarray((slot_count,), np.uint8, memory.buf)
+    frames = np.ndarray(
+        (slot_count, height, width, 4), np.uint8, memory.buf, FRAMES_OFFSET
+    )
+
+    writer_class = (
+        AnimatedPngWriter if path.lower().endswith(".png") else PngSequenceWriter
+    )
+    writer = writer_class(path, size, level)
+    while (item := ready.get()) is not None:
+        slot, seconds = item
+        # BGRA to RGB
+        rgb = np.ascontiguousarray(frames[slot, :, :, 2::-1])
+        states[slot] = 0
+        writer.add_frame(rgb, seconds)
+    writer.close()
+
+    del states, frames
+    memory.close()
+    return writer.frame_count
+
+
+def check_path(path: str) -> None:
+    """checks a recording can be saved to a path, before anything is recorded
+
+    Raises:
+        OSError: if the directory it goes in doesn't exist or can't be written to
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(directory):
+        raise OSError(f"{directory} doesn't exist")
+    if not os.access(directory, os.W_OK):
+        raise OSError(f"{directory} can't be written to")
+
+
+class ScreenRecorder:
+    def __init__(
+        self,
+        path: str,
+        window_size: tuple[int, int],
+        frame_rate: float = 10,
+        scale: float = 0.5,
+        slot_count: int = 32,
+        level: int = 6,
+    ) -> None:
+        """copies shown frames into shared memory for an encoder process to save
+
+        every frame buffer is made up front, each a surface over its part of
+        the shared memory, so capturing is one scaled copy with nothing made.
+        frames are scaled with nearest neighbour, as smoothing costs several
+        milliseconds a frame. the size is fixed when recording starts,
+        frames after a resize are stretched to it
+
+        Args:
+            path: where to save, see the module docstring
+            window_size: the size of the window when recording starts
+            frame_rate: the most frames captured each second
+            scale: the size of the saved frames compared to the window
+            slot_count: how many frames can be waiting for the encoder
+            level: the zlib compression level, 0-9
+
+        Raises:
+            OSError: if the recording can't be saved to path
+        """
+        check_path(path)
+        self.path = path
+        self.frame_rate = frame_rate
+        self.size = (
+            max(round(window_size[0] * scale), 1),
+            max(round(window_size[1] * scale), 1),
+        )
+        self.slot_count = slot_count
+        self.captured = 0
+        self.dropped = 0
+        # why the recording failed, None unless the encoder stopped early
+        self.failure = None
+
+        width, height = self.size
+        frame_length = width * height * 4
+        self._memory = shared_memory.SharedMemory(
+            create=True, size=FRAMES_OFFSET + slot_count * frame_length
+        )
+        # 1 while a slot holds a frame the encoder hasn't copied out
+        self._states = np.ndarray((slot_count,), np.uint8, self._memory.buf)
+        self._states[:] = 0
+        self._slots = []
+        for slot in range(slot_count):
+            start = FRAMES_OFFSET + slot * frame_length
+            surface = pygame.image.frombuffer(
+                self._memory.buf[start : start + frame_length], self.size, PIXEL_FORMAT
+            )
+            # copied rather than blended, the alpha is ignored when saving
+            surface.set_alpha(None)
+            self._slots.append(surface)
+        self._next_slot = 0
+
+        context = multiprocessing.get_context("spawn")
+        self._ready = context.Queue()
+        # spawned rather than forked so it doesn't share the window
+        self._encoder = context.Process(
+            target=encode_frames,
+            args=(
+                self._memory.name,
+                slot_count,
+                self.size,
+                self._ready,
+                path,
+                level,
+            ),
+            name="screen recorder",
+            daemon=True,
+        )
+        self._encoder.start()
+
+        self._start_time = perf_counter()
+        self._next_capture = self._start_time
+
+    @property
+    def capture_due(self) -> bool:
+        """if the next frame shown would be captured, so renderers that
+        have to read frames back only do so for the frames that are kept"""
+        return self.failure is None and perf_counter() >= self._next_capture
+
+    def capture(self, frame: pygame.Surface | None) -> bool:
+        """copies a shown frame into the ring if one is due
+
+        Args:
+            frame: what the window is showing, from the renderer's get_frame
+
+        Returns:
+            a bool of if the frame was captured
+        """
+        now = perf_counter()
+        if frame is None or now < self._next_capture or self.failure is not None:
+            return False
+        # kept to a fixed cadence, unless frames stopped for a while
+        self._next_capture += 1 / self.frame_rate
+        if self._next_capture <= now:
+            self._next_capture = now + 1 / self.frame_rate
+
+        # a frame handed to an encoder that has stopped would never be saved
+        if not self._encoder.is_alive():
+            self.failure = (
+                f"the encoder stopped with exit code {self._encoder.exitcode}"
+            )
+            return False
+
+        slot = self._next_slot
+        if self._states[slot]:
+            self.dropped += 1
+            return False
+
+        if frame.get_size() == self.size:
+            self._slots[slot].blit(frame, (0, 0))
+        else:
+            pygame.transform.scale(frame, self.size, self._slots[slot])
+        self._states[slot] = 1
+        self._ready.put((slot, now - self._start_time))
+        self._next_slot = (slot + 1) % self.slot_count
+        self.captured += 1
+        return True
+
+    def close(self) -> None:
+        """waits for the encoder to save every frame captured, then frees the ring"""
+        self._ready.put(None)
+        self._encoder.join()
+        if self._encoder.exitcode != 0 and self.failure is None:
+            self.failure = (
+                f"the encoder stopped with exit code {self._encoder.exitcode}"
+            )
+        if self.failure is not None:
+            # nothing will read what is left on the queue
+            self._ready.cancel_join_thread()
+        self._ready.close()
+        # the surfaces hold views of the memory, which must go before it closes
+        self._slots.clear()
+        del self._states
+        self._memory.close()
+        self._memory.unlink()
+
+    def get_summary(self) -> str:
+        if self.failure is not None:
+            return (
+                f"recording to {self.path} failed, {self.failure},"
+                f" the {self.captured} frames captured may not have been saved"
+            )
+        return (
+            f"recorded {self.captured} frames at {self.size[0]}x{self.size[1]}"
+            f" to {self.path}, dropped {self.dropped}"
+            " while the encoder was behind"
+        )
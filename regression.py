@@ -0,0 +1,450 @@
+"""replays scripted orders offscreen to catch changes in what is drawn and how fast
+
+run with: python regression.py [--update]
+each scenario is played a fixed step at a time through the dummy video
+driver and chosen frames are hashed and checked against regression_golden.json.
+then draw_machine, draw_button and get_drink_button_pressed are timed in
+rounds, giving the same statistics as pytest-benchmark. exits with 1 if a
+frame doesn't match or, with --benchmark-compare, a function got slower.
+
+frames are drawn with pygame's bundled font so the hashes don't depend on
+the fonts installed, but they can change between versions of pygame
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+from time import perf_counter
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import numpy as np
+import pygame
+
+from benchmark import load_app
+
+GOLDEN_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "regression_golden.json"
+)
+BACKGROUND_COLOUR = (255, 255, 255)
+STEPS_PER_SECOND = 60
+
+# inputs are (frame, "click", (x, y) as a proportion of the window),
+# (frame, "order", an order API request) or (frame, "resize", (width, height))
+SCENARIOS = {
+    "one machine": {
+        "size": (1600, 900),
+        "machines": 1,
+        "frames": 2400,
+        "inputs": [
+            (1, "click", (0.15, 0.3)),
+            (2, "click", (0.4, 0.3)),
+            # between two buttons, then an empty button
+            (3, "click", (0.3, 0.3)),
+            (4, "click", (0.4, 0.47)),
+        ],
+        # 630 is part way through pouring the first drink
+        "checkpoints": [0, 1, 30, 120, 300, 600, 630, 900, 1200, 1800, 2399],
+    },
+    "four machines": {
+        "size": (1600, 900),
+        "machines": 4,
+        "frames": 1800,
+        "inputs": [
+            (1, "order", {"drink": "Coffee"}),
+            (1, "order", {"drink": "Chocolate"}),
+            (10, "order", {"drink": "Lemon Tea", "machine": 3}),
+            (10, "click", (0.15, 0.47)),
+            (200, "order", {"drink": "Chocolate", "machine": 0}),
+        ],
+        "checkpoints": [0, 10, 100, 400, 800, 1200, 1799],
+    },
+    "small window": {
+        "size": (800, 450),
+        "machines": 1,
+        "frames": 1200,
+        "inputs": [(5, "click", (0.15, 0.47))],
+        "checkpoints": [0, 5, 240, 600, 1199],
+    },
+    "resized": {
+        "size": (1600, 900),
+        "machines": 2,
+        "frames": 900,
+        "inputs": [
+            (1, "order", {"drink": "Chocolate"}),
+            (200, "resize", (1024, 768)),
+            (400, "resize", (3840, 2160)),
+            (410, "order", {"drink": "Lemon Tea"}),
+        ],
+        "checkpoints": [199, 200, 300, 400, 600, 899],
+    },
+}
+
+
+def hash_surface(surface: pygame.Surface) -> str:
+    return hashlib.sha256(pygame.image.tobytes(surface, "RGB")).hexdigest()
+
+
+def replay(
+    app, recipe_book, scenario: dict, font_path: str, sprite_baker=None
+) -> dict[int, pygame.Surface]:
+    """plays a scenario the way main() would, one simulation step per frame
+
+    Args:
+        app: the app module
+        recipe_book: the recipes to order from
+        scenario: one of SCENARIOS
+        font_path: the font to draw with
+        sprite_baker: if given brews are drawn from sheets it has baked,
+          which are baked before they are needed so every frame uses them
+
+    Returns:
+        a dict of each checkpoint frame to a copy of what was drawn
+    """
+    utilities = app.Utilities(recipe_book, font_path)
+    utilities.MACHINE_COUNT = scenario["machines"]
+    utilities.sprite_baker = sprite_baker
+    # seeded the same way as main() so the pours are the same every run
+    machines = [
+        app.Machine(
+            recipe_book,
+            machine_index=machine_index,
+            pour=app.ParticlePour(seed=machine_index),
+        )
+        for machine_index in range(scenario["machines"])
+    ]
+    inputs = {}
+    for frame, kind, value in scenario["inputs"]:
+        inputs.setdefault(frame, []).append((kind, value))
+    checkpoints = set(scenario["checkpoints"])
+
+    size = scenario["size"]
+    renderer = None
+    frames = {}
+    for frame in range(scenario["frames"]):
+        for kind, value in inputs.get(frame, []):
+            if kind == "resize":
+                size = value
+                renderer = None
+            elif kind == "order":
+                app.handle_api_request({"type": "order", **value}, machines)
+            elif kind == "click":
+                position = (int(value[0] * size[0]), int(value[1] * size[1]))
+                button_index = utilities.get_layout(size).hit_index.get_button(position)
+                machine = min(machines, key=lambda machine: len(machine.pipeline))
+                if not machine.full and 0 <= button_index < len(recipe_book.names):
+                    machine.order_drink(recipe_book.names[button_index])
+
+        full_redraw = renderer is None
+        if full_redraw and sprite_baker is not None:
+            utilities.bake_sprites(size)
+            sprite_baker.wait()
+        if full_redraw:
+            renderer = app.SoftwareRenderer(pygame.Surface(size))
+            renderer.set_static_layer(
+                utilities.build_static_layer(size, BACKGROUND_COLOUR, recipe_book.names)
+            )
+
+        for machine in machines:
+            machine.update_drink(1 / STEPS_PER_SECOND)
+        utilities.draw_machines(renderer, machines, 1, full_redraw)
+
+        if frame in checkpoints:
+            frames[frame] = renderer.surface.copy()
+    return frames
+
+
+def get_difference(surface: pygame.Surface, other: pygame.Surface) -> float:
+    """gets the fraction of pixels that are different between two surfaces"""
+    different = np.any(
+        pygame.surfarray.pixels3d(surface) != pygame.surfarray.pixels3d(other), axis=2
+    )
+    return float(np.count_nonzero(different)) / different.size
+
+
+def get_stats(times: list[float]) -> dict[str, float]:
+    """works out the statistics pytest-benchmark gives for a list of timings
+
+    Args:
+        times: the seconds each round took per call
+
+    Returns:
+        a dict of min, max, mean, stddev, median, iqr, outliers, ops and rounds.
+        outliers are written "a;b", a being rounds over a standard deviation
+        from the mean and b rounds over 1.5 IQR outside of the quartiles
+    """
+    mean = statistics.fmean(times)
+    stddev = statistics.stdev(times) if len(times) > 1 else 0.0
+    if len(times) > 1:
+        first_quartile, _, third_quartile = statistics.quantiles(times, n=4)
+    else:
+        first_quartile = third_quartile = times[0]
+    iqr = third_quartile - first_quartile
+    stddev_outliers = sum(abs(time - mean) > stddev for time in times)
+    iqr_outliers = sum(
+        time < first_quartile - 1.5 * iqr or time > third_quartile + 1.5 * iqr
+        for time in times
+    )
+    return {
+        "min": min(times),
+        "max": max(times),
+        "mean": mean,
+        "stddev": stddev,
+        "median": statistics.median(times),
+        "iqr": iqr,
+        "outliers": f"{stddev_outliers};{iqr_outliers}",
+        "ops": 1 / mean,
+        "rounds": len(times),
+    }
+
+
+def time_rounds(function, rounds: int, min_round_time: float = 1e-4) -> list[float]:
+    """times a function in rounds, like pytest-benchmark
+
+    calls are repeated within a round until it takes at least min_round_time,
+    so functions far quicker than the timer can still be timed
+
+    Returns:
+        the seconds per call in each round
+    """
+    iterations = 1
+    while True:
+        start = perf_counter()
+        for _ in range(iterations):
+            function()
+        if perf_counter() - start >= min_round_time:
+            break
+        iterations *= 2
+
+    times = []
+    for _ in range(rounds):
+        start = perf_counter()
+        for _ in range(iterations):
+            function()
+        times.append((perf_counter() - start) / iterations)
+    return times
+
+
+def run_benchmarks(app, recipe_book, font_path: str, rounds: int) -> dict[str, dict]:
+    """times the drawing and hit test functions at the default window size
+
+    Returns:
+        a dict of each function's name to its statistics
+    """
+    size = (1600, 900)
+    utilities = app.Utilities(recipe_book, font_path)
+    renderer = app.SoftwareRenderer(pygame.Surface(size))
+    renderer.set_static_layer(
+        utilities.build_static_layer(size, BACKGROUND_COLOUR, recipe_book.names)
+    )
+
+    machine = app.Machine(recipe_book)
+    machine.order_drink("Chocolate")
+    machine.update_drink(5)
+
+    button_count = utilities.BUTTON_ROWS * utilities.BUTTONS_PER_ROW
+    button_names = recipe_book.names + [""] * button_count
+    button_indexes = itertools.count()
+
+    def draw_button() -> None:
+        button_index = next(button_indexes) % button_count
+        utilities.draw_button(button_index, renderer, button_names[button_index])
+
+    random.seed(0)
+    positions = [(random.random(), random.random()) for _ in range(1024)]
+    position_indexes = itertools.count()
+
+    def get_drink_button_pressed() -> None:
+        utilities.get_drink_button_pressed(positions[next(position_indexes) % 1024])
+
+    functions = {
+        "draw_machine": lambda: utilities.draw_machine(renderer, machine),
+        "draw_machines": lambda: utilities.draw_machines(renderer, [machine]),
+        "draw_button": draw_button,
+        "get_drink_button_pressed": get_drink_button_pressed,
+    }
+    return {
+        name: get_stats(time_rounds(function, rounds))
+        for name, function in functions.items()
+    }
+
+
+def print_benchmarks(results: dict[str, dict]) -> None:
+    columns = ("min", "max", "mean", "stddev", "median", "iqr")
+    print(
+        f"{'name (us)':<26}"
+        + "".join(f"{column:>10}" for column in columns)
+        + f"{'outliers':>10}{'OPS':>12}{'rounds':>8}"
+    )
+    for name, stats in results.items():
+        print(
+            f"{name:<26}"
+            + "".join(f"{stats[column] * 1e6:10.2f}" for column in columns)
+            + f"{stats['outliers']:>10}{stats['ops']:12.1f}{stats['rounds']:8}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--update", action="store_true", help="record the frames as the new golden"
+    )
+    parser.add_argument("--golden", default=GOLDEN_PATH, metavar="PATH")
+    parser.add_argument(
+        "--scenario", nargs="+", choices=SCENARIOS, help="defaults to all of them"
+    )
+    parser.add_argument(
+        "--save-frames",
+        metavar="DIR",
+        help="save frames that don't match as png, or every frame with --update",
+    )
+    parser.add_argument(
+        "--bake",
+        action="store_true",
+        help="also replay drawing the brews from baked sprite sheets"
+        " and check they match drawing them live",
+    )
+    parser.add_argument(
+        "--bake-tolerance",
+        type=float,
+        default=0.01,
+        help="the largest fraction of pixels a baked frame can differ by",
+    )
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--skip-benchmarks", action="store_true")
+    parser.add_argument(
+        "--benchmark-save", metavar="PATH", help="save the timings as json"
+    )
+    parser.add_argument(
+        "--benchmark-compare",
+        metavar="PATH",
+        help="fail if a median is more than --max-slowdown slower than in this save",
+    )
+    parser.add_argument("--max-slowdown", type=float, default=0.25)
+    arguments = parser.parse_args()
+    if arguments.rounds < 1:
+        parser.error("--rounds must be at least 1")
+
+    app = load_app()
+    pygame.init()
+    recipe_book = app.RecipeBook.load(app.RECIPES_PATH)
+    font_path = os.path.join(
+        os.path.dirname(pygame.__file__), pygame.font.get_default_font()
+    )
+
+    golden = {"pygame": pygame.version.ver, "scenarios": {}}
+    if os.path.exists(arguments.golden):
+        with open(arguments.golden, encoding="utf-8") as golden_file:
+            golden = json.load(golden_file)
+    if not arguments.update and golden["pygame"] != pygame.version.ver:
+        print(
+            f"the golden frames were drawn with pygame {golden['pygame']},"
+            f" not {pygame.version.ver}, so some may not match"
+        )
+
+    sprite_baker = None
+    if arguments.bake:
+        sprite_cache = tempfile.TemporaryDirectory()
+        # every size is baked for straight away, as wait is called after
+        sprite_baker = app.SpriteBaker(
+            app.__file__,
+            BACKGROUND_COLOUR,
+            font_path,
+            sprite_cache.name,
+            settle_seconds=0,
+        )
+
+    failed = False
+    for name in arguments.scenario or SCENARIOS:
+        start = perf_counter()
+        frames = replay(app, recipe_book, SCENARIOS[name], font_path)
+        hashes = {
+            str(frame): hash_surface(surface) for frame, surface in frames.items()
+        }
+        golden_hashes = golden["scenarios"].get(name, {})
+
+        if arguments.update:
+            golden["scenarios"][name] = hashes
+            mismatched = list(hashes)
+        else:
+            mismatched = [
+                frame for frame in hashes if golden_hashes.get(frame) != hashes[frame]
+            ]
+            failed = failed or bool(mismatched)
+        print(
+            f"{name}: {len(hashes)} frames"
+            + ("" if arguments.update else f", {len(mismatched)} don't match")
+            + f" ({perf_counter() - start:.2f}s)"
+        )
+
+        if sprite_baker is not None:
+            # sheets are drawn at exact frame times while live drawing adds
+            # up float steps, so an edge can be a pixel or a frame out
+            baked_frames = replay(
+                app, recipe_book, SCENARIOS[name], font_path, sprite_baker
+            )
+            differences = {
+                frame: get_difference(frames[frame], baked_frames[frame])
+                for frame in frames
+            }
+            over_tolerance = [
+                frame
+                for frame, difference in differences.items()
+                if difference > arguments.bake_tolerance
+            ]
+            failed = failed or bool(over_tolerance)
+            print(
+                f"    baked: {len(over_tolerance)} frames over tolerance,"
+                f" at most {max(differences.values()):.2%} of pixels differ"
+            )
+
+        if arguments.save_frames:
+            os.makedirs(arguments.save_frames, exist_ok=True)
+            for frame in mismatched:
+                pygame.image.save(
+                    frames[int(frame)],
+                    os.path.join(
+                        arguments.save_frames,
+                        f"{name.replace(' ', '_')}_{int(frame):05}.png",
+                    ),
+                )
+
+    if sprite_baker is not None:
+        sprite_baker.close()
+        sprite_cache.cleanup()
+
+    if arguments.update:
+        golden["pygame"] = pygame.version.ver
+        with open(arguments.golden, "w", encoding="utf-8") as golden_file:
+            json.dump(golden, golden_file, indent=4)
+            golden_file.write("\n")
+
+    if not arguments.skip_benchmarks:
+        results = run_benchmarks(app, recipe_book, font_path, arguments.rounds)
+        print_benchmarks(results)
+
+        if arguments.benchmark_save:
+            with open(arguments.benchmark_save, "w", encoding="utf-8") as save_file:
+                json.dump(results, save_file, indent=4)
+
+        if arguments.benchmark_compare:
+            with open(arguments.benchmark_compare, encoding="utf-8") as save_file:
+                saved = json.load(save_file)
+            for name, stats in results.items():
+                if name not in saved:
+                    continue
+                slowdown = stats["median"] / saved[name]["median"] - 1
+                if slowdown > arguments.max_slowdown:
+                    print(f"{name} is {slowdown:.0%} slower than before")
+                    failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,414 @@
+"""the ways a frame can be drawn to the window
+
+every backend has the same methods so Utilities can draw with any of them:
+    software: draws on the window surface and updates only what changed
+    texture: draws with an SDL renderer, keeping surfaces as textures
+    null: draws nothing, for timing everything but the drawing
+"""
+
+import numpy as np
+import pygame
+from pygame._sdl2 import video
+
+from caches import LRUCache
+from gradients import fill_vertical_gradient
+
+
+def draw_points(
+    surface: pygame.Surface,
+    colour: tuple[int, ...],
+    xs: np.ndarray,
+    ys: np.ndarray,
+    size: int,
+    clip: pygame.Rect,
+) -> None:
+    """draws a square at every position by writing straight into the pixels
+
+    one numpy assignment for each pixel of the square rather than a draw
+    call for each point, so thousands of points cost about as much as a few
+
+    Args:
+        surface: a 32 bit surface to draw on
+        colour: colour of the squares
+        xs: the left of each square
+        ys: the top of each square
+        size: the width of the squares in pixels
+        clip: squares not wholly inside this are left out
+    """
+    clip = clip.clip(surface.get_rect())
+    xs = xs.astype(np.intp)
+    ys = ys.astype(np.intp)
+    inside = (
+        (xs >= clip.left)
+        & (xs <= clip.right - size)
+        & (ys >= clip.top)
+        & (ys <= clip.bottom - size)
+    )
+    xs = xs[inside]
+    ys = ys[inside]
+    if len(xs) == 0:
+        return
+
+    pixels = pygame.surfarray.pixels2d(surface)
+    # map_rgb gives a signed int, which is negative with alpha set
+    mapped_colour = surface.map_rgb(colour) & 0xFFFFFFFF
+    for offset_x in range(size):
+        for offset_y in range(size):
+            pixels[xs + offset_x, ys + offset_y] = mapped_colour
+    # the surface stays locked until the array is gone
+    del pixels
+
+
+class SoftwareRenderer:
+    # the window keeps the last frame so only what changed needs drawing
+    keeps_frame = True
+    # the frame can always be read from the window surface
+    read_frames = False
+
+    def __init__(self, surface: pygame.Surface) -> None:
+        """draws with pygame's software drawing onto a surface
+
+        Args:
+            surface: the window surface, or any surface to draw offscreen
+        """
+        self.surface = surface
+        self.static_layer = None
+
+    @classmethod
+    def open_window(cls, size: tuple[int, int], caption: str) -> "SoftwareRenderer":
+        surface = pygame.display.set_mode(size, pygame.RESIZABLE)
+        pygame.display.set_caption(caption)
+        return cls(surface)
+
+    def get_size(self) -> tuple[int, int]:
+        return self.surface.get_size()
+
+    def set_static_layer(self, static_layer: pygame.Surface) -> None:
+        """sets what is drawn underneath everything and draws all of it"""
+        self.static_layer = static_layer
+        self.surface.blit(static_layer, (0, 0))
+
+    def restore(self, rect: pygame.Rect) -> None:
+        """draws the static layer back over an area"""
+        self.surface.blit(self.static_layer, rect, rect)
+
+    def fill(self, colour: tuple[int, int, int], rect: pygame.Rect) -> None:
+        self.surface.fill(colour, rect)
+
+    def draw_rect(
+        self, colour: tuple[int, int, int], rect: pygame.Rect, border_radius: int = 0
+    ) -> None:
+        pygame.draw.rect(self.surface, colour, rect, border_radius=border_radius)
+
+    def fill_vertical_gradient(
+        self, rect: pygame.Rect, colour: np.ndarray, shading: np.ndarray
+    ) -> None:
+        fill_vertical_gradient(self.surface, rect, colour, shading)
+
+    def blit(self, source: pygame.Surface, position: tuple[float, float]) -> None:
+        self.surface.blit(source, position)
+
+    def blit_changing(
+        self, source: pygame.Surface, position: tuple[float, float]
+    ) -> None:
+        """draws a surface that is drawn on again between frames, like the HUD"""
+        self.surface.blit(source, position)
+
+    def draw_points(
+        self,
+        colour: tuple[int, int, int],
+        xs: np.ndarray,
+        ys: np.ndarray,
+        size: int,
+        clip: pygame.Rect,
+    ) -> None:
+        """draws a square at every position at once, for particles
+
+        Args:
+            colour: colour of the squares
+            xs: the left of each square
+            ys: the top of each square
+            size: the width of the squares in pixels
+            clip: squares not wholly inside this are left out
+        """
+        draw_points(self.surface, colour, xs, ys, size, clip)
+
+    def present(self, dirty_rects: list[pygame.Rect] | None = None) -> None:
+        """shows the frame in the window
+
+        Args:
+            dirty_rects: the areas that changed, None if everything did
+        """
+        if dirty_rects is None:
+            pygame.display.flip()
+        else:
+            pygame.display.update(dirty_rects)
+
+    def get_frame(self) -> pygame.Surface:
+        """gets the frame last shown, which must not be drawn on"""
+        return self.surface
+
+
+class TextureRenderer:
+    # the frame is drawn from scratch each time as the
+    # back buffer is not kept between presents
+    keeps_frame = False
+
+    def __init__(self, window: video.Window) -> None:
+        """draws with an SDL renderer, which is hardware accelerated where it can be
+
+        surfaces are turned into textures the first time they are drawn and
+        kept, so the static layer and words are only uploaded once.
+        fills are held until the frame is shown and then done together for
+        each colour, the animated parts never overlap so this doesn't change
+        what is drawn
+
+        Args:
+            window: the window to draw in
+        """
+        self.window = window
+        self.renderer = video.Renderer(window)
+        self.static_texture = None
+        self.texture_cache = LRUCache(512)
+        self.gradient_cache = LRUCache(256)
+        # a surface the points are drawn on and a texture it is copied to,
+        # kept for each rect points are drawn in
+        self.points_cache = LRUCache(64)
+        # a streaming texture for each place a changing surface is drawn
+        self.changing_cache = LRUCache(16)
+
+        self._fills = {}
+        self._blits = []
+        # set before present to copy that frame back from the renderer for
+        # get_frame, which waits for the graphics card so is only set
+        # on frames the recorder is going to keep
+        self.read_frames = False
+        self._frame_surface = None
+
+    @classmethod
+    def open_window(cls, size: tuple[int, int], caption: str) -> "TextureRenderer":
+        return cls(video.Window(caption, size, resizable=True))
+
+    def get_size(self) -> tuple[int, int]:
+        return self.window.size
+
+    def get_texture(self, source: pygame.Surface) -> video.Texture:
+        """gets the texture for a surface, making it only if not cached
+
+        surfaces are cached by identity so must not be drawn on after
+        being drawn with this renderer
+        """
+        texture = self.texture_cache.get(source)
+        if texture is None:
+            texture = video.Texture.from_surface(self.renderer, source)
+            self.texture_cache.put(source, texture)
+        return texture
+
+    def set_static_layer(self, static_layer: pygame.Surface) -> None:
+        self.static_texture = video.Texture.from_surface(self.renderer, static_layer)
+
+    def restore(self, rect: pygame.Rect) -> None:
+        # the static layer is drawn under every frame anyway
+        pass
+
+    def fill(self, colour: tuple[int, int, int], rect: pygame.Rect) -> None:
+        # liquid colours are numpy arrays, which SDL won't take as a draw colour
+        key = tuple(int(channel) for channel in colour)
+        self._fills.setdefault(key, []).append(pygame.Rect(rect))
+
+    def draw_rect(
+        self, colour: tuple[int, int, int], rect: pygame.Rect, border_radius: int = 0
+    ) -> None:
+        # rounded corners are only used on the buttons, which are in the static layer
+        self.fill(colour, rect)
+
+    def fill_vertical_gradient(
+        self, rect: pygame.Rect, colour: np.ndarray, shading: np.ndarray
+    ) -> None:
+        """draws a gradient by stretching a one pixel wide texture of it
+
+        the texture is lined up with the bottom of the rect like
+        gradients.fill_vertical_gradient
+        """
+        height = min(rect.height, len(shading))
+        if rect.width <= 0 or height <= 0:
+            return
+
+        # the shading only depends on its height and how dark the bottom is
+        key = (tuple(colour), len(shading), float(shading[-1]))
+        texture = self.gradient_cache.get(key)
+        if texture is None:
+            column = np.multiply.outer(shading, colour).astype(np.uint8)
+            texture = video.Texture.from_surface(
+                self.renderer, pygame.surfarray.make_surface(column[np.newaxis])
+            )
+            self.gradient_cache.put(key, texture)
+
+        self._blits.append(
+            (
+                texture,
+                pygame.Rect(rect.left, rect.bottom - height, rect.width, height),
+                pygame.Rect(0, len(shading) - height, 1, height),
+            )
+        )
+
+    def blit(self, source: pygame.Surface, position: tuple[float, float]) -> None:
+        self._blits.append(
+            (
+                self.get_texture(source),
+                pygame.Rect(position, source.get_size()),
+                None,
+            )
+        )
+
+    def blit_changing(
+        self, source: pygame.Surface, position: tuple[float, float]
+    ) -> None:
+        """copies a surface that is drawn on again between frames into a
+        streaming texture, so it doesn't fill texture_cache with a texture
+        for every frame and push the words out"""
+        rect = pygame.Rect(position, source.get_size())
+        key = tuple(rect)
+        texture = self.changing_cache.get(key)
+        if texture is None:
+            texture = video.Texture(self.renderer, rect.size, streaming=True)
+            self.changing_cache.put(key, texture)
+        texture.update(source)
+        self._blits.append((texture, rect, None))
+
+    def draw_points(
+        self,
+        colour: tuple[int, int, int],
+        xs: np.ndarray,
+        ys: np.ndarray,
+        size: int,
+        clip: pygame.Rect,
+    ) -> None:
+        """draws the points onto a transparent surface the size of the clip
+        and copies it to a streaming texture, rather than a call for each"""
+        key = tuple(clip)
+        cached = self.points_cache.get(key)
+        if cached is None:
+            surface = pygame.Surface(clip.size, pygame.SRCALPHA, 32)
+            texture = video.Texture(self.renderer, clip.size, streaming=True)
+            texture.blend_mode = pygame.BLENDMODE_BLEND
+            cached = (surface, texture)
+            self.points_cache.put(key, cached)
+        surface, texture = cached
+
+        surface.fill((0, 0, 0, 0))
+        draw_points(
+            surface,
+            (*colour, 255),
+            xs - clip.left,
+            ys - clip.top,
+            size,
+            surface.get_rect(),
+        )
+        texture.update(surface)
+        self._blits.append((texture, pygame.Rect(clip), None))
+
+    def present(self, dirty_rects: list[pygame.Rect] | None = None) -> None:
+        """draws everything held for the frame and shows it
+
+        Args:
+            dirty_rects: not used, the whole frame is always drawn
+        """
+        renderer = self.renderer
+        renderer.draw_color = (0, 0, 0, 255)
+        renderer.clear()
+        if self.static_texture is not None:
+            renderer.blit(self.static_texture)
+
+        for colour, rects in self._fills.items():
+            renderer.draw_color = (*colour, 255)
+            for rect in rects:
+                renderer.fill_rect(rect)
+
+        for texture, rect, area in self._blits:
+            renderer.blit(texture, rect, area)
+
+        # the back buffer can't be read once it has been shown
+        if self.read_frames:
+            size = self.get_size()
+            if self._frame_surface is None or self._frame_surface.get_size() != size:
+                self._frame_surface = pygame.Surface(size)
+            renderer.to_surface(self._frame_surface)
+
+        renderer.present()
+        self._fills.clear()
+        self._blits.clear()
+
+    def get_frame(self) -> pygame.Surface | None:
+        """gets the frame last shown, None unless read_frames was set for it"""
+        return self._frame_surface if self.read_frames else None
+
+
+class NullRenderer:
+    keeps_frame = True
+    read_frames = False
+
+    def __init__(self, size: tuple[int, int]) -> None:
+        """takes every drawing call and does nothing with it
+
+        Args:
+            size: the size it pretends to draw at
+        """
+        self.size = size
+
+    @classmethod
+    def open_window(cls, size: tuple[int, int], caption: str) -> "NullRenderer":
+        return cls(size)
+
+    def get_size(self) -> tuple[int, int]:
+        return self.size
+
+    def set_static_layer(self, static_layer: pygame.Surface) -> None:
+        pass
+
+    def restore(self, rect: pygame.Rect) -> None:
+        pass
+
+    def fill(self, colour: tuple[int, int, int], rect: pygame.Rect) -> None:
+        pass
+
+    def draw_rect(
+        self, colour: tuple[int, int, int], rect: pygame.Rect, border_radius: int = 0
+    ) -> None:
+        pass
+
+    def fill_vertical_gradient(
+        self, rect: pygame.Rect, colour: np.ndarray, shading: np.ndarray
+    ) -> None:
+        pass
+
+    def blit(self, source: pygame.Surface, position: tuple[float, float]) -> None:
+        pass
+
+    def blit_changing(
+        self, source: pygame.Surface, position: tuple[float, float]
+    ) -> None:
+        pass
+
+    def draw_points(
+        self,
+        colour: tuple[int, int, int],
+        xs: np.ndarray,
+        ys: np.ndarray,
+        size: int,
+        clip: pygame.Rect,
+    ) -> None:
+        pass
+
+    def present(self, dirty_rects: list[pygame.Rect] | None = None) -> None:
+        pass
+
+    def get_frame(self) -> None:
+        return None
+
+
+RENDERERS = {
+    "software": SoftwareRenderer,
+    "texture": TextureRenderer,
+    "null": NullRenderer,
+}
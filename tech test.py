@@ -1,13 +1,569 @@
+import argparse
+import os
 import pygame
-from math import pi
+import random
+from functools import partial
+from math import ceil, pi, sqrt
+from time import perf_counter, time
+from typing import Callable
+
+from api import API_EVENT, OrderServer
+from bakes import SPRITE_CACHE_DIR, SpriteBaker, get_render_hash
+from caches import LRUCache
+from fonts import FONT_CACHE_PATH, FontAtlas
+from gradients import ColourTables, get_depth_shading
+from metrics import DrinkMetrics, MetricsRegistry
+from order_log import FINISHED, KIND_NAMES, ORDERED, STEP, OrderLog
+from orders import Order, OrderPipeline
+from particles import MUG_BOTTOM, MUG_LEFT, MUG_RIGHT, ParticlePour
+from profiling import FrameProfiler, InputLatency
+from recorder import ScreenRecorder, check_path
+from renderers import RENDERERS, NullRenderer, SoftwareRenderer, TextureRenderer
+from recipes import Brew, Recipe, RecipeBook
+
+# any of the backends in renderers.py
+Renderer = SoftwareRenderer | TextureRenderer | NullRenderer
+
+# windows made by pygame.display send VIDEORESIZE, others only WINDOWSIZECHANGED
+RESIZE_EVENTS = (pygame.VIDEORESIZE, pygame.WINDOWSIZECHANGED)
+# sent when the window is uncovered or restored, and may have lost what it showed
+EXPOSE_EVENTS = (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED, pygame.WINDOWRESTORED)
+# the only events put on the queue, the rest such as the stream of
+# MOUSEMOTION from touch panels are dropped by SDL and never wake the loop
+HANDLED_EVENTS = (
+    pygame.QUIT,
+    pygame.MOUSEBUTTONDOWN,
+    *RESIZE_EVENTS,
+    *EXPOSE_EVENTS,
+    API_EVENT,
+)
+
+RECIPES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recipes.json")
+
+
+class FrameScheduler:
+    """decides how long to wait between frames
+
+    while a drink is being made frames are run at the full rate,
+    otherwise the loop sleeps until an event arrives.
+    a press is handled as soon as it comes in rather than at the next frame
+    """
+
+    # events that start a frame straight away, everything else waits for it
+    WAKE_EVENTS = (pygame.MOUSEBUTTONDOWN, pygame.QUIT)
+
+    def __init__(self, max_fps: int, idle_timeout_ms: int = 1000) -> None:
+        self.max_fps = max_fps
+        self.idle_timeout_ms = idle_timeout_ms
+
+        self.mode = "idle"
+        # seconds spent in each mode and how much of it was spent waiting
+        self.mode_time = {"idle": 0.0, "active": 0.0}
+        self.wait_time = 0.0
+        self._last_time = perf_counter()
+        # when the latest events were taken off the queue
+        self.events_time = self._last_time
+        # when the last frame was due, frames are kept to a fixed cadence
+        # from it so waits that overrun don't add up
+        self._frame_end = self._last_time
+
+    def set_active(self, active: bool) -> None:
+        self.mode = "active" if active else "idle"
+
+    def get_events(self) -> list[pygame.event.Event]:
+        """waits for the next frame and gets the events that came in
+
+        Returns:
+            a list of the pending events, empty if the idle wait timed out
+        """
+        wait_start = perf_counter()
+        if self.mode == "active":
+            events = self._wait_for_frame()
+        else:
+            event = pygame.event.wait(self.idle_timeout_ms)
+            if event.type == pygame.NOEVENT:
+                events = []
+            elif event.type in self.WAKE_EVENTS:
+                events = [event] + pygame.event.get()
+            else:
+                # stops a flood of events from running faster than max_fps
+                events = [event] + self._wait_for_frame()
+
+        now = perf_counter()
+        self.wait_time += now - wait_start
+        self.mode_time[self.mode] += now - self._last_time
+        self._last_time = now
+        self.events_time = now
+
+        return events
+
+    def _wait_for_frame(self) -> list[pygame.event.Event]:
+        """waits until a frame after the last one, stopping early for a press"""
+        events = []
+        # if a frame ran long the next is started straight away
+        frame_end = max(self._frame_end + 1 / self.max_fps, self._last_time)
+        self._frame_end = frame_end
+        while (wait_ms := ceil((frame_end - perf_counter()) * 1000)) > 0:
+            event = pygame.event.wait(wait_ms)
+            if event.type == pygame.NOEVENT:
+                break
+            events.append(event)
+            if event.type in self.WAKE_EVENTS:
+                break
+        return events + pygame.event.get()
+
+    def get_duty_cycle(self) -> dict[str, float]:
+        """gets how the run time has been split up
+
+        Returns:
+            a dict with the fraction of time spent idle, active and busy
+            busy being the time spent not waiting on the clock or events
+        """
+        total_time = self.mode_time["idle"] + self.mode_time["active"]
+        if total_time == 0:
+            return {"idle": 0.0, "active": 0.0, "busy": 0.0}
+
+        return {
+            "idle": self.mode_time["idle"] / total_time,
+            "active": self.mode_time["active"] / total_time,
+            "busy": 1 - self.wait_time / total_time,
+        }
+
+
+class ButtonHitIndex:
+    def __init__(self, utilities: "Utilities", size: tuple[int, int]) -> None:
+        """a lookup of which button is under each pixel for one window size
+
+        each column of pixels maps to a button column and each row of pixels
+        to a button row, so finding a button is two list lookups
+        and matches the rects that were actually drawn
+
+        Args:
+            utilities: holds the button layout constants
+            size: the size of the window the buttons are drawn on
+        """
+        self.size = size
+        self.buttons_per_row = utilities.BUTTONS_PER_ROW
+
+        width, height = size
+        self.column_at_x = [-1] * width
+        self.row_at_y = [-1] * height
+
+        for column in range(utilities.BUTTONS_PER_ROW):
+            rect = utilities.get_button_rect(column, size)
+            for x in range(max(rect.left, 0), min(rect.right, width)):
+                self.column_at_x[x] = column
+
+        for row in range(utilities.BUTTON_ROWS):
+            rect = utilities.get_button_rect(row * utilities.BUTTONS_PER_ROW, size)
+            for y in range(max(rect.top, 0), min(rect.bottom, height)):
+                self.row_at_y[y] = row
+
+    def get_button(self, position: tuple[int, int]) -> int:
+        """Gets the index of the button at a position
+
+        Args:
+            position: the position in pixels
+
+        Returns:
+            an int for the index of the button
+            -1 if the position is outside of any buttons
+        """
+        x, y = position
+        if not (0 <= x < self.size[0] and 0 <= y < self.size[1]):
+            return -1
+
+        column = self.column_at_x[x]
+        row = self.row_at_y[y]
+        if column == -1 or row == -1:
+            return -1
+
+        return row * self.buttons_per_row + column
+
+
+class MachineLayout:
+    def __init__(
+        self, machine_size: float, horizontal_padding: float, vertical_padding: float
+    ) -> None:
+        """where one machine and each of its parts are drawn
+
+        Args:
+            machine_size: the size of the machine
+            horizontal_padding: the x of the machine's top left
+            vertical_padding: the y of the machine's top left
+        """
+        self.size = machine_size
+        self.horizontal_padding = horizontal_padding
+        self.vertical_padding = vertical_padding
+
+        self.window_rect = pygame.Rect(
+            (
+                horizontal_padding + machine_size * 0.6,
+                vertical_padding + machine_size * 0.35,
+            ),
+            (machine_size * 0.3, machine_size * 0.5),
+        )
+        self.spout_rect = pygame.Rect(
+            (
+                horizontal_padding + machine_size * 0.225,
+                vertical_padding + machine_size * 0.4,
+            ),
+            (machine_size * 0.05, machine_size * 0.2),
+        )
+        self.mug_rect = pygame.Rect(
+            (
+                horizontal_padding + machine_size * 0.1,
+                vertical_padding + machine_size * 0.6,
+            ),
+            (machine_size * 0.3, machine_size * 0.3),
+        )
+        # the liquid falls from the spout into the mug
+        self.pour_rect = self.spout_rect.inflate(2, 2).union(self.mug_rect)
+        self.screen_rect = pygame.Rect(
+            (
+                horizontal_padding + machine_size * 0.05,
+                vertical_padding + machine_size * 0.05,
+            ),
+            (machine_size * 0.9, machine_size * 0.25),
+        )
+        # the step goes in the top half of the screen
+        # and the queue status in the lower half
+        self.label_rect = pygame.Rect(
+            self.screen_rect.left,
+            self.screen_rect.top,
+            self.screen_rect.width,
+            self.screen_rect.height // 2,
+        )
+        self.status_rect = pygame.Rect(
+            self.screen_rect.left,
+            self.screen_rect.centery,
+            self.screen_rect.width,
+            self.screen_rect.height - self.screen_rect.height // 2,
+        )
+
+        # the liquid is drawn with float positions so the rects are grown
+        # by a pixel to make sure no edge is left behind
+        self.animated_rects = [
+            self.window_rect.inflate(2, 2),
+            self.pour_rect,
+            self.screen_rect,
+        ]
+        # the parts that are the same every time a recipe is made,
+        # which can be drawn from a baked sprite sheet
+        self.baked_rects = [self.animated_rects[0], self.label_rect]
+
+
+class Layout:
+    def __init__(self, utilities: "Utilities", size: tuple[int, int]) -> None:
+        """every rect that is drawn in, worked out once for a window size
+
+        Args:
+            utilities: holds the layout constants
+            size: the size of the window
+        """
+        self.size = size
+        self.button_rects = [
+            utilities.get_button_rect(button_index, size)
+            for button_index in range(utilities.BUTTON_ROWS * utilities.BUTTONS_PER_ROW)
+        ]
+        self.machines = [
+            MachineLayout(*utilities.get_machine_padding(size, machine_index))
+            for machine_index in range(utilities.MACHINE_COUNT)
+        ]
+        self.hit_index = ButtonHitIndex(utilities, size)
+        # text grows and shrinks with the window, as far as the atlas has sizes
+        reference_width, reference_height = utilities.REFERENCE_WINDOW_SIZE
+        self.max_font_size = utilities.FONT_SIZE * min(
+            size[0] / reference_width, size[1] / reference_height
+        )
+        # every machine is the same size so shares the liquid shading
+        window_height = self.machines[0].window_rect.height if self.machines else 0
+        self.window_shading = get_depth_shading(
+            window_height, utilities.LIQUID_BOTTOM_BRIGHTNESS
+        )
+
+
+class FixedTimestep:
+    def __init__(self, steps_per_second: int, max_catch_up: float = 0.25) -> None:
+        """splits the real time passed into fixed size simulation steps
+
+        time is read from a monotonic clock so dropped frames are caught up on
+        with extra steps rather than slowing the drinks down,
+        whatever is left over is used to interpolate drawing between steps.
+        after a long stall, such as dragging the window or a breakpoint,
+        only max_catch_up is caught up on and the rest is dropped,
+        so there is no burst of updates holding up the next frames
+
+        Args:
+            steps_per_second: how many simulation steps make up a second
+            max_catch_up: the most seconds simulated in one go
+        """
+        self.step = 1 / steps_per_second
+        self.max_catch_up = max_catch_up
+        self.accumulator = 0.0
+        self._last_time = perf_counter()
+
+    def reset(self) -> None:
+        """starts counting from now, dropping any time not yet stepped"""
+        self.accumulator = 0.0
+        self._last_time = perf_counter()
+
+    def get_steps(self) -> int:
+        """gets how many steps to simulate for the time passed since last called"""
+        now = perf_counter()
+        self.accumulator = min(
+            self.accumulator + now - self._last_time, self.max_catch_up
+        )
+        self._last_time = now
+
+        steps = int(self.accumulator // self.step)
+        self.accumulator -= steps * self.step
+        return steps
+
+    @property
+    def interpolation(self) -> float:
+        """how far the time left over is into the next step, 0-1"""
+        return self.accumulator / self.step
+
+
+class Machine:
+    def __init__(
+        self,
+        recipe_book: RecipeBook,
+        order_log: OrderLog | None = None,
+        machine_index: int = 0,
+        on_order_change: Callable[["Machine", Order, int], None] | None = None,
+        pour: ParticlePour | None = None,
+    ) -> None:
+        """the state of one drinks machine
+
+        all machines share one Utilities to draw them
+
+        Args:
+            recipe_book: the drinks the machine can make
+            order_log: if given every order and step is recorded in it
+            machine_index: which machine this is, for the order log
+            on_order_change: called with the machine, the order and ORDERED,
+              STEP or FINISHED when an order is made, starts a step or finishes
+            pour: if given the drink is poured into the mug as particles,
+              otherwise the spout is drawn as a single column of liquid
+        """
+        self.recipe_book = recipe_book
+        self.MAX_ORDERS = 10
+        self.order_log = order_log
+        self.machine_index = machine_index
+        self.on_order_change = on_order_change
+        self.pipeline = OrderPipeline(
+            on_step_change=(
+                self.step_changed
+                if order_log is not None or on_order_change is not None
+                else None
+            )
+        )
+        # idle machines only need drawing again when their state changes
+        self.needs_redraw = True
+        self.pour = pour
+        # the order whose drink is in the mug, None once it has been served
+        self.pour_order = None
+
+    @property
+    def brewing(self) -> bool:
+        return len(self.pipeline) > 0
+
+    @property
+    def full(self) -> bool:
+        return len(self.pipeline) >= self.MAX_ORDERS
+
+    @property
+    def brew(self) -> Brew | None:
+        """the oldest drink being made, which is the one drawn"""
+        head = self.pipeline.head
+        return None if head is None else head.brew
+
+    def order_drink(self, drink: str) -> Order | None:
+        """queues a drink to be made once the machine has room
+
+        Args:
+            drink: the name of the drink's recipe
+
+        Returns:
+            the order, None if the drink doesn't exist or the queue is full
+        """
+        recipe = self.recipe_book.get(drink)
+        if recipe is None:
+            print(f"no drink with name {drink} :(")
+            return None
+        if self.full:
+            return None
+
+        self.needs_redraw = True
+        order = self.pipeline.submit(recipe)
+        if self.order_log is not None:
+            self.order_log.log(
+                ORDERED,
+                order.submitted_at,
+                order.id,
+                recipe.name,
+                machine_index=self.machine_index,
+            )
+        if self.on_order_change is not None:
+            self.on_order_change(self, order, ORDERED)
+        return order
+
+    def step_changed(self, order: Order) -> None:
+        """records an order starting, moving onto a step or finishing"""
+        kind = FINISHED if order.brew.finished else STEP
+        if self.order_log is not None:
+            self.order_log.log(
+                kind,
+                self.pipeline.clock,
+                order.id,
+                order.recipe.name,
+                order.brew.step_index,
+                self.machine_index,
+            )
+        if self.on_order_change is not None:
+            self.on_order_change(self, order, kind)
+
+    def get_order_event(self, order: Order, kind: int) -> dict:
+        """describes an order changing, for the order API's subscribers
+
+        Args:
+            order: the order that changed
+            kind: ORDERED, STEP or FINISHED
+
+        Returns:
+            a dict that can be sent as JSON
+        """
+        step_index = 0 if order.brew is None else order.brew.step_index
+        steps = order.recipe.steps
+        return {
+            "event": KIND_NAMES[kind],
+            "machine": self.machine_index,
+            "order_id": order.id,
+            "drink": order.recipe.name,
+            "step": step_index,
+            "label": steps[step_index].label if step_index < len(steps) else None,
+            "clock": self.pipeline.clock,
+        }
+
+    def get_status(self) -> dict:
+        """gets what the machine is doing, for the order API
+
+        Returns:
+            a dict that can be sent as JSON of the queue depth, the drink
+            and step being shown and the seconds until the newest order is done
+        """
+        brew = self.brew
+        step = None
+        if brew is not None and not brew.finished:
+            step = brew.recipe.steps[brew.step_index].label
+        eta = 0.0
+        if self.pipeline.orders:
+            eta = max(
+                self.pipeline.orders[-1].estimated_finish - self.pipeline.clock, 0
+            )
+        return {
+            "machine": self.machine_index,
+            "queue": len(self.pipeline),
+            "drink": None if brew is None else brew.recipe.name,
+            "step": step,
+            "eta": eta,
+        }
+
+    def update_drink(self, seconds: float) -> bool:
+        """moves the drinks being made on
+
+        Args:
+            seconds: how much time has passed
+
+        Returns:
+            a bool of if a drink has just finished being made
+        """
+        if not self.pipeline.orders:
+            return False
+
+        finished = bool(self.pipeline.advance(seconds))
+        if finished:
+            self.needs_redraw = True
+        if self.pour is not None:
+            self.update_pour(seconds)
+        return finished
+
+    def get_dispensing_order(self) -> Order | None:
+        """gets the order on its spout step, None if nothing is pouring"""
+        for order in self.pipeline.orders:
+            brew = order.brew
+            if brew is not None and not brew.finished and brew.step.spout:
+                return order
+        return None
+
+    def update_pour(self, seconds: float) -> None:
+        """moves the pour on, pouring through the first half of the spout step
+        like draw_spout_liquid
+
+        the pour follows whichever order is dispensing rather than the one
+        drawn, emptying the mug when the next drink starts pouring
+        and once the drink in it has been served
+        """
+        order = self.get_dispensing_order()
+        if order is not None and order is not self.pour_order:
+            self.pour_order = order
+            self.pour.reset()
+        elif self.pour_order is not None and self.pour_order.finished_at is not None:
+            self.pour_order = None
+            self.pour.reset()
+
+        pour_seconds = 0
+        if order is not None and order.brew.step_amount < 0.5:
+            pour_seconds = order.brew.step.duration / 2
+        self.pour.update(seconds, pour_seconds)
+
+    def get_status_text(self) -> str:
+        """gets the queue depth, wait for the newest order and last order's time
+
+        Returns:
+            the text to show under the current step, empty if nothing queued
+        """
+        if not self.brewing:
+            return ""
+
+        newest_order = self.pipeline.orders[-1]
+        status = (
+            f"Queue {len(self.pipeline)}"
+            f" ETA {max(newest_order.estimated_finish - self.pipeline.clock, 0):.0f}s"
+        )
+        if self.pipeline.last_latency is not None:
+            status += f" Last {self.pipeline.last_latency:.1f}s"
+        return status
 
 
 class Utilities:
-    def __init__(self, max_fps: int) -> None:
+    def __init__(
+        self,
+        recipe_book: RecipeBook,
+        font_path: str | None = None,
+        font_cache_path: str = FONT_CACHE_PATH,
+    ) -> None:
         # holding most constants and variable in the self
         # this is to stop having to passthrough/global the variables
         # this also makes it earier to change constants
-        self.font = pygame.font.SysFont("Arial", 30)
+        # text is drawn at the largest of these sizes that fits its rect,
+        # up to FONT_SIZE at the reference window size and scaled with the window.
+        # a font file can be given to skip looking for the system font
+        self.FONT_SIZES = (12, 16, 20, 24, 30, 36, 48, 64)
+        self.FONT_SIZE = 30
+        self.REFERENCE_WINDOW_SIZE = (1600, 900)
+        self.GLYPH_CACHE_SIZE = 1024
+        self.WORD_CACHE_SIZE = 256
+        self.font_atlas = FontAtlas(
+            "Arial",
+            self.FONT_SIZES,
+            font_path,
+            font_cache_path,
+            self.GLYPH_CACHE_SIZE,
+            self.WORD_CACHE_SIZE,
+        )
         self.TEXT_COLOUR = (255, 255, 255)
 
         self.MACHINE_COLOUR = (155, 155, 155)
@@ -15,15 +571,16 @@ class Utilities:
         self.MUG_COLOUR = (50, 100, 200)
         self.SCREEN_COLOUR = (100, 100, 100)
 
-        self.WATER_COLOUR = (150, 200, 255)
-        self.BOILING_WATER_COLOUR = (200, 255, 255)
-        self.CHOCOLATE_COLOUR = (100, 80, 50)
-        self.TEA_COLOUR = (120, 100, 70)
-        self.LEMON_TEA_COLOUR = (160, 140, 70)
-        self.COFFEE_COLOUR = self.TEA_COLOUR
-        self.MILKY_COFFEE_COLOUR = (160, 140, 110)
-
-        self.FILL_TIME = 2.5 * max_fps
+        # drink colours and timings come from the recipes
+        self.recipe_book = recipe_book
+        # the liquid colour of every frame of every step is worked out
+        # before it is needed, see colour_tables
+        self.GRADIENT_STEPS_PER_SECOND = 60
+        self._colour_tables = None
+        # liquid gets darker towards the bottom of the window
+        self.LIQUID_BOTTOM_BRIGHTNESS = 0.8
+        # the width of a poured particle as a fraction of the machine size
+        self.PARTICLE_SIZE = 1 / 250
 
         self.BUTTONS_PER_ROW = 2
         self.BUTTON_ROWS = 4
@@ -38,48 +595,162 @@ class Utilities:
         self.HORIZONTAL_OFFSET = self.HORIZONTAL_BUTTON_SPACING
         self.VERTICAL_OFFSET = 1 / 4
 
-        self.drink = ""
-        self.animation_frame = 0
+        # the machines share the area right of the buttons
+        self.MACHINE_COUNT = 1
+        self.MACHINE_AREA_LEFT = 0.6
+        self.MACHINE_AREA_TOP = 0.25
+        self.MACHINE_AREA_WIDTH = 0.4
+        self.MACHINE_AREA_HEIGHT = 0.75
+        # the machine body is drawn once per size and copied for each machine
+        self.machine_sprite_cache = LRUCache(4)
+        # the rects for the current window size, see get_layout
+        self.layout = None
+        # draws brews from baked sprite sheets once they are ready if set
+        self.sprite_baker = None
+        # what each recipe's sheet is drawn from, see get_render_hash
+        self._render_hashes = {}
+
+        # wrapped layouts are keyed on (text, rect size, largest font size)
+        self.LAYOUT_CACHE_SIZE = 64
+        self.layout_cache = LRUCache(self.LAYOUT_CACHE_SIZE)
+
+    @property
+    def colour_tables(self) -> ColourTables:
+        """the liquid colours, made the first time they are used
+        so they don't hold up the first frame"""
+        if self._colour_tables is None:
+            self._colour_tables = ColourTables(
+                self.recipe_book, self.GRADIENT_STEPS_PER_SECOND
+            )
+        return self._colour_tables
+
+    def get_render_hash(self, recipe_name: str) -> str:
+        """hashes what a recipe's sheet is drawn from, worked out once
+        as the constants don't change once drawing has started"""
+        render_hash = self._render_hashes.get(recipe_name)
+        if render_hash is None:
+            render_hash = get_render_hash(self, recipe_name)
+            self._render_hashes[recipe_name] = render_hash
+        return render_hash
+
+    def bake_sprites(self, window_size: tuple[int, int]) -> None:
+        """starts baking every recipe's sheet for a window size"""
+        self.sprite_baker.bake(
+            {name: self.get_render_hash(name) for name in self.recipe_book.names},
+            window_size,
+            self.MACHINE_COUNT,
+        )
 
-    def render_text(
-        self, text_rect: pygame.Rect, text: str, surface: pygame.Surface
-    ) -> None:
-        """Renders text onto the surface inside the bounds of the Rect.
+    def get_layout(self, size: tuple[int, int]) -> Layout:
+        """gets the rects everything is drawn in, only working them out again
+        if the size has changed
 
         Args:
-            text_rect: a rectangle denoting the area the text is allowed in.
+            size: size of the surface being drawn on
+
+        Returns:
+            the layout for that size
         """
-        words = [word for word in text.split(" ")]
-        space = self.font.size(" ")[0]
-        max_width = text_rect.width
+        if self.layout is None or self.layout.size != size:
+            self.layout = Layout(self, size)
+        return self.layout
 
+    def wrap_text(
+        self, text: str, size: tuple[int, int], font_size: int
+    ) -> tuple[list[tuple[str, int, int]], bool]:
+        """Wraps text into lines at one font size.
+
+        Args:
+            text: the text to be wrapped
+            size: the width and height the text has to fit in
+            font_size: one of the font atlas's sizes
+
+        Returns:
+            a tuple of a list of each word with its x and y offset from the
+            top left, and whether every word fits inside the size
+        """
+        max_width, max_height = size
+        font = self.font_atlas.get_font(font_size)
+        space = font.size(" ")[0]
+
+        layout = []
+        fits = True
         x = self.BUTTON_BORDER_RADIUS
         y = self.BUTTON_BORDER_RADIUS
-        for word in words:
-            word_surface = self.font.render(word, 0, self.TEXT_COLOUR)
-            word_width, word_height = word_surface.get_size()
+        for word in text.split(" "):
+            word_width, word_height = font.size(word)
             if x + word_width >= max_width:
                 x = self.BUTTON_BORDER_RADIUS
                 y += word_height
-            surface.blit(
-                word_surface, (text_rect.topleft[0] + x, text_rect.topleft[1] + y)
-            )
+            layout.append((word, x, y))
+            fits = fits and x + word_width < max_width and y + word_height <= max_height
             x += word_width + space
+        return layout, fits
 
-    def draw_button(
-        self, button_index: int, surface: pygame.Surface, text: str = ""
+    def layout_text(
+        self, text: str, size: tuple[int, int], max_font_size: float
+    ) -> tuple[int, list[tuple[str, int, int]]]:
+        """Wraps text at the largest font size it fits at, reusing the layout if
+        already calculated.
+
+        falls back to the smallest size if the text doesn't fit at any
+
+        Args:
+            text: the text to be wrapped
+            size: the width and height the text has to fit in
+            max_font_size: the largest font size to use
+
+        Returns:
+            a tuple of the font size and a list of each word
+            with its x and y offset from the top left
+        """
+        key = (text, tuple(size), max_font_size)
+        cached = self.layout_cache.get(key)
+        if cached is not None:
+            return cached
+
+        font_sizes = [
+            font_size
+            for font_size in self.font_atlas.sizes
+            if font_size <= max_font_size
+        ] or [self.font_atlas.sizes[0]]
+        for font_size in reversed(font_sizes):
+            layout, fits = self.wrap_text(text, size, font_size)
+            if fits:
+                break
+
+        self.layout_cache.put(key, (font_size, layout))
+        return font_size, layout
+
+    def render_text(
+        self, text_rect: pygame.Rect, text: str, renderer: Renderer
     ) -> None:
-        """Draws a button at the given index.
+        """Renders text inside the bounds of the Rect.
+
+        Args:
+            text_rect: a rectangle denoting the area the text is allowed in.
+            text: the text to render
+            renderer: what to draw the text with
+        """
+        max_font_size = self.get_layout(renderer.get_size()).max_font_size
+        font_size, layout = self.layout_text(text, text_rect.size, max_font_size)
+        left, top = text_rect.topleft
+        for word, x, y in layout:
+            renderer.blit(
+                self.font_atlas.render_word(word, font_size, self.TEXT_COLOUR),
+                (left + x, top + y),
+            )
+
+    def get_button_rect(self, button_index: int, size: tuple[int, int]) -> pygame.Rect:
+        """Gets the rect a button is drawn in.
 
         buttons index from 0 and fill horizontally before moving to the next.
 
         Args:
-            button_index: the index of the button to be drawn
-            surface: the surface to draw the button on
-            text: text to put on the button
+            button_index: the index of the button
+            size: the size of the surface the button is drawn on
         """
-        surface_width = surface.get_width()
-        surface_height = surface.get_height()
+        surface_width, surface_height = size
 
         rect_width = self.BUTTON_WIDTH * surface_width
         rect_height = self.BUTTON_HEIGHT * surface_height
@@ -98,15 +769,26 @@ class Utilities:
             + rect_height * vertical_index
         )
 
-        button_rect = pygame.Rect(rect_x, rect_y, rect_width, rect_height)
-        pygame.draw.rect(
-            surface,
-            self.BUTTON_COLOUR,
-            button_rect,
-            border_radius=self.BUTTON_BORDER_RADIUS,
+        return pygame.Rect(rect_x, rect_y, rect_width, rect_height)
+
+    def draw_button(
+        self, button_index: int, renderer: Renderer, text: str = ""
+    ) -> None:
+        """Draws a button at the given index.
+
+        buttons index from 0 and fill horizontally before moving to the next.
+
+        Args:
+            button_index: the index of the button to be drawn
+            renderer: what to draw the button with
+            text: text to put on the button
+        """
+        button_rect = self.get_layout(renderer.get_size()).button_rects[button_index]
+        renderer.draw_rect(
+            self.BUTTON_COLOUR, button_rect, border_radius=self.BUTTON_BORDER_RADIUS
         )
 
-        self.render_text(button_rect, text, surface)
+        self.render_text(button_rect, text, renderer)
 
     def get_drink_button_pressed(
         self, relative_mouse_position: tuple[float, float]
@@ -121,129 +803,115 @@ class Utilities:
             an int for the index of the pressed button
             -1 if mouse position outside of any buttons
         """
-        click_location = [
+        # which button pitch the click is in and how far into it
+        horizontal_index, horizontal_offset = divmod(
             relative_mouse_position[0] - self.HORIZONTAL_OFFSET,
+            self.HORIZONTAL_BUTTON_SPACING + self.BUTTON_WIDTH,
+        )
+        vertical_index, vertical_offset = divmod(
             relative_mouse_position[1] - self.VERTICAL_OFFSET,
-        ]
-
-        button_total_width = self.HORIZONTAL_BUTTON_SPACING + self.BUTTON_WIDTH
-        horizontal_index = -1
-        while click_location[0] > 0:
-
-            # check if click is in the space between buttons
-            if (
-                click_location[0] > self.BUTTON_WIDTH
-                and click_location[0] < button_total_width
-            ):
-                horizontal_index = -1
-            else:
-                horizontal_index += 1
-
-            click_location[0] -= button_total_width
-
-        button_total_height = self.VERTICAL_BUTTON_SPACING + self.BUTTON_HEIGHT
-        vertical_index = -1
-        while click_location[1] > 0:
-
-            # check if click is in the space between buttons
-            if (
-                click_location[1] > self.BUTTON_HEIGHT
-                and click_location[1] < button_total_height
-            ):
-                vertical_index = -1
-            else:
-                vertical_index += 1
-
-            click_location[1] -= button_total_height
-
-        if vertical_index == -1 or horizontal_index == -1:
-            return -1
+            self.VERTICAL_BUTTON_SPACING + self.BUTTON_HEIGHT,
+        )
 
-        button_index = self.BUTTONS_PER_ROW * vertical_index + horizontal_index
+        # check if click is in the space between or outside of the buttons
         if (
-            button_index >= self.BUTTONS_PER_ROW * self.BUTTON_ROWS
-            or horizontal_index >= self.BUTTONS_PER_ROW
+            horizontal_offset > self.BUTTON_WIDTH
+            or vertical_offset > self.BUTTON_HEIGHT
+            or not 0 <= horizontal_index < self.BUTTONS_PER_ROW
+            or not 0 <= vertical_index < self.BUTTON_ROWS
         ):
             return -1
 
-        return button_index
+        return self.BUTTONS_PER_ROW * int(vertical_index) + int(horizontal_index)
 
     def get_machine_padding(
-        self, surface: pygame.Surface
+        self, size: tuple[int, int], machine_index: int = 0
     ) -> tuple[float, float, float]:
         """gets the flat padding values for the machine sprite
 
+        the machines are tiled in a grid in the area right of the buttons,
+        use get_layout when drawing rather than working this out again
+
         Args:
-            surface: surface on which the machine is rendered
+            size: size of the surface on which the machine is rendered
+            machine_index: which machine, indexed from 0 filling horizontally
 
         Returns:
             a tuple of the size of the machine, the horizontal padding and the vertical padding
         """
 
         # makes the machine visual scale to the lower of x/y to keep in bounds and square
-        # calculated here as required to avoid passing though repeatedly
-
-        size = surface.get_size()
-        scale = min(size[0] / 1600, size[1] / 900)
-
-        machine_size = scale * 500
-        horizontal_padding = size[0] * 0.6
-        vertical_padding = size[1] * 0.25
+        columns = ceil(sqrt(self.MACHINE_COUNT))
+        rows = ceil(self.MACHINE_COUNT / columns)
+        tile_width = size[0] * self.MACHINE_AREA_WIDTH / columns
+        tile_height = size[1] * self.MACHINE_AREA_HEIGHT / rows
+
+        # with one machine this is the same as scaling 500 pixels by
+        # the lower of the window width / 1600 and height / 900
+        machine_size = min(tile_width * 500 / 640, tile_height * 500 / 675)
+        row, column = divmod(machine_index, columns)
+        horizontal_padding = size[0] * self.MACHINE_AREA_LEFT + tile_width * column
+        vertical_padding = size[1] * self.MACHINE_AREA_TOP + tile_height * row
 
         return machine_size, horizontal_padding, vertical_padding
 
     def draw_window_liquid(
         self,
-        surface: pygame.Surface,
+        renderer: Renderer,
         colour: tuple[int, int, int],
         fill_amount: float,
+        machine_index: int = 0,
     ) -> None:
+        """draws the liquid in the window, darker towards the bottom
 
-        machine_size, horizontal_padding, vertical_padding = self.get_machine_padding(
-            surface
-        )
+        Args:
+            renderer: what to draw the liquid with
+            colour: colour of the top of the liquid
+            fill_amount: how full the window is, from 0-1
+            machine_index: which machine to draw in
+        """
+        layout = self.get_layout(renderer.get_size())
+        machine_layout = layout.machines[machine_index]
+        machine_size = machine_layout.size
 
-        pygame.draw.rect(
-            surface,
-            colour,
-            pygame.rect.Rect(
-                (
-                    horizontal_padding + machine_size * 0.6,
-                    vertical_padding
-                    + machine_size * 0.35
-                    + max(1 - fill_amount, 0) * machine_size * 0.5,
-                ),
-                (
-                    machine_size * 0.3,
-                    machine_size * 0.5 * fill_amount,
-                ),
+        liquid_rect = pygame.rect.Rect(
+            (
+                machine_layout.horizontal_padding + machine_size * 0.6,
+                machine_layout.vertical_padding
+                + machine_size * 0.35
+                + max(1 - fill_amount, 0) * machine_size * 0.5,
+            ),
+            (
+                machine_size * 0.3,
+                machine_size * 0.5 * fill_amount,
             ),
         )
+        renderer.fill_vertical_gradient(liquid_rect, colour, layout.window_shading)
 
     def draw_spout_liquid(
         self,
-        surface: pygame.Surface,
+        renderer: Renderer,
         colour: tuple[int, int, int],
         fill_amount: float,
+        machine_index: int = 0,
     ) -> None:
         """draws the liquid as it exits the spout
 
         Args:
-            surface: surface to be drawn on
+            renderer: what to draw the liquid with
             colour: colour the liquid is drawn in
             fill_amount: how full the tank of the machine is, from 0-1
+            machine_index: which machine to draw in
         """
-        machine_size, horizontal_padding, vertical_padding = self.get_machine_padding(
-            surface
-        )
+        machine_layout = self.get_layout(renderer.get_size()).machines[machine_index]
+        machine_size = machine_layout.size
 
-        pygame.draw.rect(
-            surface,
+        renderer.fill(
             colour,
             pygame.rect.Rect(
                 (
-                    horizontal_padding + machine_size * 0.225,
-                    vertical_padding
+                    machine_layout.horizontal_padding + machine_size * 0.225,
+                    machine_layout.vertical_padding
                     + machine_size * 0.4
                     + max(fill_amount * 2 - 1, 0) * machine_size * 0.2,
                 ),
@@ -254,41 +922,130 @@ class Utilities:
             ),
         )
 
-    def colour_interpolate(
+    def draw_pour(
         self,
-        colour_1: tuple[int, int, int],
-        colour_2: tuple[int, int, int],
-        distance: float,
-    ) -> tuple[int, int, int]:
-        """calculates the linear interpolate of 2 colours
+        renderer: Renderer,
+        pour: ParticlePour,
+        colour: tuple[int, int, int],
+        machine_index: int = 0,
+        interpolation: float = 1,
+    ) -> None:
+        """draws the particles falling from the spout and the liquid in the mug
 
         Args:
-            colour_1: first colour
-            colour_2: second colour
-            distance: how far from colour 1 to colour 2, 0-1
+            renderer: what to draw the pour with
+            pour: the particles and how full the mug is
+            colour: colour of the drink
+            machine_index: which machine to draw in
+            interpolation: how far between the last two pour updates to draw, 0-1
+        """
+        machine_layout = self.get_layout(renderer.get_size()).machines[machine_index]
+        machine_size = machine_layout.size
+        left = machine_layout.horizontal_padding
+        top = machine_layout.vertical_padding
+
+        if pour.level > 0:
+            liquid_top = top + pour.surface_y * machine_size
+            renderer.fill(
+                colour,
+                pygame.Rect(
+                    left + MUG_LEFT * machine_size,
+                    liquid_top,
+                    (MUG_RIGHT - MUG_LEFT) * machine_size,
+                    top + MUG_BOTTOM * machine_size - liquid_top,
+                ),
+            )
+
+        if pour.count > 0:
+            xs, ys = pour.get_positions(interpolation)
+            renderer.draw_points(
+                colour,
+                xs * machine_size + left,
+                ys * machine_size + top,
+                max(round(machine_size * self.PARTICLE_SIZE), 1),
+                machine_layout.pour_rect,
+            )
+
+    def build_static_layer(
+        self,
+        size: tuple[int, int],
+        background_colour: tuple[int, int, int],
+        drink_names: list[str],
+    ) -> pygame.Surface:
+        """draws everything that does not animate onto a new surface
+
+        this only needs redoing when the window is resized
+
+        Args:
+            size: size of the window
+            background_colour: colour behind the buttons and machine
+            drink_names: the names to put on the buttons
+
+        Returns:
+            the surface with the buttons and machine body drawn on it
         """
-        r = colour_1[0] + (colour_2[0] - colour_1[0]) * distance
-        g = colour_1[1] + (colour_2[1] - colour_1[1]) * distance
-        b = colour_1[2] + (colour_2[2] - colour_1[2]) * distance
+        static_layer = pygame.Surface(size)
+        # matching the window's pixel format makes copying it across quicker
+        if pygame.display.get_surface() is not None:
+            static_layer = static_layer.convert()
+        static_layer.fill(background_colour)
+
+        # always drawn in software as it is only drawn once
+        renderer = SoftwareRenderer(static_layer)
+        index = 0
+        for drink_name in drink_names:
+            self.draw_button(index, renderer, drink_name)
+            index += 1
+        while index < self.BUTTON_ROWS * self.BUTTONS_PER_ROW:
+            self.draw_button(index, renderer)
+            index += 1
+
+        for machine_index in range(self.MACHINE_COUNT):
+            self.draw_machine_body(renderer, machine_index)
 
-        return (r, g, b)
+        return static_layer
 
-    def draw_machine(self, surface: pygame.Surface) -> bool:
+    def draw_machine(
+        self,
+        renderer: Renderer,
+        machine: "Machine",
+        machine_index: int = 0,
+        interpolation: float = 1,
+    ) -> None:
         """draws the coffee machine
 
         draws the machine and any liquids
         alongside an animation for creating drinks
 
         Args:
-            surface: surface to draw the machine on
+            renderer: what to draw the machine with
+            machine: the machine's state
+            machine_index: where the machine is tiled
+            interpolation: how far between the last two drink updates to draw, 0-1
+        """
+        self.draw_machine_body(renderer, machine_index)
+        self.draw_machine_animation(renderer, machine, machine_index, interpolation)
+
+    def get_machine_sprite(self, machine_size: float) -> pygame.Surface:
+        """gets the parts of the machine that do not animate drawn on their own
+
+        drawn once for each size so every machine can share it
+
+        Args:
+            machine_size: the size of the machine
 
         Returns:
-            a bool of if the animation has finished of the drink being made
+            a transparent surface with the machine drawn on it
         """
+        machine_sprite = self.machine_sprite_cache.get(machine_size)
+        if machine_sprite is not None:
+            return machine_sprite
 
-        machine_size, horizontal_padding, vertical_padding = self.get_machine_padding(
-            surface
+        machine_sprite = pygame.Surface(
+            (ceil(machine_size), ceil(machine_size)), pygame.SRCALPHA
         )
+        horizontal_padding = vertical_padding = 0
+        surface = machine_sprite
 
         # main body of machine
         # top arm
@@ -370,210 +1127,791 @@ class Utilities:
         )
 
         # machine screen
-        screen_rect = pygame.rect.Rect(
-            (
-                horizontal_padding + machine_size * 0.05,
-                vertical_padding + machine_size * 0.05,
+        pygame.draw.rect(
+            surface,
+            self.SCREEN_COLOUR,
+            pygame.rect.Rect(
+                (machine_size * 0.05, machine_size * 0.05),
+                (machine_size * 0.9, machine_size * 0.25),
             ),
-            ((machine_size * 0.9, machine_size * 0.25)),
         )
-        pygame.draw.rect(surface, self.SCREEN_COLOUR, screen_rect)
+
+        self.machine_sprite_cache.put(machine_size, machine_sprite)
+        return machine_sprite
+
+    def draw_machine_body(self, renderer: Renderer, machine_index: int = 0) -> None:
+        """draws the parts of the machine that do not animate
+
+        Args:
+            renderer: what to draw the machine with
+            machine_index: which machine to draw
+        """
+        machine_layout = self.get_layout(renderer.get_size()).machines[machine_index]
+        renderer.blit(
+            self.get_machine_sprite(machine_layout.size),
+            (machine_layout.horizontal_padding, machine_layout.vertical_padding),
+        )
+
+    def draw_machines(
+        self,
+        renderer: Renderer,
+        machines: list[Machine],
+        interpolation: float = 1,
+        redraw_all: bool = False,
+    ) -> list[pygame.Rect]:
+        """draws the animated parts of every machine that has changed
+
+        idle machines keep showing the same message so are skipped
+        unless they have just finished or redraw_all is set,
+        or the renderer draws every frame from scratch
+
+        Args:
+            renderer: what to draw the machines with
+            machines: the state of each machine, in tiling order
+            interpolation: how far between the last two drink updates to draw, 0-1
+            redraw_all: draw every machine even if it has not changed
+
+        Returns:
+            a list of the rects that were drawn over
+        """
+        machine_layouts = self.get_layout(renderer.get_size()).machines
+        redraw_all = redraw_all or not renderer.keeps_frame
+
+        dirty_rects = []
+        for machine_index, machine in enumerate(machines):
+            if not (machine.brewing or machine.needs_redraw or redraw_all):
+                continue
+
+            animated_rects = machine_layouts[machine_index].animated_rects
+            for rect in animated_rects:
+                renderer.restore(rect)
+            self.draw_machine_animation(renderer, machine, machine_index, interpolation)
+
+            machine.needs_redraw = False
+            dirty_rects.extend(animated_rects)
+
+        return dirty_rects
+
+    def draw_machine_animation(
+        self,
+        renderer: Renderer,
+        machine: "Machine",
+        machine_index: int = 0,
+        interpolation: float = 1,
+    ) -> None:
+        """draws the liquids and screen text for the drink being made
+
+        only draws inside the machine layout's animated_rects,
+        expects the machine body to already be underneath
+
+        Args:
+            renderer: what to draw the machine with
+            machine: the machine's state
+            machine_index: where the machine is tiled
+            interpolation: how far between the last two drink updates to draw, 0-1
+        """
+        machine_layout = self.get_layout(renderer.get_size()).machines[machine_index]
+        brew = machine.brew
 
         # animate the window, screen and spout
         # if no drink active display a message
-        if self.drink == "":
-            self.render_text(screen_rect, "Please choose a drink :)", surface)
-            return 0
+        if brew is None:
+            self.render_text(
+                machine_layout.label_rect, "Please choose a drink :)", renderer
+            )
+            return
+
+        # drawn between the last two updates so the animation stays smooth
+        # when frames are drawn at a different rate to the updates
+        step_index, step_amount = brew.interpolate(interpolation)
+        if step_index >= len(brew.recipe.steps):
+            return
+
+        sheet = None
+        if self.sprite_baker is not None:
+            sheet = self.sprite_baker.get_sheet(
+                brew.recipe.name,
+                self.get_render_hash(brew.recipe.name),
+                renderer.get_size(),
+                self.MACHINE_COUNT,
+            )
+        if sheet is not None:
+            step = brew.recipe.steps[step_index]
+            elapsed = brew.recipe.step_ends[step_index] - step.duration * (
+                1 - step_amount
+            )
+            sheet.draw(renderer, machine_layout.baked_rects, elapsed)
+        else:
+            self.draw_brew_frame(
+                renderer, brew.recipe, step_index, step_amount, machine_index
+            )
 
-        self.animation_frame += 1
+        # the pour depends on where every particle landed so is never baked
+        if machine.pour is not None:
+            # the mug holds the drink that last poured, which may not be the one drawn
+            if machine.pour_order is not None:
+                pour_recipe = machine.pour_order.recipe
+                colour = self.colour_tables.get_colour(
+                    pour_recipe.name, pour_recipe.spout_index, 0
+                )
+                self.draw_pour(
+                    renderer, machine.pour, colour, machine_index, interpolation
+                )
+        elif brew.recipe.steps[step_index].spout:
+            colour = self.colour_tables.get_colour(
+                brew.recipe.name, step_index, step_amount
+            )
+            self.draw_spout_liquid(renderer, colour, step_amount, machine_index)
+
+        # the queue changes between brews so is never baked
+        self.render_text(
+            machine_layout.status_rect, machine.get_status_text(), renderer
+        )
 
-        # fill with water, all drinks need it so placed before selection
-        if self.animation_frame < self.FILL_TIME:
-            # filling with water
-            self.render_text(screen_rect, "Filling with water", surface)
+    def draw_brew_frame(
+        self,
+        renderer: Renderer,
+        recipe: Recipe,
+        step_index: int,
+        step_amount: float,
+        machine_index: int = 0,
+    ) -> None:
+        """draws the liquids and step label part way through a brew
+
+        this is the same every time a recipe is made, so is what is baked
+        into sprite sheets, only drawing inside the machine's baked_rects
+
+        Args:
+            renderer: what to draw the machine with
+            recipe: the drink being made
+            step_index: the step it is on
+            step_amount: how far through the step, 0-1
+            machine_index: where the machine is tiled
+        """
+        machine_layout = self.get_layout(renderer.get_size()).machines[machine_index]
+
+        # each step moves smoothly between colours
+        # to make it look like it is mixing
+        step = recipe.steps[step_index]
+        self.render_text(machine_layout.label_rect, step.label, renderer)
+        if step.start_colour is not None:
+            colour = self.colour_tables.get_colour(recipe.name, step_index, step_amount)
+
+        if step.window == "fill":
+            self.draw_window_liquid(renderer, colour, step_amount, machine_index)
+        elif step.window == "full":
+            self.draw_window_liquid(renderer, colour, 1, machine_index)
+        elif step.window == "drain":
+            # the window fill amount decreses with twice the rate of normal
+            # this allows for half the time to go to the spout liquid droping
+            # while the tank is empty
             self.draw_window_liquid(
-                surface,
-                self.WATER_COLOUR,
-                self.animation_frame / self.FILL_TIME,
+                renderer, colour, max(1 - step_amount * 2, 0), machine_index
             )
 
-        elif self.animation_frame < self.FILL_TIME * 2:
-            # boiling the water
-            self.render_text(screen_rect, "Boiling water", surface)
-            boiled_amount = self.animation_frame / self.FILL_TIME - 1
-            colour = self.colour_interpolate(
-                self.WATER_COLOUR, self.BOILING_WATER_COLOUR, boiled_amount
+
+def run_headless(
+    recipe_book: RecipeBook,
+    order_count: int,
+    steps_per_second: int,
+    seed: int,
+    render_size: tuple[int, int] | None = None,
+    order_log: OrderLog | None = None,
+) -> None:
+    """makes random drinks as fast as possible without a window
+
+    prints the order rate and how long each step took,
+    both in simulated time and the real time spent simulating it
+
+    Args:
+        recipe_book: the drinks that can be ordered
+        order_count: how many drinks to make
+        steps_per_second: how many steps each simulated second is split into
+        seed: seed for picking the drinks
+        render_size: if given every frame is also drawn offscreen at this size
+        order_log: if given every order and step is recorded in it
+    """
+    choices = random.Random(seed)
+
+    utilities = None
+    if render_size is not None:
+        # the dummy driver lets surfaces be drawn without opening a window
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        pygame.init()
+        pygame.display.set_mode((1, 1))
+        utilities = Utilities(recipe_book)
+        renderer = SoftwareRenderer(
+            utilities.build_static_layer(
+                render_size, (255, 255, 255), recipe_book.names
             )
-            self.draw_window_liquid(surface, colour, 1)
+        )
 
-        else:
-            match self.drink:
-                # each drink follows the same basic format
-                case "Chocolate":
-                    # each step moves smoothly between colours
-                    # to make it look like it is mixing
-                    if self.animation_frame < self.FILL_TIME * 3:
-                        self.render_text(screen_rect, "Mixing in chocolate", surface)
-                        chocolate_amount = self.animation_frame / self.FILL_TIME - 2
-                        colour = self.colour_interpolate(
-                            self.BOILING_WATER_COLOUR,
-                            self.CHOCOLATE_COLOUR,
-                            chocolate_amount,
-                        )
-                        self.draw_window_liquid(surface, colour, 1)
-                    elif self.animation_frame < self.FILL_TIME * 4:
-                        self.render_text(screen_rect, "Dispensing", surface)
-                        dispensed_amount = self.animation_frame / self.FILL_TIME - 3
-
-                        # the window fill amount decreses with twice the rate of normal
-                        # this allows for half the time to go to the spout liquid droping
-                        # while the tank is empty
-                        window_fill_amount = max(1 - dispensed_amount * 2, 0)
-                        self.draw_window_liquid(
-                            surface, self.CHOCOLATE_COLOUR, window_fill_amount
-                        )
-                        self.draw_spout_liquid(
-                            surface, self.CHOCOLATE_COLOUR, dispensed_amount
-                        )
-                    elif self.animation_frame < self.FILL_TIME * 5:
-                        self.render_text(
-                            screen_rect, "Enjoy your hot chocolate :)", surface
-                        )
-                    else:
-                        self.animation_frame = 0
-                        return True
-
-                case "Lemon Tea":
-                    if self.animation_frame < self.FILL_TIME * 3:
-                        self.render_text(screen_rect, "Brewing tea", surface)
-                        tea_amount = self.animation_frame / self.FILL_TIME - 2
-                        colour = self.colour_interpolate(
-                            self.BOILING_WATER_COLOUR,
-                            self.TEA_COLOUR,
-                            tea_amount,
-                        )
-                        self.draw_window_liquid(surface, colour, 1)
-                    elif self.animation_frame < self.FILL_TIME * 4:
-                        self.render_text(screen_rect, "Adding lemon", surface)
-                        lemon_amount = self.animation_frame / self.FILL_TIME - 3
-                        colour = self.colour_interpolate(
-                            self.TEA_COLOUR,
-                            self.LEMON_TEA_COLOUR,
-                            lemon_amount,
-                        )
-                        self.draw_window_liquid(surface, colour, 1)
-                    elif self.animation_frame < self.FILL_TIME * 5:
-                        self.render_text(screen_rect, "Dispensing", surface)
-                        dispensed_amount = self.animation_frame / self.FILL_TIME - 4
-                        window_fill_amount = max(1 - dispensed_amount * 2, 0)
-                        self.draw_window_liquid(
-                            surface, self.LEMON_TEA_COLOUR, window_fill_amount
-                        )
-                        self.draw_spout_liquid(
-                            surface, self.LEMON_TEA_COLOUR, dispensed_amount
-                        )
-                    elif self.animation_frame < self.FILL_TIME * 6:
-                        self.render_text(
-                            screen_rect, "Enjoy your lemon tea :)", surface
-                        )
-                    else:
-                        self.animation_frame = 0
-                        return True
-                case "Coffee":
-                    if self.animation_frame < self.FILL_TIME * 3:
-                        self.render_text(screen_rect, "Brewing coffee", surface)
-                        coffee_amount = self.animation_frame / self.FILL_TIME - 2
-                        colour = self.colour_interpolate(
-                            self.BOILING_WATER_COLOUR,
-                            self.COFFEE_COLOUR,
-                            coffee_amount,
-                        )
-                        self.draw_window_liquid(surface, colour, 1)
-                    elif self.animation_frame < self.FILL_TIME * 4:
-                        self.render_text(screen_rect, "Adding sugar and milk", surface)
-                        milk_amount = self.animation_frame / self.FILL_TIME - 3
-                        colour = self.colour_interpolate(
-                            self.COFFEE_COLOUR,
-                            self.MILKY_COFFEE_COLOUR,
-                            milk_amount,
-                        )
-                        self.draw_window_liquid(surface, colour, 1)
-                    elif self.animation_frame < self.FILL_TIME * 5:
-                        self.render_text(screen_rect, "Dispensing", surface)
-                        dispensed_amount = self.animation_frame / self.FILL_TIME - 4
-                        window_fill_amount = max(1 - dispensed_amount * 2, 0)
-                        self.draw_window_liquid(
-                            surface, self.MILKY_COFFEE_COLOUR, window_fill_amount
-                        )
-                        self.draw_spout_liquid(
-                            surface, self.MILKY_COFFEE_COLOUR, dispensed_amount
-                        )
-                    elif self.animation_frame < self.FILL_TIME * 6:
-                        self.render_text(screen_rect, "Enjoy your coffee :)", surface)
-                    else:
-                        self.animation_frame = 0
-                        return True
-                case _:
-                    print(f"no drink with name {self.drink} :(")
-        return False
+    # per drink, per step: [simulated seconds, real seconds, times done]
+    step_times = {
+        recipe.name: [[0.0, 0.0, 0] for _ in recipe.steps]
+        for recipe in recipe_book.recipes.values()
+    }
+    order_counts = dict.fromkeys(recipe_book.names, 0)
+
+    start_time = perf_counter()
+    for _ in range(order_count):
+        drink = choices.choice(recipe_book.names)
+        order_counts[drink] += 1
+
+        machine = Machine(recipe_book, order_log)
+        order = machine.order_drink(drink)
+
+        step_index = 0
+        step_started = 0.0
+        step_real_started = perf_counter()
+        finished = False
+        while not finished:
+            finished = machine.update_drink(1 / steps_per_second)
+            if utilities is not None:
+                utilities.draw_machine_animation(renderer, machine)
+
+            brew = order.brew
+            if brew.step_index != step_index:
+                now = perf_counter()
+                times = step_times[drink][step_index]
+                times[0] += brew.elapsed - step_started
+                times[1] += now - step_real_started
+                times[2] += 1
+                step_index = brew.step_index
+                step_started = brew.elapsed
+                step_real_started = now
+
+    total_time = perf_counter() - start_time
+    print(
+        f"made {order_count} drinks in {total_time:.2f}s"
+        f" ({order_count / total_time:.0f} drinks/s at {steps_per_second} steps per second)"
+    )
+    for recipe in recipe_book.recipes.values():
+        print(f"{recipe.name}: {order_counts[recipe.name]} made")
+        for step, (simulated, real, count) in zip(
+            recipe.steps, step_times[recipe.name]
+        ):
+            if count == 0:
+                continue
+            print(
+                f"    {step.label:<30} {simulated / count:6.3f}s simulated"
+                f" {real / count * 1e6:9.1f}us real"
+            )
 
 
-def main() -> None:
+def get_button_presses(
+    events: list[pygame.event.Event],
+    hit_index: ButtonHitIndex,
+    last_presses: dict[int, float],
+    now: float,
+    repeat_seconds: float,
+) -> list[int]:
+    """gets the buttons pressed, leaving out the repeats touch panels send
+
+    a touch panel can send a few presses for one tap, so a press on a
+    button that was pressed less than repeat_seconds ago is dropped.
+    only the primary button and touches count, so scrolling doesn't order
+
+    Args:
+        events: the events taken off the queue this frame
+        hit_index: the buttons of the current layout
+        last_presses: when each button was last pressed, updated with these
+        now: when the events were taken off the queue
+        repeat_seconds: presses on one button closer together than this are one
+
+    Returns:
+        a list of the index of each button pressed, in order
+    """
+    presses = []
+    for event in events:
+        if event.type != pygame.MOUSEBUTTONDOWN or event.button != pygame.BUTTON_LEFT:
+            continue
+        button_index = hit_index.get_button(event.pos)
+        if button_index == -1:
+            continue
+        if now - last_presses.get(button_index, -repeat_seconds) < repeat_seconds:
+            continue
+        last_presses[button_index] = now
+        presses.append(button_index)
+    return presses
+
+
+def handle_api_request(request: dict, machines: list[Machine]) -> dict:
+    """answers an order or status request from the order API,
+    called from the main loop as it changes the machines
+
+    Args:
+        request: the request, an order or status
+        machines: the machines to order on
+
+    Returns:
+        the reply, which can be sent as JSON
+    """
+    if request["type"] == "status":
+        return {"ok": True, "machines": [machine.get_status() for machine in machines]}
+
+    machine_index = request.get("machine")
+    if machine_index is None:
+        machine = min(machines, key=lambda machine: len(machine.pipeline))
+    elif type(machine_index) is int and 0 <= machine_index < len(machines):
+        machine = machines[machine_index]
+    else:
+        return {"ok": False, "error": f"no machine {machine_index}"}
+
+    drink = request.get("drink")
+    if not isinstance(drink, str) or machine.recipe_book.get(drink) is None:
+        return {"ok": False, "error": f"no drink with name {drink}"}
+
+    order = machine.order_drink(drink)
+    if order is None:
+        return {"ok": False, "error": "the queue is full"}
+    return {
+        "ok": True,
+        "machine": machine.machine_index,
+        "order_id": order.id,
+        "eta": order.estimated_finish - machine.pipeline.clock,
+    }
+
+
+def publish_order_event(
+    order_server: OrderServer, machine: Machine, order: Order, kind: int
+) -> None:
+    """sends an order changing to the order API's subscribers, if there are any"""
+    if order_server.subscribers:
+        order_server.publish(machine.get_order_event(order, kind))
+
+
+def call_listeners(
+    listeners: list[Callable[[Machine, Order, int], None]],
+    machine: Machine,
+    order: Order,
+    kind: int,
+) -> None:
+    """passes an order changing on to everything listening for it"""
+    for listener in listeners:
+        listener(machine, order, kind)
+
+
+def close_order_log(order_log: OrderLog | None) -> None:
+    """writes out the rest of the order log, saying if any records were lost"""
+    if order_log is None:
+        return
+    order_log.close()
+    if order_log.dropped:
+        print(
+            f"{order_log.dropped} order log records were dropped"
+            " as they came in faster than they could be written"
+        )
 
-    pygame.init()
-    pygame.font.init()
 
-    DRINK_NAMES = ["Lemon Tea", "Chocolate", "Coffee"]
+def positive_int(text: str) -> int:
+    """an argparse type for counts that must be at least 1"""
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, not {value}")
+    return value
+
+
+def positive_float(text: str) -> float:
+    """an argparse type for rates and sizes that must be above 0"""
+    value = float(text)
+    # not value > 0 so nan is rejected too
+    if not value > 0:
+        raise argparse.ArgumentTypeError(f"must be above 0, not {value}")
+    return value
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Hot Drinks Machine")
+    parser.add_argument(
+        "--headless",
+        action="store_true",
+        help="make random drinks as fast as possible without a window",
+    )
+    parser.add_argument(
+        "--orders", type=int, default=1000, help="drinks to make when headless"
+    )
+    parser.add_argument(
+        "--render",
+        action="store_true",
+        help="draw each headless frame offscreen through the dummy video driver",
+    )
+    parser.add_argument(
+        "--simulated-fps",
+        type=positive_int,
+        default=None,
+        help="steps per simulated second when headless, defaults to 60",
+    )
+    parser.add_argument(
+        "--fps",
+        type=positive_int,
+        default=60,
+        help="the most frames drawn per second, drinks take the same time at any rate",
+    )
+    parser.add_argument(
+        "--machines", type=positive_int, default=1, help="how many machines to show"
+    )
+    parser.add_argument(
+        "--hud",
+        action="store_true",
+        help="show the p50/p95/p99 time of each part of drawing a frame",
+    )
+    parser.add_argument(
+        "--profile-trace",
+        metavar="PATH",
+        help="save the time of each part of every frame on exit, as json or csv",
+    )
+    parser.add_argument(
+        "--order-log",
+        metavar="PATH",
+        help="add every order, step and finished drink to this log",
+    )
+    parser.add_argument(
+        "--renderer",
+        choices=RENDERERS,
+        default="software",
+        help="software updates only what changed, texture draws with SDL's"
+        " renderer which can use the graphics card, null draws nothing",
+    )
+    parser.add_argument(
+        "--font",
+        metavar="PATH",
+        help="a font file to use rather than looking for Arial in the system fonts",
+    )
+    parser.add_argument(
+        "--font-cache",
+        metavar="PATH",
+        default=FONT_CACHE_PATH,
+        help="where the path of the system font is remembered between runs",
+    )
+    parser.add_argument(
+        "--first-frame-only",
+        action="store_true",
+        help="print the time the first frame was shown then quit,"
+        " used by benchmark.py startup",
+    )
+    # the API listens on one or the other
+    api_group = parser.add_mutually_exclusive_group()
+    api_group.add_argument(
+        "--api-port",
+        type=int,
+        metavar="PORT",
+        help="take orders as JSON on this local tcp port, see api.py",
+    )
+    api_group.add_argument(
+        "--api-socket",
+        metavar="PATH",
+        help="take orders as JSON on this unix socket, see api.py",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        metavar="PORT",
+        help="serve counters of drinks and frames to prometheus"
+        " on this local port, see metrics.py",
+    )
+    parser.add_argument(
+        "--bake",
+        action="store_true",
+        help="draw brews from sprite sheets baked in the background"
+        " for the window size, drawing them live until they are ready",
+    )
+    parser.add_argument(
+        "--sprite-cache",
+        metavar="DIR",
+        default=SPRITE_CACHE_DIR,
+        help="where baked sprite sheets are kept between runs",
+    )
+    parser.add_argument(
+        "--input-latency",
+        action="store_true",
+        help="time from each press to the frame that shows it, printed on exit",
+    )
+    parser.add_argument(
+        "--record",
+        metavar="PATH",
+        help="record what is shown, to an animated png if PATH ends in .png"
+        " otherwise to a directory of pngs, see recorder.py",
+    )
+    parser.add_argument(
+        "--record-fps",
+        type=positive_float,
+        default=10,
+        help="the most frames recorded each second",
+    )
+    parser.add_argument(
+        "--record-scale",
+        type=positive_float,
+        default=0.5,
+        help="the size of the recorded frames compared to the window",
+    )
+    parser.add_argument(
+        "--particles",
+        type=int,
+        default=5000,
+        metavar="COUNT",
+        help="the most particles falling from each spout at once,"
+        " 0 to draw the spout as a single column of liquid",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+    if arguments.record:
+        # checked now rather than after the window opens
+        try:
+            check_path(arguments.record)
+        except OSError as error:
+            parser.error(f"can't record to {arguments.record}, {error}")
+
+    recipe_book = RecipeBook.load(RECIPES_PATH)
+    DRINK_NAMES = recipe_book.names
 
     WINDOW_SIZE = (1600, 900)
     BACKGROUND_COLOUR = (255, 255, 255)
-    MAX_FPS = 60
-    screen = pygame.display.set_mode(WINDOW_SIZE, pygame.RESIZABLE)
-    pygame.display.set_caption("Hot Drinks Machine")
-    clock = pygame.time.Clock()
-    utilities = Utilities(MAX_FPS)
+    MAX_FPS = arguments.fps
+    # drinks are always simulated at this rate, however fast frames are drawn
+    SIMULATION_RATE = 60
+    # presses on one button closer together than this are one tap
+    PRESS_REPEAT_SECONDS = 0.05
+
+    if arguments.headless:
+        order_log = None
+        if arguments.order_log:
+            order_log = OrderLog(arguments.order_log, recipe_book.names)
+        run_headless(
+            recipe_book,
+            arguments.orders,
+            arguments.simulated_fps or SIMULATION_RATE,
+            arguments.seed,
+            WINDOW_SIZE if arguments.render else None,
+            order_log,
+        )
+        close_order_log(order_log)
+        return
+
+    pygame.init()
+    pygame.font.init()
+    pygame.event.set_blocked(None)
+    pygame.event.set_allowed(HANDLED_EVENTS)
+
+    renderer = RENDERERS[arguments.renderer].open_window(
+        WINDOW_SIZE, "Hot Drinks Machine"
+    )
+    utilities = Utilities(recipe_book, arguments.font, arguments.font_cache)
+    utilities.MACHINE_COUNT = arguments.machines
+
+    # the buttons and machine body are drawn once and copied back
+    # over the animated areas each frame rather than redrawn.
+    # they are shown straight away, before anything not needed to draw them
+    static_layer = utilities.build_static_layer(
+        renderer.get_size(), BACKGROUND_COLOUR, DRINK_NAMES
+    )
+    renderer.set_static_layer(static_layer)
+    renderer.present()
+    if arguments.first_frame_only:
+        print(time())
+        return
+
+    layout = utilities.get_layout(renderer.get_size())
+    # made now rather than when the first drink is drawn
+    utilities.colour_tables
+
+    if arguments.bake:
+        utilities.sprite_baker = SpriteBaker(
+            os.path.abspath(__file__),
+            BACKGROUND_COLOUR,
+            utilities.font_atlas.font_path,
+            arguments.sprite_cache,
+        )
+        utilities.bake_sprites(layout.size)
+
+    order_log = None
+    if arguments.order_log:
+        order_log = OrderLog(arguments.order_log, recipe_book.names)
+    order_listeners = []
+    order_server = None
+    if arguments.api_port is not None or arguments.api_socket:
+        order_server = OrderServer(
+            port=arguments.api_port or 0, unix_path=arguments.api_socket
+        )
+        order_server.start()
+        order_listeners.append(partial(publish_order_event, order_server))
+        print(f"taking orders on {order_server.address}")
+    metrics_registry = None
+    drink_metrics = None
+    if arguments.metrics_port is not None:
+        metrics_registry = MetricsRegistry()
+        drink_metrics = DrinkMetrics(
+            metrics_registry, recipe_book, arguments.machines, MAX_FPS
+        )
+        metrics_registry.start(arguments.metrics_port)
+        order_listeners.append(drink_metrics.record_order)
+        print(f"serving metrics on {metrics_registry.address}")
+    on_order_change = (
+        partial(call_listeners, order_listeners) if order_listeners else None
+    )
+
+    machines = [
+        Machine(
+            recipe_book,
+            order_log,
+            machine_index,
+            on_order_change,
+            (
+                ParticlePour(arguments.particles, seed=arguments.seed + machine_index)
+                if arguments.particles > 0
+                else None
+            ),
+        )
+        for machine_index in range(arguments.machines)
+    ]
+    scheduler = FrameScheduler(MAX_FPS)
+    timestep = FixedTimestep(SIMULATION_RATE)
+    # when each button was last pressed, to drop repeated presses
+    last_presses = {}
+    input_latency = InputLatency() if arguments.input_latency else None
+    recorder = None
+    if arguments.record:
+        recorder = ScreenRecorder(
+            arguments.record,
+            layout.size,
+            arguments.record_fps,
+            arguments.record_scale,
+        )
+
+    # only wrapped in timers when asked for so there is no cost otherwise
+    profiler = None
+    if arguments.hud or arguments.profile_trace:
+        profiler = FrameProfiler(keep_trace=arguments.profile_trace is not None)
+        profiler.instrument(
+            utilities,
+            {
+                "render_text": "render_text",
+                "draw_button": "draw_button",
+                "draw_machines": "draw_machine",
+            },
+        )
+        profiler.instrument(renderer, {"present": "display"})
 
-    state = "buttons"
     running = True
     while running:
 
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                running = False
-
-            elif event.type == pygame.MOUSEBUTTONDOWN:
-                if state == "buttons":
-                    position = pygame.mouse.get_pos()
-                    relative_position = (
-                        position[0] / screen.get_size()[0],
-                        position[1] / screen.get_size()[1],
-                    )
-                    button_index = utilities.get_drink_button_pressed(relative_position)
-                    if (
-                        button_index >= 0
-                        and button_index < len(DRINK_NAMES)
-                        and state == "buttons"
-                    ):
-                        utilities.drink = DRINK_NAMES[button_index]
-                        state = "brewing"
-
-        screen.fill(BACKGROUND_COLOUR)
+        brewing = any(machine.brewing for machine in machines)
+        # machines that have changed are drawn straight away, not after a wait
+        waiting_to_draw = any(machine.needs_redraw for machine in machines)
+        scheduler.set_active(brewing or waiting_to_draw)
+        events = scheduler.get_events()
+
+        # nothing changes on screen while idle unless something happened
+        if not events and scheduler.mode == "idle":
+            continue
+
+        if profiler is not None:
+            profiler.begin_frame()
+
+        # dragging the window edge sends many resizes at once
+        # so the layout is only worked out for where it ended up
+        if any(event.type in RESIZE_EVENTS for event in events):
+            static_layer = None
+            layout = utilities.get_layout(renderer.get_size())
+            if utilities.sprite_baker is not None:
+                utilities.bake_sprites(layout.size)
+
+        if any(event.type == pygame.QUIT for event in events):
+            running = False
+
+        for button_index in get_button_presses(
+            events,
+            layout.hit_index,
+            last_presses,
+            scheduler.events_time,
+            PRESS_REPEAT_SECONDS,
+        ):
+            # orders go to the machine with the shortest queue
+            machine = min(machines, key=lambda machine: len(machine.pipeline))
+            if not machine.full and button_index < len(DRINK_NAMES):
+                # time spent idle is not simulated
+                if not brewing:
+                    timestep.reset()
+                    brewing = True
+                machine.order_drink(DRINK_NAMES[button_index])
+                if input_latency is not None:
+                    input_latency.press(scheduler.events_time)
+
+        # orders from the API are taken here, once per frame,
+        # the event it posts only wakes the loop
+        if order_server is not None:
+            order_server.handle_requests(partial(handle_api_request, machines=machines))
+            if not brewing and any(machine.brewing for machine in machines):
+                timestep.reset()
+
+        # an exposed window is drawn and shown whole, as only showing
+        # the changed rects would leave the rest stale
+        full_redraw = static_layer is None or any(
+            event.type in EXPOSE_EVENTS for event in events
+        )
+        if static_layer is None:
+            static_layer = utilities.build_static_layer(
+                layout.size, BACKGROUND_COLOUR, DRINK_NAMES
+            )
+            renderer.set_static_layer(static_layer)
 
-        index = 0
-        for drink_name in DRINK_NAMES:
-            utilities.draw_button(index, screen, drink_name)
-            index += 1
-        while index < utilities.BUTTON_ROWS * utilities.BUTTONS_PER_ROW:
-            utilities.draw_button(index, screen)
-            index += 1
+        for _ in range(timestep.get_steps()):
+            for machine in machines:
+                machine.update_drink(timestep.step)
 
-        brewing_finished = utilities.draw_machine(screen)
-        if brewing_finished:
-            state = "buttons"
-            utilities.drink = ""
+        draw_start = perf_counter()
+        dirty_rects = utilities.draw_machines(
+            renderer, machines, timestep.interpolation, full_redraw
+        )
 
-        pygame.display.flip()
-        clock.tick(MAX_FPS)
+        if arguments.hud:
+            dirty_rects.extend(profiler.draw_hud(renderer))
+
+        display_start = perf_counter()
+        if recorder is not None:
+            renderer.read_frames = recorder.capture_due
+        renderer.present(None if full_redraw else dirty_rects)
+        if input_latency is not None:
+            input_latency.presented()
+        if recorder is not None:
+            recorder.capture(renderer.get_frame())
+        if drink_metrics is not None:
+            drink_metrics.record_frame(
+                machines,
+                scheduler.events_time,
+                draw_start,
+                display_start,
+                perf_counter(),
+            )
+
+        if profiler is not None:
+            profiler.end_frame()
+
+    if profiler is not None:
+        print("\n".join(profiler.get_summary_lines()))
+        # busy is the time not spent waiting for the next frame or an event
+        print(
+            "time "
+            + " ".join(
+                f"{mode} {fraction:.1%}"
+                for mode, fraction in scheduler.get_duty_cycle().items()
+            )
+        )
+        if arguments.profile_trace:
+            profiler.save_trace(arguments.profile_trace)
+    if input_latency is not None:
+        print("\n".join(input_latency.get_summary_lines()))
+    if recorder is not None:
+        recorder.close()
+        print(recorder.get_summary())
+
+    if order_server is not None:
+        order_server.close()
+    if metrics_registry is not None:
+        metrics_registry.close()
+    if utilities.sprite_baker is not None:
+        utilities.sprite_baker.close()
+    close_order_log(order_log)
 
 
 if __name__ == "__main__":